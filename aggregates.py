@@ -0,0 +1,203 @@
+"""
+Materialized per-category and per price_range/stock_status aggregates,
+and the denormalized fact_books_wide projection.
+
+The views are created with the analytical tables and refreshed with
+REFRESH MATERIALIZED VIEW CONCURRENTLY at the end of every load, so the
+summary analyses read a few precomputed rows instead of joining the
+whole snowflake. The wide projection is rebuilt in the same step, either
+entirely or only for the books a load touched.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import Float, Integer, String, column, delete, func, insert, select, table, text
+from sqlalchemy.dialects import postgresql
+
+from models_analytical import (
+    FactBook, FactBookWide, DimCategory, DimStock, DimScore, DimPrice, DimTax,
+    WIDE_PROJECTION_PARTITION_KEY, WIDE_PROJECTION_PARTITIONS
+)
+
+
+def _measure_columns():
+    return (
+        column("book_count", Integer),
+        column("min_price", Float),
+        column("max_price", Float),
+        column("avg_price", Float),
+        column("total_stock", Integer),
+        column("potential_revenue", Float),
+    )
+
+
+category_summary = table(
+    "agg_category_summary",
+    column("category_id", Integer),
+    column("category_name", String),
+    *_measure_columns(),
+)
+
+price_stock_summary = table(
+    "agg_price_stock_summary",
+    column("price_range", String),
+    column("stock_status", String),
+    *_measure_columns(),
+)
+
+
+def _measures(price, quantity):
+    return (
+        func.min(price).label("min_price"),
+        func.max(price).label("max_price"),
+        func.avg(price).label("avg_price"),
+        func.coalesce(func.sum(quantity), 0).label("total_stock"),
+        func.coalesce(func.sum(price * quantity), 0).label("potential_revenue"),
+    )
+
+
+def _category_summary_query():
+    facts = (
+        select(
+            FactBook.id,
+            FactBook.category_id,
+            DimPrice.price_before_tax.label("price"),
+            DimStock.quantity
+        )
+        .join(DimPrice, FactBook.price_id == DimPrice.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        .subquery("facts")
+    )
+    return (
+        select(
+            DimCategory.id.label("category_id"),
+            DimCategory.name.label("category_name"),
+            func.count(facts.c.id).label("book_count"),
+            *_measures(facts.c.price, facts.c.quantity)
+        )
+        .select_from(DimCategory)
+        .outerjoin(facts, facts.c.category_id == DimCategory.id)
+        .group_by(DimCategory.id, DimCategory.name)
+    )
+
+
+def _price_stock_summary_query():
+    stock_status = func.coalesce(DimStock.stock_status, "Unknown")
+    return (
+        select(
+            DimPrice.price_range.label("price_range"),
+            stock_status.label("stock_status"),
+            func.count(FactBook.id).label("book_count"),
+            *_measures(DimPrice.price_before_tax, DimStock.quantity)
+        )
+        .join(DimPrice, FactBook.price_id == DimPrice.id)
+        .join(DimCategory, FactBook.category_id == DimCategory.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        .group_by(DimPrice.price_range, stock_status)
+    )
+
+
+# View name -> (defining query, unique key needed by REFRESH ... CONCURRENTLY)
+AGGREGATES = {
+    category_summary.name: (_category_summary_query, ("category_id",)),
+    price_stock_summary.name: (_price_stock_summary_query, ("price_range", "stock_status")),
+}
+
+
+def create_aggregates(conn):
+    """Create the materialized views and their unique indexes if missing"""
+    for name, (query, key) in AGGREGATES.items():
+        definition = query().compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={"literal_binds": True}
+        )
+        conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {definition}"))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(key)})"
+        ))
+
+
+def drop_aggregates(conn):
+    """Drop the materialized views, which depend on the analytical tables"""
+    for name in AGGREGATES:
+        conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {name}"))
+
+
+def _wide_rows_query():
+    return (
+        select(
+            FactBook.category_id,
+            FactBook.id,
+            FactBook.upc,
+            FactBook.title,
+            DimCategory.name,
+            DimPrice.price_before_tax,
+            DimPrice.price_after_tax,
+            DimPrice.price_range,
+            DimTax.tax_rate,
+            DimStock.quantity,
+            DimStock.stock_status,
+            DimScore.score,
+        )
+        .outerjoin(DimCategory, FactBook.category_id == DimCategory.id)
+        .join(DimPrice, FactBook.price_id == DimPrice.id)
+        .outerjoin(DimTax, DimPrice.tax_id == DimTax.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        .outerjoin(DimScore, FactBook.score_id == DimScore.id)
+    )
+
+
+def refresh_wide_projection(conn, upcs: Optional[Iterable[str]] = None):
+    """
+    Rebuild fact_books_wide from the snowflake, or only the rows of the given
+    books. DELETE + INSERT in the caller's transaction, so readers keep
+    seeing the previous rows until it commits.
+    """
+    wide = FactBookWide.__table__
+    rows = _wide_rows_query()
+    clear = delete(wide)
+    if upcs is not None:
+        upcs = list(upcs)
+        if not upcs:
+            return
+        rows = rows.where(FactBook.upc.in_(upcs))
+        clear = clear.where(wide.c.upc.in_(upcs))
+    conn.execute(clear)
+    conn.execute(insert(wide).from_select([
+        "category_id", "book_id", "upc", "title", "category_name",
+        "price_before_tax", "price_after_tax", "price_range", "tax_rate",
+        "stock_quantity", "stock_status", "score",
+    ], rows))
+
+
+def ensure_wide_projection(conn) -> bool:
+    """
+    Create fact_books_wide if it does not exist. A table with another layout
+    (from before books without a category were kept, or partitioned other
+    than WIDE_PROJECTION_PARTITIONS asks) is dropped and created again.
+    Returns True when the table is new and has to be rebuilt in full.
+    """
+    existing = conn.execute(text(
+        "SELECT attnotnull, pg_get_partkeydef(attrelid) FROM pg_attribute "
+        "WHERE attrelid = to_regclass('fact_books_wide') AND attname = 'category_id'"
+    )).first()
+    if existing is not None:
+        category_required, partition_key = existing
+        expected_key = WIDE_PROJECTION_PARTITION_KEY if WIDE_PROJECTION_PARTITIONS else None
+        if not category_required and partition_key == expected_key:
+            return False
+        FactBookWide.__table__.drop(conn)
+    FactBookWide.__table__.create(conn)
+    return True
+
+
+def refresh_aggregates(conn, upcs: Optional[Iterable[str]] = None):
+    """
+    Refresh the wide projection (only the given books, if any) and every
+    view without blocking readers
+    """
+    if ensure_wide_projection(conn):
+        upcs = None
+    refresh_wide_projection(conn, upcs)
+    create_aggregates(conn)
+    for name in AGGREGATES:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}"))
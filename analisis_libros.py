@@ -1,226 +1,133 @@
-from sqlmodel import Session, select, func
-from models_analytical import FactBook, DimCategory, DimStock, DimPrice
+import argparse
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlmodel import Session
+from cache_analisis import cacheado
+from consultas import CONSULTAS
 from etl import analytical_engine
-from typing import Dict, List, Tuple
+from instrumentation import profile_stage, profiled
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+@cacheado
+def ejecutar_consulta(nombre: str, *args):
+    """
+    Ejecuta una consulta de la capa de consultas en un solo viaje a la base
+    de datos. El resultado se cachea hasta la próxima carga del ETL.
+    """
+    consulta = CONSULTAS[nombre]
+    with Session(analytical_engine) as session:
+        filas = session.execute(consulta.sentencia(*args)).all()
+        return consulta.formatear(filas)
+
+
+async def ejecutar_consulta_async(nombre: str, *args, engine=None):
+    """
+    La misma consulta sobre el engine asyncpg, sin caché (el servicio HTTP
+    tiene la suya). Muchas corrutinas comparten el pool del engine.
+    """
+    from database_async import analytical_async_engine
+
+    consulta = CONSULTAS[nombre]
+    async with (engine or analytical_async_engine).connect() as conn:
+        filas = (await conn.execute(consulta.sentencia(*args))).all()
+    return consulta.formatear(filas)
 
 
 def contar_categorias() -> int:
     """a. ¿Cuántas categorías de libros se tienen?"""
-    with Session(analytical_engine) as session:
-        count = session.exec(
-            select(func.count(DimCategory.id))
-        ).first()
-        return count
+    return ejecutar_consulta("contar_categorias")
 
 
 def libros_por_categoria() -> Dict[str, int]:
     """b. ¿Cuántos libros hay por categoría?"""
-    with Session(analytical_engine) as session:
-        results = session.exec(
-            select(DimCategory.name, func.count(FactBook.id))
-            .join(FactBook, FactBook.category_id == DimCategory.id)
-            .group_by(DimCategory.name)
-            .order_by(DimCategory.name)
-        ).all()
-        return {categoria: cantidad for categoria, cantidad in results}
+    return ejecutar_consulta("libros_por_categoria")
 
 
 def libro_mas_caro() -> Dict:
     """c. ¿Cuál es el libro más caro?"""
-    with Session(analytical_engine) as session:
-        result = session.exec(
-            select(FactBook, DimPrice, DimCategory)
-            .join(DimPrice, FactBook.price_id == DimPrice.id)
-            .join(DimCategory, FactBook.category_id == DimCategory.id)
-            .order_by(DimPrice.price_before_tax.desc())
-            .limit(1)
-        ).first()
-        
-        if result:
-            book, price, category = result
-            return {
-                "titulo": book.title,
-                "precio": price.price_before_tax,
-                "categoria": category.name,
-                "upc": book.upc
-            }
-        return None
+    return ejecutar_consulta("libro_mas_caro")
 
 
 def libros_en_multiples_categorias() -> List[Dict]:
     """d. ¿Hay algún libro que esté en dos categorías?"""
-    with Session(analytical_engine) as session:
-        # Buscar libros con el mismo título en diferentes categorías
-        subquery = (
-            select(FactBook.title, func.count(func.distinct(FactBook.category_id)).label("num_categorias"))
-            .group_by(FactBook.title)
-            .having(func.count(func.distinct(FactBook.category_id)) > 1)
-            .subquery()
-        )
-        
-        results = session.exec(
-            select(FactBook, DimCategory)
-            .join(DimCategory, FactBook.category_id == DimCategory.id)
-            .join(subquery, FactBook.title == subquery.c.title)
-            .order_by(FactBook.title, DimCategory.name)
-        ).all()
-        
-        # Agrupar por título
-        libros_duplicados = {}
-        for book, category in results:
-            if book.title not in libros_duplicados:
-                libros_duplicados[book.title] = []
-            libros_duplicados[book.title].append(category.name)
-        
-        return [{"titulo": titulo, "categorias": categorias} 
-                for titulo, categorias in libros_duplicados.items()]
+    return ejecutar_consulta("libros_en_multiples_categorias")
 
 
 def libro_mas_barato_por_categoria() -> Dict[str, List[Dict]]:
     """e. ¿Cuál es el libro más barato por categoría? Si es más de uno, se deben mostrar."""
-    with Session(analytical_engine) as session:
-        # Primero obtener el precio mínimo por categoría
-        min_prices = session.exec(
-            select(DimCategory.id, func.min(DimPrice.price_before_tax).label("min_price"))
-            .join(FactBook, FactBook.category_id == DimCategory.id)
-            .join(DimPrice, FactBook.price_id == DimPrice.id)
-            .group_by(DimCategory.id)
-        ).all()
-        
-        resultado = {}
-        for cat_id, min_price in min_prices:
-            # Obtener todos los libros con ese precio mínimo en esa categoría
-            books = session.exec(
-                select(FactBook, DimCategory, DimPrice)
-                .join(DimCategory, FactBook.category_id == DimCategory.id)
-                .join(DimPrice, FactBook.price_id == DimPrice.id)
-                .where(DimCategory.id == cat_id)
-                .where(DimPrice.price_before_tax == min_price)
-            ).all()
-            
-            for book, category, price in books:
-                if category.name not in resultado:
-                    resultado[category.name] = []
-                resultado[category.name].append({
-                    "titulo": book.title,
-                    "precio": price.price_before_tax,
-                    "upc": book.upc
-                })
-        
-        return resultado
+    return ejecutar_consulta("libro_mas_barato_por_categoria")
 
 
 def diferencia_vs_promedio_categoria() -> List[Dict]:
     """f. ¿Cuánto más caro o barato es cada libro respecto al promedio de su categoría?"""
-    with Session(analytical_engine) as session:
-        # Calcular promedio por categoría
-        avg_prices = session.exec(
-            select(DimCategory.id, func.avg(DimPrice.price_before_tax).label("avg_price"))
-            .join(FactBook, FactBook.category_id == DimCategory.id)
-            .join(DimPrice, FactBook.price_id == DimPrice.id)
-            .group_by(DimCategory.id)
-        ).all()
-        
-        avg_dict = {cat_id: float(avg_price) for cat_id, avg_price in avg_prices}
-        
-        # Obtener todos los libros con sus precios
-        books = session.exec(
-            select(FactBook, DimCategory, DimPrice)
-            .join(DimCategory, FactBook.category_id == DimCategory.id)
-            .join(DimPrice, FactBook.price_id == DimPrice.id)
-            .order_by(DimCategory.name, FactBook.title)
-        ).all()
-        
-        resultado = []
-        for book, category, price in books:
-            avg_price = avg_dict.get(category.id, 0)
-            diferencia = price.price_before_tax - avg_price
-            porcentaje = (diferencia / avg_price * 100) if avg_price > 0 else 0
-            
-            resultado.append({
-                "titulo": book.title,
-                "categoria": category.name,
-                "precio": price.price_before_tax,
-                "promedio_categoria": round(avg_price, 2),
-                "diferencia": round(diferencia, 2),
-                "porcentaje_diferencia": round(porcentaje, 2),
-                "estado": "más caro" if diferencia > 0 else "más barato" if diferencia < 0 else "igual"
-            })
-        
-        return resultado
+    return ejecutar_consulta("diferencia_vs_promedio_categoria")
+
+
+def ranking_diferencias(k: int = 5, direccion: str = "baratos",
+                        categorias: Optional[Sequence[str]] = None) -> List[Dict]:
+    """
+    Los k libros más baratos (o más caros) respecto al promedio de su
+    categoría, opcionalmente solo de algunas categorías. El orden y el límite
+    se resuelven en la base de datos, así que solo viajan k filas.
+    """
+    return ejecutar_consulta(
+        "ranking_diferencias", k, direccion, tuple(sorted(categorias)) if categorias else None
+    )
+
+
+def extremos_vs_promedio_categoria(k: int = 5) -> Dict[str, List[Dict]]:
+    """Los k libros más baratos y los k más caros respecto al promedio de su categoría"""
+    return {direccion: ranking_diferencias(k, direccion) for direccion in ("baratos", "caros")}
+
+
+async def extremos_vs_promedio_categoria_async(k: int = 5, engine=None) -> Dict[str, List[Dict]]:
+    """extremos_vs_promedio_categoria con las dos consultas a la vez"""
+    baratos, caros = await asyncio.gather(*(
+        ejecutar_consulta_async("ranking_diferencias", k, direccion, None, engine=engine)
+        for direccion in ("baratos", "caros")
+    ))
+    return {"baratos": baratos, "caros": caros}
 
 
 def libro_mayor_ingreso_por_categoria() -> Dict[str, Dict]:
     """g. Asumiendo que se venden todos los libros que están en stock en este momento
     ¿Cuál es el libro que daría más ingresos por categoría?"""
-    with Session(analytical_engine) as session:
-        # Calcular ingresos potenciales (precio * stock)
-        results = session.exec(
-            select(
-                FactBook,
-                DimCategory,
-                DimPrice,
-                DimStock,
-                (DimPrice.price_before_tax * DimStock.quantity).label("ingreso_potencial")
-            )
-            .join(DimCategory, FactBook.category_id == DimCategory.id)
-            .join(DimPrice, FactBook.price_id == DimPrice.id)
-            .join(DimStock, FactBook.stock_id == DimStock.id)
-            .order_by(DimCategory.name, (DimPrice.price_before_tax * DimStock.quantity).desc())
-        ).all()
-        
-        # Agrupar por categoría y obtener el de mayor ingreso
-        resultado = {}
-        categorias_vistas = set()
-        
-        for book, category, price, stock, ingreso in results:
-            if category.name not in categorias_vistas:
-                resultado[category.name] = {
-                    "titulo": book.title,
-                    "precio": price.price_before_tax,
-                    "stock": stock.quantity,
-                    "ingreso_potencial": round(ingreso, 2),
-                    "upc": book.upc
-                }
-                categorias_vistas.add(category.name)
-        
-        return resultado
-
-
-def ejecutar_analisis():
-    """Ejecuta todos los análisis y muestra los resultados"""
-    print("=" * 80)
-    print("ANÁLISIS DE LA BASE DE DATOS DE LIBROS")
-    print("=" * 80)
-    
-    # a. Contar categorías
-    print("\na. ¿Cuántas categorías de libros se tienen?")
-    print("-" * 40)
-    num_categorias = contar_categorias()
+    return ejecutar_consulta("libro_mayor_ingreso_por_categoria")
+
+
+def resumen_por_categoria() -> Dict[str, Dict]:
+    """Libros, precios mínimo/máximo/promedio, stock e ingreso potencial por categoría"""
+    return ejecutar_consulta("resumen_por_categoria")
+
+
+def resumen_por_rango_y_stock() -> List[Dict]:
+    """Las mismas medidas por rango de precio y estado de stock"""
+    return ejecutar_consulta("resumen_por_rango_y_stock")
+
+
+def _imprimir_contar_categorias(num_categorias):
     print(f"Total de categorías: {num_categorias}")
-    
-    # b. Libros por categoría
-    print("\nb. ¿Cuántos libros hay por categoría?")
-    print("-" * 40)
-    libros_categoria = libros_por_categoria()
+
+
+def _imprimir_libros_por_categoria(libros_categoria):
     for categoria, cantidad in libros_categoria.items():
         print(f"{categoria}: {cantidad} libros")
     print(f"Total de libros: {sum(libros_categoria.values())}")
-    
-    # c. Libro más caro
-    print("\nc. ¿Cuál es el libro más caro?")
-    print("-" * 40)
-    mas_caro = libro_mas_caro()
+
+
+def _imprimir_libro_mas_caro(mas_caro):
     if mas_caro:
         print(f"Título: {mas_caro['titulo']}")
         print(f"Precio: ${mas_caro['precio']:.2f}")
         print(f"Categoría: {mas_caro['categoria']}")
         print(f"UPC: {mas_caro['upc']}")
-    
-    # d. Libros en múltiples categorías
-    print("\nd. ¿Hay algún libro que esté en dos categorías?")
-    print("-" * 40)
-    duplicados = libros_en_multiples_categorias()
+
+
+def _imprimir_libros_en_multiples_categorias(duplicados):
     if duplicados:
         for libro in duplicados:
             print(f"Título: {libro['titulo']}")
@@ -228,50 +135,160 @@ def ejecutar_analisis():
             print()
     else:
         print("No hay libros que estén en múltiples categorías")
-    
-    # e. Libro más barato por categoría
-    print("\ne. ¿Cuál es el libro más barato por categoría?")
-    print("-" * 40)
-    mas_baratos = libro_mas_barato_por_categoria()
+
+
+def _imprimir_libro_mas_barato_por_categoria(mas_baratos):
     for categoria, libros in sorted(mas_baratos.items()):
         print(f"\n{categoria}:")
         for libro in libros:
             print(f"  - {libro['titulo']} (${libro['precio']:.2f})")
-    
-    # f. Diferencia vs promedio
-    print("\nf. ¿Cuánto más caro o barato es cada libro respecto al promedio de su categoría?")
-    print("-" * 40)
-    diferencias = diferencia_vs_promedio_categoria()
-    
-    # Mostrar solo los 5 más caros y 5 más baratos respecto al promedio
-    diferencias_ordenadas = sorted(diferencias, key=lambda x: x['diferencia'])
-    
-    print("\n5 Libros más baratos respecto al promedio de su categoría:")
-    for libro in diferencias_ordenadas[:5]:
+
+
+def _imprimir_diferencia_vs_promedio(extremos):
+    print(f"\n{len(extremos['baratos'])} Libros más baratos respecto al promedio de su categoría:")
+    for libro in extremos["baratos"]:
         print(f"  {libro['titulo'][:50]}")
         print(f"    Categoría: {libro['categoria']}")
         print(f"    Precio: ${libro['precio']:.2f} | Promedio: ${libro['promedio_categoria']:.2f}")
         print(f"    Diferencia: ${libro['diferencia']:.2f} ({libro['porcentaje_diferencia']:.1f}%)")
         print()
     
-    print("\n5 Libros más caros respecto al promedio de su categoría:")
-    for libro in diferencias_ordenadas[-5:]:
+    print(f"\n{len(extremos['caros'])} Libros más caros respecto al promedio de su categoría:")
+    # De menor a mayor diferencia, como en la lista completa ordenada
+    for libro in reversed(extremos["caros"]):
         print(f"  {libro['titulo'][:50]}")
         print(f"    Categoría: {libro['categoria']}")
         print(f"    Precio: ${libro['precio']:.2f} | Promedio: ${libro['promedio_categoria']:.2f}")
         print(f"    Diferencia: ${libro['diferencia']:.2f} ({libro['porcentaje_diferencia']:.1f}%)")
         print()
-    
-    # g. Mayor ingreso por categoría
-    print("\ng. ¿Cuál es el libro que daría más ingresos por categoría?")
-    print("-" * 40)
-    mayores_ingresos = libro_mayor_ingreso_por_categoria()
+
+
+def _imprimir_libro_mayor_ingreso_por_categoria(mayores_ingresos):
     for categoria, libro in sorted(mayores_ingresos.items()):
         print(f"\n{categoria}:")
         print(f"  Título: {libro['titulo'][:50]}")
         print(f"  Precio: ${libro['precio']:.2f}")
         print(f"  Stock: {libro['stock']} unidades")
         print(f"  Ingreso potencial: ${libro['ingreso_potencial']:.2f}")
+
+
+class Analisis(NamedTuple):
+    letra: str
+    pregunta: str
+    calcular: Callable
+    imprimir: Callable
+
+
+# Análisis independientes entre sí, en el orden en que se muestran
+ANALISIS = [
+    Analisis("a", "¿Cuántas categorías de libros se tienen?",
+             contar_categorias, _imprimir_contar_categorias),
+    Analisis("b", "¿Cuántos libros hay por categoría?",
+             libros_por_categoria, _imprimir_libros_por_categoria),
+    Analisis("c", "¿Cuál es el libro más caro?",
+             libro_mas_caro, _imprimir_libro_mas_caro),
+    Analisis("d", "¿Hay algún libro que esté en dos categorías?",
+             libros_en_multiples_categorias, _imprimir_libros_en_multiples_categorias),
+    Analisis("e", "¿Cuál es el libro más barato por categoría?",
+             libro_mas_barato_por_categoria, _imprimir_libro_mas_barato_por_categoria),
+    Analisis("f", "¿Cuánto más caro o barato es cada libro respecto al promedio de su categoría?",
+             extremos_vs_promedio_categoria, _imprimir_diferencia_vs_promedio),
+    Analisis("g", "¿Cuál es el libro que daría más ingresos por categoría?",
+             libro_mayor_ingreso_por_categoria, _imprimir_libro_mayor_ingreso_por_categoria),
+]
+
+# Los mismos análisis sobre asyncpg: {letra: función async que recibe engine=}
+ANALISIS_ASYNC: Dict[str, Callable[..., Awaitable]] = {
+    "a": functools.partial(ejecutar_consulta_async, "contar_categorias"),
+    "b": functools.partial(ejecutar_consulta_async, "libros_por_categoria"),
+    "c": functools.partial(ejecutar_consulta_async, "libro_mas_caro"),
+    "d": functools.partial(ejecutar_consulta_async, "libros_en_multiples_categorias"),
+    "e": functools.partial(ejecutar_consulta_async, "libro_mas_barato_por_categoria"),
+    "f": extremos_vs_promedio_categoria_async,
+    "g": functools.partial(ejecutar_consulta_async, "libro_mayor_ingreso_por_categoria"),
+}
+
+# Conexiones simultáneas que puede usar el modo concurrente
+MAX_CONEXIONES = int(os.getenv("ANALISIS_MAX_CONEXIONES", "4"))
+
+
+def _medir(analisis: Analisis) -> Tuple[object, float]:
+    inicio = time.perf_counter()
+    with profile_stage(f"{analisis.letra}. {analisis.calcular.__name__}"):
+        resultado = analisis.calcular()
+    return resultado, time.perf_counter() - inicio
+
+
+def calcular_analisis(concurrente: bool = False,
+                      max_conexiones: int = MAX_CONEXIONES) -> Dict[str, Tuple[object, float]]:
+    """
+    Calcula todos los análisis y devuelve {letra: (resultado, segundos)} en el
+    orden original. En modo concurrente se ejecutan en un pool de hilos con
+    como máximo max_conexiones consultas abiertas a la vez.
+    """
+    if not concurrente or max_conexiones <= 1:
+        return {analisis.letra: _medir(analisis) for analisis in ANALISIS}
+
+    with ThreadPoolExecutor(max_workers=max_conexiones) as pool:
+        futuros = {analisis.letra: pool.submit(_medir, analisis) for analisis in ANALISIS}
+        return {letra: futuro.result() for letra, futuro in futuros.items()}
+
+
+async def _medir_async(letra: str, engine) -> Tuple[object, float]:
+    inicio = time.perf_counter()
+    resultado = await ANALISIS_ASYNC[letra](engine=engine)
+    return resultado, time.perf_counter() - inicio
+
+
+async def calcular_analisis_async(engine=None) -> Dict[str, Tuple[object, float]]:
+    """
+    Igual que calcular_analisis, con todos los análisis a la vez en el event
+    loop actual sobre el pool del engine asyncpg
+    """
+    letras = [analisis.letra for analisis in ANALISIS]
+    resultados = await asyncio.gather(*(_medir_async(letra, engine) for letra in letras))
+    return dict(zip(letras, resultados))
+
+
+async def _calcular_y_cerrar() -> Dict[str, Tuple[object, float]]:
+    from database_async import dispose_async_engines
+
+    try:
+        return await calcular_analisis_async()
+    finally:
+        await dispose_async_engines()
+
+
+def ejecutar_analisis(concurrente: bool = False, max_conexiones: int = MAX_CONEXIONES,
+                      asincrono: bool = False):
+    """Ejecuta todos los análisis y muestra los resultados"""
+    inicio = time.perf_counter()
+    if asincrono:
+        resultados = asyncio.run(_calcular_y_cerrar())
+    else:
+        resultados = calcular_analisis(concurrente, max_conexiones)
+    total = time.perf_counter() - inicio
+
+    print("=" * 80)
+    print("ANÁLISIS DE LA BASE DE DATOS DE LIBROS")
+    print("=" * 80)
+    
+    for analisis in ANALISIS:
+        print(f"\n{analisis.letra}. {analisis.pregunta}")
+        print("-" * 40)
+        resultado, _ = resultados[analisis.letra]
+        analisis.imprimir(resultado)
+    
+    print("\nTiempo por consulta:")
+    print("-" * 40)
+    for analisis in ANALISIS:
+        _, segundos = resultados[analisis.letra]
+        print(f"{analisis.letra}. {segundos * 1000:.1f} ms")
+    if asincrono:
+        modo = "asíncrono"
+    else:
+        modo = f"concurrente, {max_conexiones} conexiones" if concurrente else "secuencial"
+    print(f"Total ({modo}): {total * 1000:.1f} ms")
     
     print("\n" + "=" * 80)
     print("FIN DEL ANÁLISIS")
@@ -279,8 +296,20 @@ def ejecutar_analisis():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Análisis de la base de datos de libros")
+    parser.add_argument("--concurrente", action="store_true",
+                        help="Ejecutar los análisis a la vez en un pool de hilos")
+    parser.add_argument("--conexiones", type=int, default=MAX_CONEXIONES,
+                        help="Máximo de conexiones simultáneas en modo concurrente")
+    parser.add_argument("--asincrono", action="store_true",
+                        help="Ejecutar los análisis a la vez con asyncpg en un solo event loop")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada análisis y contar las consultas SQL por análisis")
+    args = parser.parse_args()
+
     try:
-        ejecutar_analisis()
+        with profiled("analisis_libros", args.profile):
+            ejecutar_analisis(args.concurrente, args.conexiones, args.asincrono)
     except Exception as e:
         print(f"Error al ejecutar el análisis: {e}")
         print("\nAsegúrate de que:")
@@ -0,0 +1,145 @@
+"""
+Benchmark del motor columnar frente a las consultas SQL.
+
+Para cada tamaño genera los libros sintéticos de datos_sinteticos.py, mide
+los siete análisis contra PostgreSQL (sin caché) y contra MotorColumnar
+(carga y consultas por separado) y comprueba que ambos den lo mismo. Al
+terminar borra los libros sintéticos. El resultado se imprime en JSON.
+
+Uso:
+  python benchmark_columnar.py
+  python benchmark_columnar.py --tamanos 10000 100000 --repeticiones 5 --salida bench.json
+"""
+import argparse
+import json
+import math
+import statistics
+import time
+from typing import Dict, List
+
+from analisis_libros import ejecutar_consulta
+from datos_sinteticos import generar_hechos, limpiar_hechos
+from motor_columnar import MotorColumnar
+
+
+ANALISIS = [
+    "contar_categorias",
+    "libros_por_categoria",
+    "libro_mas_caro",
+    "libros_en_multiples_categorias",
+    "libro_mas_barato_por_categoria",
+    "diferencia_vs_promedio_categoria",
+    "libro_mayor_ingreso_por_categoria",
+]
+
+TAMANOS = [10_000, 100_000, 1_000_000]
+
+
+def _medir(funcion, repeticiones: int):
+    """Mediana en segundos de varias ejecuciones y el último resultado"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def _clave_orden(valor):
+    """Clave para ordenar listas sin depender de diferencias menores a un centavo"""
+    if isinstance(valor, dict):
+        return repr({clave: _clave_orden(v) for clave, v in valor.items()})
+    if isinstance(valor, list):
+        return repr(sorted(_clave_orden(v) for v in valor))
+    if isinstance(valor, float):
+        return repr(round(valor, 2))
+    return repr(valor)
+
+
+def coinciden(a, b) -> bool:
+    """
+    Igualdad que ignora el orden de las listas. Los números pueden diferir
+    como mucho en un centavo: los análisis redondean a dos decimales y una
+    suma en otro orden puede cambiar el último redondeo.
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(coinciden(a[clave], b[clave]) for clave in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(
+            coinciden(x, y)
+            for x, y in zip(sorted(a, key=_clave_orden), sorted(b, key=_clave_orden))
+        )
+    if isinstance(a, float) or isinstance(b, float):
+        return (
+            isinstance(a, (int, float)) and isinstance(b, (int, float))
+            and math.isclose(a, b, rel_tol=1e-9, abs_tol=0.01 + 1e-9)
+        )
+    return a == b
+
+
+def medir_tamano(repeticiones: int) -> Dict:
+    # Sin caché: se llama a la función envuelta por @cacheado
+    consulta_sql = ejecutar_consulta.__wrapped__
+
+    carga, motor = _medir(MotorColumnar.cargar, 1)
+    resultados = {"hechos": len(motor), "carga_columnar_s": carga,
+                  "memoria_columnar_bytes": motor.memoria_bytes(), "analisis": {}}
+
+    for nombre in ANALISIS:
+        segundos_sql, resultado_sql = _medir(lambda: consulta_sql(nombre), repeticiones)
+        segundos_col, resultado_col = _medir(getattr(motor, nombre), repeticiones)
+        resultados["analisis"][nombre] = {
+            "sql_s": segundos_sql,
+            "columnar_s": segundos_col,
+            "aceleracion": segundos_sql / segundos_col if segundos_col else None,
+            "coincide": coinciden(resultado_sql, resultado_col),
+        }
+
+    total_sql = sum(a["sql_s"] for a in resultados["analisis"].values())
+    total_col = sum(a["columnar_s"] for a in resultados["analisis"].values())
+    resultados.update(
+        total_sql_s=total_sql,
+        total_columnar_s=total_col,
+        # Número de rondas de los siete análisis a partir de las cuales la carga se amortiza
+        rondas_para_amortizar=(carga / (total_sql - total_col)) if total_sql > total_col else None,
+    )
+    return resultados
+
+
+def ejecutar_benchmark(tamanos: List[int], repeticiones: int) -> List[Dict]:
+    resultados = []
+    try:
+        for tamano in tamanos:
+            limpiar_hechos()
+            inicio = time.perf_counter()
+            generar_hechos(tamano)
+            print(f"{tamano} libros sintéticos generados en {time.perf_counter() - inicio:.1f}s")
+            resultado = medir_tamano(repeticiones)
+            resultado["libros_sinteticos"] = tamano
+            print(
+                f"  SQL {resultado['total_sql_s']:.3f}s | columnar {resultado['total_columnar_s']:.3f}s "
+                f"(+ carga {resultado['carga_columnar_s']:.3f}s)"
+            )
+            resultados.append(resultado)
+    finally:
+        limpiar_hechos()
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del motor columnar frente a SQL")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS,
+                        help="Números de libros sintéticos a medir")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Ejecuciones por análisis (se reporta la mediana)")
+    parser.add_argument("--salida", help="Archivo donde guardar el JSON")
+    args = parser.parse_args()
+
+    resultados = ejecutar_benchmark(args.tamanos, args.repeticiones)
+    salida = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(salida)
+        print(f"Resultados guardados en {args.salida}")
+    else:
+        print(salida)
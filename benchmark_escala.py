@@ -0,0 +1,167 @@
+"""
+Benchmark por factor de escala del flujo completo.
+
+Para cada tamaño genera el catálogo sintético de catalogo_sintetico.py en
+la base transaccional y mide:
+  - las escrituras del scraper sobre una muestra de libros nuevos:
+    save_book_information libro a libro, como lo llama scrape_queue, y
+    save_book_batch por lotes, como lo llama perform_scraping,
+  - transfer_data_to_analytical (con sus métricas por etapa),
+  - cada consulta de análisis de analisis_libros, sin caché.
+Al terminar borra el catálogo sintético de ambas bases. El resultado es un
+JSON con el entorno de la ejecución, para poder comparar corridas.
+
+Uso:
+  python benchmark_escala.py
+  python benchmark_escala.py --tamanos 1000 10000 --escrituras 200 --salida escala.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from analisis_libros import ejecutar_consulta
+from catalogo_sintetico import PREFIJO_CATEGORIA, PREFIJO_UPC, generar_catalogo, limpiar_catalogo
+from consultas import CONSULTAS
+from crud import save_book_batch, save_book_information
+from database import engine as transactional_engine
+from etl import analytical_engine, transfer_data_to_analytical
+from instrumentation import QueryCounter
+from scraped_books import SAVE_BATCH_SIZE, ScrapedBook, ScrapedBookBatch
+
+
+TAMANOS = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def _libro_scrapeado(n: int, serie: str = "E") -> ScrapedBook:
+    """Un libro como el que devuelve scraper.visit_book_page"""
+    return ScrapedBook(
+        upc=f"{PREFIJO_UPC}{serie}{n:011d}",
+        title=f"Libro escrito por el scraper {n}",
+        price=10 + n % 5000 / 100,
+        stock=1 + n % 22,
+        image_url=f"https://books.toscrape.com/media/cache/{n}.jpg",
+        description="Descripción del libro " * 20,
+        rating=1 + n % 5,
+    )
+
+
+def _escribir_libro_a_libro(num_libros: int, categoria: str):
+    for n in range(num_libros):
+        save_book_information(_libro_scrapeado(n), categoria)
+
+
+def _escribir_por_lotes(num_libros: int, categoria: str):
+    lote = ScrapedBookBatch()
+    for n in range(num_libros):
+        lote.append(_libro_scrapeado(n, "L"), categoria)
+        if len(lote) >= SAVE_BATCH_SIZE:
+            save_book_batch(lote)
+            lote.clear()
+    save_book_batch(lote)
+
+
+def medir_escrituras(num_libros: int, por_lotes: bool = False) -> Dict:
+    """Escribe num_libros libros nuevos por la misma vía que el scraper"""
+    categoria = f"{PREFIJO_CATEGORIA} 01"
+    escribir = _escribir_por_lotes if por_lotes else _escribir_libro_a_libro
+    with QueryCounter(transactional_engine) as consultas:
+        inicio = time.perf_counter()
+        escribir(num_libros, categoria)
+        segundos = time.perf_counter() - inicio
+    return {
+        "libros": num_libros,
+        "segundos": segundos,
+        "libros_por_segundo": num_libros / segundos if segundos else None,
+        "consultas": consultas.count,
+        "consultas_por_libro": consultas.count / num_libros if num_libros else None,
+    }
+
+
+def medir_analisis(repeticiones: int) -> Dict[str, Dict]:
+    """Mediana y máximo de cada consulta de análisis, sin pasar por la caché"""
+    consulta_sql = ejecutar_consulta.__wrapped__
+    resultados = {}
+    for nombre in CONSULTAS:
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            consulta_sql(nombre)
+            tiempos.append(time.perf_counter() - inicio)
+        resultados[nombre] = {"mediana_s": statistics.median(tiempos), "max_s": max(tiempos)}
+    return resultados
+
+
+def _entorno() -> Dict:
+    with analytical_engine.connect() as conn:
+        version_postgres = conn.execute(text("SHOW server_version")).scalar_one()
+    return {
+        "fecha": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "postgres": version_postgres,
+    }
+
+
+def medir_tamano(tamano: int, escrituras: int, repeticiones: int) -> Dict:
+    inicio = time.perf_counter()
+    generar_catalogo(tamano)
+    generacion = time.perf_counter() - inicio
+    print(f"{tamano} libros sintéticos generados en {generacion:.1f}s")
+
+    resultado = {"libros_sinteticos": tamano, "generacion_s": generacion,
+                 "escrituras_scraper": medir_escrituras(escrituras),
+                 "escrituras_scraper_lotes": medir_escrituras(escrituras, por_lotes=True)}
+    print(f"  scraper: {resultado['escrituras_scraper']['libros_por_segundo']:.0f} libros/s libro a libro, "
+          f"{resultado['escrituras_scraper_lotes']['libros_por_segundo']:.0f} libros/s por lotes")
+
+    inicio = time.perf_counter()
+    metricas = transfer_data_to_analytical()
+    resultado["etl"] = {"segundos": time.perf_counter() - inicio, "metricas": metricas}
+    print(f"  ETL: {resultado['etl']['segundos']:.1f}s")
+
+    resultado["analisis"] = medir_analisis(repeticiones)
+    total = sum(a["mediana_s"] for a in resultado["analisis"].values())
+    print(f"  análisis: {total:.3f}s")
+    return resultado
+
+
+def ejecutar_benchmark(tamanos: List[int], escrituras: int, repeticiones: int) -> Dict:
+    # El motor transaccional imprime cada sentencia (echo=True); aquí solo
+    # añadiría ruido y tiempo a las mediciones
+    transactional_engine.echo = False
+    resultados = {"entorno": _entorno(), "escrituras": escrituras,
+                  "repeticiones": repeticiones, "tamanos": []}
+    try:
+        for tamano in tamanos:
+            limpiar_catalogo()
+            resultados["tamanos"].append(medir_tamano(tamano, escrituras, repeticiones))
+    finally:
+        limpiar_catalogo()
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del scraper, el ETL y los análisis por escala")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS,
+                        help="Números de libros sintéticos a medir")
+    parser.add_argument("--escrituras", type=int, default=500,
+                        help="Libros escritos por la vía del scraper en cada tamaño")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Ejecuciones por análisis (se reporta la mediana)")
+    parser.add_argument("--salida", help="Archivo donde guardar el JSON")
+    args = parser.parse_args()
+
+    resultados = ejecutar_benchmark(args.tamanos, args.escrituras, args.repeticiones)
+    salida = json.dumps(resultados, indent=2, ensure_ascii=False, default=str)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(salida)
+        print(f"Resultados guardados en {args.salida}")
+    else:
+        print(salida)
@@ -0,0 +1,173 @@
+"""
+Blue-green rebuilds of the analytical snowflake.
+
+The live snowflake lives in ANALYTICAL_SCHEMA, and every analytical
+connection finds it through its search_path. A blue-green load builds a
+complete new snowflake in <schema>_shadow with the regular ETL, then
+analyzes it and publishes it by renaming schemas in one transaction: live
+becomes <schema>_previous and shadow becomes live.
+- Queries already running finish on the old tables.
+- New queries see the new tables.
+- Nobody sees a half-loaded state, and no reader waits on table locks.
+The previous version is kept until the next load, so rollback_analytical()
+swaps it back at once.
+
+etl_runs and the analytical_data_version sequence live in public, so they
+survive every swap. Loads into the live schema (the daemon's micro-batches
+among them) wait on the load lock while a blue-green load runs, and are
+applied to the new live schema once it is published.
+"""
+import os
+from sqlalchemy import text
+from sqlmodel import Session
+
+from etl import (
+    ANALYTICAL_SCHEMA, _run_etl, analytical_engine, analytical_engine_for,
+    bump_data_version, count_rows, create_analytical_tables, load_lock, record_etl_run
+)
+from database import engine as transactional_engine
+from instrumentation import EtlRunMetrics
+from models_analytical import FactBook
+
+
+SHADOW_SCHEMA = f"{ANALYTICAL_SCHEMA}_shadow"
+PREVIOUS_SCHEMA = f"{ANALYTICAL_SCHEMA}_previous"
+
+# How long the swap may wait for locks (queries still reading the previous
+# version) before giving up and leaving the live schema untouched
+SWAP_LOCK_TIMEOUT = os.getenv("BLUE_GREEN_LOCK_TIMEOUT", "5s")
+
+# How long a blue-green load or rollback waits for loads into the live
+# schema (the daemon's micro-batches, in-place loads) to finish
+LOAD_WAIT_TIMEOUT = os.getenv("BLUE_GREEN_WAIT_TIMEOUT", "30s")
+
+
+def _require_named_schema():
+    if ANALYTICAL_SCHEMA == "public":
+        raise ValueError(
+            "Blue-green loads rename the live schema; set ANALYTICAL_SCHEMA "
+            "to a schema other than public (for example ANALYTICAL_SCHEMA=analytics)"
+        )
+
+
+def schema_exists(conn, schema: str) -> bool:
+    return conn.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = :schema)"),
+        {"schema": schema}
+    ).scalar_one()
+
+
+def exclusive_run():
+    """
+    Hold the load lock exclusively: no other blue-green load or rollback, and
+    no load into the live schema, runs until the swap is done. Micro-batches
+    of the daemon wait and are applied to the newly published schema.
+    """
+    return load_lock(exclusive=True, timeout=LOAD_WAIT_TIMEOUT)
+
+
+def prepare_shadow(shadow_engine):
+    """Recreate the shadow schema with empty analytical tables, indexes and aggregates"""
+    with analytical_engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{SHADOW_SCHEMA}" CASCADE'))
+    create_analytical_tables(shadow_engine, SHADOW_SCHEMA)
+
+
+def analyze_schema(conn, schema: str):
+    """Collect planner statistics for every table and materialized view of schema"""
+    relations = conn.execute(text(
+        "SELECT relname FROM pg_class "
+        "WHERE relnamespace = CAST(:schema AS regnamespace) AND relkind IN ('r', 'p', 'm') "
+        "ORDER BY relname"
+    ), {"schema": schema}).scalars().all()
+    for relation in relations:
+        conn.execute(text(f'ANALYZE "{schema}"."{relation}"'))
+
+
+def swap_in_shadow(conn) -> bool:
+    """
+    Publish the shadow schema: live -> previous, shadow -> live, in the
+    caller's transaction. Returns whether there was a live version to keep.
+    """
+    conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    conn.execute(text(f'DROP SCHEMA IF EXISTS "{PREVIOUS_SCHEMA}" CASCADE'))
+    had_live = schema_exists(conn, ANALYTICAL_SCHEMA)
+    if had_live:
+        conn.execute(text(f'ALTER SCHEMA "{ANALYTICAL_SCHEMA}" RENAME TO "{PREVIOUS_SCHEMA}"'))
+    conn.execute(text(f'ALTER SCHEMA "{SHADOW_SCHEMA}" RENAME TO "{ANALYTICAL_SCHEMA}"'))
+    return had_live
+
+
+def transfer_data_to_analytical_blue_green() -> dict:
+    """
+    Full ETL into the shadow schema, then an atomic swap with the live one.
+    If anything fails before the swap, the live schema is left untouched and
+    the shadow schema stays for inspection until the next load.
+
+    Returns the run metrics, which are also printed as JSON and stored in
+    the etl_runs table
+    """
+    _require_named_schema()
+    print("\n" + "="*50)
+    print(f"Starting blue-green load into {SHADOW_SCHEMA}")
+    print("="*50)
+
+    shadow_engine = analytical_engine_for(SHADOW_SCHEMA)
+    metrics = EtlRunMetrics(transactional_engine, analytical_engine, shadow_engine, mode="blue_green")
+    try:
+        with exclusive_run(), metrics:
+            with metrics.stage("prepare"):
+                prepare_shadow(shadow_engine)
+
+            _run_etl(metrics, shadow_engine)
+
+            with metrics.stage("analyze"):
+                with shadow_engine.connect() as conn:
+                    analyze_schema(conn, SHADOW_SCHEMA)
+                    conn.commit()
+                with Session(shadow_engine) as session:
+                    facts = count_rows(session, FactBook)
+            if metrics.counts.get("extracted") and not facts:
+                raise RuntimeError(
+                    f"{SHADOW_SCHEMA} has no facts for {metrics.counts['extracted']} books; "
+                    f"{ANALYTICAL_SCHEMA} left untouched"
+                )
+
+            with metrics.stage("swap"):
+                with analytical_engine.begin() as conn:
+                    kept_previous = swap_in_shadow(conn)
+                version = bump_data_version()
+    finally:
+        shadow_engine.dispose()
+        print("\nETL Run Metrics:")
+        print(metrics.to_json())
+        try:
+            record_etl_run(metrics)
+        except Exception as e:
+            print(f"Warning: could not record ETL run: {e}")
+
+    print(f"\n{ANALYTICAL_SCHEMA} now holds the new load ({facts} facts, data version {version})")
+    if kept_previous:
+        print(f"The previous load is kept in {PREVIOUS_SCHEMA}; roll back with run_etl.py --rollback")
+    return metrics.to_dict()
+
+
+def rollback_analytical() -> int:
+    """
+    Swap the live and previous schemas, publishing the version loaded before
+    the last blue-green load. Running it again rolls forward. Returns the
+    new data version.
+    """
+    _require_named_schema()
+    swapping = f"{ANALYTICAL_SCHEMA}_swapping"
+    with exclusive_run():
+        with analytical_engine.begin() as conn:
+            if not schema_exists(conn, PREVIOUS_SCHEMA):
+                raise ValueError(f"There is no previous version to roll back to ({PREVIOUS_SCHEMA} not found)")
+            conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+            conn.execute(text(f'ALTER SCHEMA "{ANALYTICAL_SCHEMA}" RENAME TO "{swapping}"'))
+            conn.execute(text(f'ALTER SCHEMA "{PREVIOUS_SCHEMA}" RENAME TO "{ANALYTICAL_SCHEMA}"'))
+            conn.execute(text(f'ALTER SCHEMA "{swapping}" RENAME TO "{PREVIOUS_SCHEMA}"'))
+        version = bump_data_version()
+    print(f"Rolled back: {ANALYTICAL_SCHEMA} holds the previous load (data version {version})")
+    return version
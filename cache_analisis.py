@@ -0,0 +1,184 @@
+"""
+Caché versionada de resultados de análisis.
+
+Los resultados se guardan con la clave (función, argumentos, versión de
+datos). La versión es la secuencia analytical_data_version, que cada carga
+del ETL incrementa después de confirmar sus cambios, de modo que los
+resultados cacheados dejan de usarse cuando cambian los datos (como mucho
+ANALISIS_CACHE_VERSION_TTL segundos después).
+
+Hay un nivel en memoria (LRU) y un nivel opcional en disco. Configuración:
+  ANALISIS_CACHE=0              desactiva la caché
+  ANALISIS_CACHE_SIZE=256       entradas del nivel en memoria
+  ANALISIS_CACHE_DIR=ruta       activa el nivel en disco en ese directorio
+  ANALISIS_CACHE_VERSION_TTL=1  segundos que se reutiliza la versión leída;
+                                con 0 cada llamada lee la secuencia (un acierto
+                                cuesta igualmente una consulta) y una carga se
+                                ve al instante en vez de hasta 1s después
+"""
+import copy
+import functools
+import glob
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from etl import analytical_engine, current_data_version
+
+
+_SIN_RESULTADO = object()
+
+
+class CacheAnalisis:
+    """Caché LRU en memoria con nivel opcional en disco, invalidada por versión de datos"""
+
+    def __init__(self, capacidad: int = 256, directorio: Optional[str] = None,
+                 ttl_version: float = 1.0, activa: bool = True):
+        self.capacidad = capacidad
+        self.directorio = directorio
+        self.ttl_version = ttl_version
+        self.activa = activa
+        self._memoria: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._version_leida_en = 0.0
+        self.aciertos = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def version_datos(self) -> Optional[int]:
+        """Versión actual de los datos analíticos, o None si no se puede leer"""
+        ahora = time.monotonic()
+        if self._version is not None and ahora - self._version_leida_en < self.ttl_version:
+            return self._version
+        try:
+            with analytical_engine.connect() as conn:
+                version = current_data_version(conn)
+        except SQLAlchemyError:
+            return None
+        with self._lock:
+            if version != self._version:
+                # Las entradas de versiones anteriores ya no se pueden usar
+                self._memoria.clear()
+                self._purgar_disco(version)
+            self._version = version
+            self._version_leida_en = ahora
+        return version
+
+    def _ruta(self, clave: tuple) -> str:
+        resumen = hashlib.sha256(repr(clave).encode()).hexdigest()
+        return os.path.join(self.directorio, f"v{clave[-1]}_{resumen}.pkl")
+
+    def _purgar_disco(self, version: int):
+        if not self.directorio:
+            return
+        for ruta in glob.glob(os.path.join(self.directorio, "v*_*.pkl")):
+            if not os.path.basename(ruta).startswith(f"v{version}_"):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    def obtener(self, clave: tuple):
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.aciertos += 1
+                return self._memoria[clave]
+
+        if self.directorio:
+            try:
+                with open(self._ruta(clave), "rb") as archivo:
+                    valor = pickle.load(archivo)
+            except (OSError, pickle.PickleError, EOFError):
+                pass
+            else:
+                with self._lock:
+                    self.aciertos_disco += 1
+                self._guardar_en_memoria(clave, valor)
+                return valor
+
+        with self._lock:
+            self.fallos += 1
+        return _SIN_RESULTADO
+
+    def guardar(self, clave: tuple, valor):
+        self._guardar_en_memoria(clave, valor)
+        if self.directorio:
+            ruta = self._ruta(clave)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temporal, "wb") as archivo:
+                    pickle.dump(valor, archivo)
+                os.replace(temporal, ruta)
+            except OSError:
+                pass
+
+    def _guardar_en_memoria(self, clave: tuple, valor):
+        with self._lock:
+            self._memoria[clave] = valor
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.capacidad:
+                self._memoria.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._memoria.clear()
+            self._version = None
+        self._purgar_disco(-1)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            total = self.aciertos + self.aciertos_disco + self.fallos
+            return {
+                "aciertos_memoria": self.aciertos,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": (self.aciertos + self.aciertos_disco) / total if total else 0.0,
+                "entradas_memoria": len(self._memoria),
+                "version_datos": self._version,
+            }
+
+
+cache = CacheAnalisis(
+    capacidad=int(os.getenv("ANALISIS_CACHE_SIZE", "256")),
+    directorio=os.getenv("ANALISIS_CACHE_DIR") or None,
+    ttl_version=float(os.getenv("ANALISIS_CACHE_VERSION_TTL", "1")),
+    activa=os.getenv("ANALISIS_CACHE", "1") != "0"
+)
+
+
+def cacheado(funcion):
+    """Cachea el resultado de una función de análisis por argumentos y versión de datos"""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not cache.activa:
+            return funcion(*args, **kwargs)
+
+        version = cache.version_datos()
+        if version is None:
+            return funcion(*args, **kwargs)
+
+        clave = (funcion.__module__, funcion.__qualname__, args,
+                 tuple(sorted(kwargs.items())), version)
+        valor = cache.obtener(clave)
+        if valor is _SIN_RESULTADO:
+            valor = funcion(*args, **kwargs)
+            cache.guardar(clave, valor)
+        # Copia para que quien llama no pueda modificar lo cacheado
+        return copy.deepcopy(valor)
+
+    return envoltura
+
+
+def estadisticas_cache() -> Dict:
+    """Aciertos, fallos y tamaño de la caché de análisis"""
+    return cache.estadisticas()
@@ -0,0 +1,189 @@
+"""
+Catálogo sintético en la base transaccional.
+
+Llena categories, books, stocks, scores y tax_rates con generate_series,
+como si el scraper hubiera recorrido un sitio de 1k a 1M de libros, para
+medir el ETL y los análisis a esa escala. Las distribuciones imitan las de
+books.toscrape.com:
+  - pocas categorías grandes y muchas pequeñas (random()^3),
+  - precios uniformes entre 10.00 y 60.00,
+  - stock de 1 a 22 concentrado en valores bajos, con un 5% agotado,
+  - puntuaciones uniformes de 1 a 5,
+  - descripciones de 200 a 1500 caracteres,
+  - uno de cada DUPLICADOS_CADA títulos repetido en otra categoría.
+
+Los libros llevan el prefijo ESC- en el UPC, las categorías el prefijo
+"Escala" y los impuestos fechas del año 2000, de modo que limpiar_catalogo()
+los borra de ambas bases sin tocar los datos reales.
+
+Uso:
+  python catalogo_sintetico.py --libros 100000
+  python catalogo_sintetico.py --limpiar
+"""
+import argparse
+import time
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import text
+
+from aggregates import refresh_aggregates
+from database import create_tables, engine as transactional_engine
+from etl import analytical_engine, bump_data_version
+
+
+PREFIJO_UPC = "ESC-"
+PREFIJO_CATEGORIA = "Escala"
+NUM_CATEGORIAS = 50
+# Historial de impuestos sintéticos: uno por mes del año 2000
+INICIO_IMPUESTOS = datetime(2000, 1, 1)
+FIN_IMPUESTOS = datetime(2001, 1, 1)
+DUPLICADOS_CADA = 100
+
+TEXTO_DESCRIPCION = (
+    "Una historia sobre libros, lectores y bibliotecas que recorre varias "
+    "generaciones de una misma familia. Entre cartas perdidas, viajes y "
+    "secretos, cada capítulo revela una parte del pasado que nadie quería "
+    "recordar. Una novela sobre la memoria, el tiempo y las palabras. "
+)
+
+
+def generar_catalogo(num_libros: int, semilla: float = 0.42) -> int:
+    """
+    Inserta num_libros libros sintéticos con su categoría, stock y
+    puntuación, y el historial de impuestos. Si ya hay libros sintéticos,
+    los nuevos continúan la numeración.
+    """
+    create_tables()
+    with transactional_engine.begin() as conn:
+        # La semilla hace que random() sea reproducible en esta sesión
+        conn.execute(text("SELECT setseed(:semilla)"), {"semilla": semilla})
+
+        conn.execute(text(
+            "INSERT INTO categories (name) "
+            "SELECT :prefijo || ' ' || lpad(n::text, 2, '0') FROM generate_series(1, :n) n "
+            "ON CONFLICT (name) DO NOTHING"
+        ), {"prefijo": PREFIJO_CATEGORIA, "n": NUM_CATEGORIAS})
+
+        existentes = conn.execute(text(
+            "SELECT count(*) FROM tax_rates WHERE date >= :inicio AND date < :fin"
+        ), {"inicio": INICIO_IMPUESTOS, "fin": FIN_IMPUESTOS}).scalar_one()
+        if not existentes:
+            conn.execute(text(
+                "INSERT INTO tax_rates (tax_float, date) "
+                "SELECT round((0.15 + random() * 0.04)::numeric, 2)::float, "
+                "       :inicio + (m || ' months')::interval "
+                "FROM generate_series(0, 11) m"
+            ), {"inicio": INICIO_IMPUESTOS})
+
+        conn.execute(text("ANALYZE categories"))
+
+        inicio = conn.execute(text(
+            "SELECT count(*) FROM books WHERE upc LIKE :prefijo || '%'"
+        ), {"prefijo": PREFIJO_UPC}).scalar_one()
+
+        # Libro, stock y puntuación en una sola sentencia: los ids de los
+        # libros nuevos pasan a stocks y scores con RETURNING
+        resultado = conn.execute(text("""
+            WITH categorias AS (
+                SELECT id, row_number() OVER (ORDER BY name) - 1 AS posicion
+                FROM categories WHERE name LIKE :prefijo_categoria || ' %'
+            ),
+            libros AS (
+                SELECT n,
+                       floor(power(random(), 3) * :num_categorias)::int AS categoria,
+                       (1000 + floor(random() * 5001)) / 100.0 AS precio,
+                       CASE WHEN random() < 0.05 THEN 0
+                            ELSE 1 + floor(power(random(), 2) * 22)::int END AS stock,
+                       200 + floor(random() * 1301)::int AS largo_descripcion
+                FROM generate_series(:desde, :hasta) n
+            ),
+            nuevos AS (
+                INSERT INTO books (upc, title, price, stock_int, image_url, category_id, description)
+                SELECT :prefijo_upc || lpad(l.n::text, 12, '0'),
+                       'Libro de escala ' || CASE WHEN l.n % :duplicados = 0 THEN l.n - 1 ELSE l.n END,
+                       l.precio::float,
+                       l.stock,
+                       'https://books.toscrape.com/media/cache/' || md5(l.n::text) || '.jpg',
+                       c.id,
+                       left(repeat(:texto, 6), l.largo_descripcion)
+                FROM libros l
+                JOIN categorias c ON c.posicion = l.categoria
+                ON CONFLICT (upc) DO NOTHING
+                RETURNING id, stock_int
+            ),
+            stocks_nuevos AS (
+                INSERT INTO stocks (book_id, quantity)
+                SELECT id, stock_int FROM nuevos
+            )
+            INSERT INTO scores (book_id, score)
+            SELECT id, 1 + floor(random() * 5) FROM nuevos
+        """), {
+            "prefijo_categoria": PREFIJO_CATEGORIA,
+            "prefijo_upc": PREFIJO_UPC,
+            "num_categorias": NUM_CATEGORIAS,
+            "duplicados": DUPLICADOS_CADA,
+            "texto": TEXTO_DESCRIPCION,
+            "desde": inicio + 1,
+            "hasta": inicio + num_libros,
+        })
+        insertados = resultado.rowcount
+        conn.execute(text("ANALYZE books, stocks, scores, tax_rates"))
+    return insertados
+
+
+def limpiar_catalogo() -> Dict[str, int]:
+    """
+    Borra el catálogo sintético de la base transaccional y los hechos e
+    instantáneas que el ETL haya cargado a partir de él en la base analítica
+    """
+    with transactional_engine.begin() as conn:
+        parametros = {"prefijo": PREFIJO_UPC}
+        sinteticos = "SELECT id FROM books WHERE upc LIKE :prefijo || '%'"
+        conn.execute(text(f"DELETE FROM scores WHERE book_id IN ({sinteticos})"), parametros)
+        conn.execute(text(f"DELETE FROM stocks WHERE book_id IN ({sinteticos})"), parametros)
+        libros = conn.execute(text(
+            "DELETE FROM books WHERE upc LIKE :prefijo || '%'"
+        ), parametros).rowcount
+        conn.execute(text(
+            "DELETE FROM categories WHERE name LIKE :prefijo || ' %'"
+        ), {"prefijo": PREFIJO_CATEGORIA})
+        conn.execute(text(
+            "DELETE FROM tax_rates WHERE date >= :inicio AND date < :fin"
+        ), {"inicio": INICIO_IMPUESTOS, "fin": FIN_IMPUESTOS})
+
+    with analytical_engine.begin() as conn:
+        hechos = conn.execute(text(
+            "DELETE FROM fact_books WHERE upc LIKE :prefijo || '%'"
+        ), {"prefijo": PREFIJO_UPC}).rowcount
+        instantaneas = 0
+        if conn.execute(text("SELECT to_regclass('public.fact_book_snapshot')")).scalar() is not None:
+            instantaneas = conn.execute(text(
+                "DELETE FROM public.fact_book_snapshot WHERE upc LIKE :prefijo || '%'"
+            ), {"prefijo": PREFIJO_UPC}).rowcount
+        conn.execute(text(
+            "DELETE FROM dim_category WHERE name LIKE :prefijo || ' %'"
+        ), {"prefijo": PREFIJO_CATEGORIA})
+        refresh_aggregates(conn)
+    bump_data_version()
+    return {"libros": libros, "hechos": hechos, "instantaneas": instantaneas}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un catálogo sintético en la base transaccional")
+    parser.add_argument("--libros", type=int, default=10_000,
+                        help="Número de libros sintéticos a generar")
+    parser.add_argument("--semilla", type=float, default=0.42,
+                        help="Semilla de random() entre -1 y 1")
+    parser.add_argument("--limpiar", action="store_true",
+                        help="Borra el catálogo sintético en lugar de generarlo")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.limpiar:
+        borrados = limpiar_catalogo()
+        print(f"Libros sintéticos borrados: {borrados['libros']} "
+              f"(hechos analíticos: {borrados['hechos']}, instantáneas: {borrados['instantaneas']})")
+    else:
+        print(f"Libros sintéticos generados: {generar_catalogo(args.libros, args.semilla)}")
+    print(f"Tiempo: {time.perf_counter() - inicio:.2f}s")
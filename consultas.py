@@ -0,0 +1,359 @@
+"""
+Capa de consultas de los análisis de libros.
+
+Cada análisis es una única sentencia SQL construida sobre `hechos()`, la
+unión de fact_books con sus dimensiones, y una función que da formato a
+las filas devueltas. Los cálculos por categoría usan funciones de ventana
+para que todo se resuelva en la base de datos en un solo viaje. Los
+resúmenes (conteos, precios y stock por categoría o por rango de precio y
+estado de stock) se leen de los agregados materializados de aggregates.py.
+
+Con ANALISIS_FUENTE=ancha, `hechos()` lee la proyección desnormalizada
+fact_books_wide en lugar de unir el copo de nieve, y las consultas no
+necesitan ningún join.
+"""
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import Float, Numeric, cast, func, select
+
+from aggregates import category_summary, price_stock_summary
+from models_analytical import FactBook, FactBookWide, DimCategory, DimStock, DimPrice
+
+
+FUENTES = ("estrella", "ancha")
+FUENTE_HECHOS = os.getenv("ANALISIS_FUENTE", "estrella")
+
+
+class Consulta(NamedTuple):
+    sentencia: Callable
+    formatear: Callable
+
+
+def hechos(categorias: Optional[Sequence[str]] = None, fuente: Optional[str] = None):
+    """
+    Libros con su categoría, precio y stock, con nombres de columna estables.
+    Con categorias, solo los libros de esas categorías. La fuente es el copo
+    de nieve ("estrella") o la proyección ancha ("ancha"); por defecto FUENTE_HECHOS.
+    """
+    fuente = fuente or FUENTE_HECHOS
+    if fuente not in FUENTES:
+        raise ValueError(f"Fuente desconocida: {fuente} (use {' o '.join(FUENTES)})")
+    if fuente == "ancha":
+        return _hechos_proyeccion(categorias)
+
+    consulta = (
+        select(
+            FactBook.id.label("libro_id"),
+            FactBook.upc.label("upc"),
+            FactBook.title.label("titulo"),
+            DimCategory.id.label("categoria_id"),
+            DimCategory.name.label("categoria"),
+            DimPrice.price_before_tax.label("precio"),
+            DimStock.quantity.label("stock")
+        )
+        .join(DimCategory, FactBook.category_id == DimCategory.id)
+        .join(DimPrice, FactBook.price_id == DimPrice.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+    )
+    if categorias:
+        consulta = consulta.where(DimCategory.name.in_(categorias))
+    return consulta.subquery("hechos")
+
+
+def _hechos_proyeccion(categorias: Optional[Sequence[str]] = None):
+    """
+    Las mismas columnas que hechos(), leídas de fact_books_wide sin joins.
+    Como el join con dim_category de hechos(), deja fuera los libros sin categoría.
+    """
+    ancha = FactBookWide
+    consulta = select(
+        ancha.book_id.label("libro_id"),
+        ancha.upc.label("upc"),
+        ancha.title.label("titulo"),
+        ancha.category_id.label("categoria_id"),
+        ancha.category_name.label("categoria"),
+        ancha.price_before_tax.label("precio"),
+        ancha.stock_quantity.label("stock")
+    ).where(ancha.category_id.is_not(None))
+    if categorias:
+        consulta = consulta.where(ancha.category_name.in_(categorias))
+    return consulta.subquery("hechos")
+
+
+# a. Número de categorías
+
+def sentencia_contar_categorias():
+    return select(func.count()).select_from(category_summary)
+
+
+def formatear_contar_categorias(filas) -> int:
+    return filas[0][0]
+
+
+# b. Libros por categoría
+
+def sentencia_libros_por_categoria():
+    resumen = category_summary.c
+    return (
+        select(resumen.category_name, resumen.book_count)
+        .where(resumen.book_count > 0)
+        .order_by(resumen.category_name)
+    )
+
+
+def formatear_libros_por_categoria(filas) -> Dict[str, int]:
+    return {categoria: cantidad for categoria, cantidad in filas}
+
+
+# c. Libro más caro
+
+def sentencia_libro_mas_caro():
+    h = hechos()
+    return (
+        select(h.c.titulo, h.c.precio, h.c.categoria, h.c.upc)
+        .order_by(h.c.precio.desc(), h.c.upc)
+        .limit(1)
+    )
+
+
+def formatear_libro_mas_caro(filas) -> Dict:
+    if not filas:
+        return None
+    titulo, precio, categoria, upc = filas[0]
+    return {"titulo": titulo, "precio": precio, "categoria": categoria, "upc": upc}
+
+
+# d. Libros en más de una categoría
+
+def sentencia_libros_en_multiples_categorias():
+    h = hechos()
+    # PostgreSQL no admite COUNT(DISTINCT) como ventana: hay más de una
+    # categoría distinta cuando el mínimo y el máximo no coinciden
+    por_titulo = select(
+        h.c.titulo,
+        h.c.categoria,
+        func.min(h.c.categoria_id).over(partition_by=h.c.titulo).label("primera"),
+        func.max(h.c.categoria_id).over(partition_by=h.c.titulo).label("ultima")
+    ).subquery("por_titulo")
+    return (
+        select(por_titulo.c.titulo, por_titulo.c.categoria)
+        .where(por_titulo.c.primera != por_titulo.c.ultima)
+        .order_by(por_titulo.c.titulo, por_titulo.c.categoria)
+    )
+
+
+def formatear_libros_en_multiples_categorias(filas) -> List[Dict]:
+    libros_duplicados = {}
+    for titulo, categoria in filas:
+        libros_duplicados.setdefault(titulo, []).append(categoria)
+    return [{"titulo": titulo, "categorias": categorias}
+            for titulo, categorias in libros_duplicados.items()]
+
+
+# e. Libro más barato por categoría (todos los empatados)
+
+def sentencia_libro_mas_barato_por_categoria():
+    h = hechos()
+    rango = func.rank().over(partition_by=h.c.categoria_id, order_by=h.c.precio)
+    ranking = select(
+        h.c.categoria, h.c.titulo, h.c.precio, h.c.upc, rango.label("rango")
+    ).subquery("ranking")
+    return (
+        select(ranking.c.categoria, ranking.c.titulo, ranking.c.precio, ranking.c.upc)
+        .where(ranking.c.rango == 1)
+        .order_by(ranking.c.categoria, ranking.c.upc)
+    )
+
+
+def formatear_libro_mas_barato_por_categoria(filas) -> Dict[str, List[Dict]]:
+    resultado = {}
+    for categoria, titulo, precio, upc in filas:
+        resultado.setdefault(categoria, []).append({
+            "titulo": titulo,
+            "precio": precio,
+            "upc": upc
+        })
+    return resultado
+
+
+# f. Diferencia de cada libro respecto al promedio de su categoría
+
+def diferencias_vs_promedio(categorias: Optional[Sequence[str]] = None):
+    """Cada libro con el promedio de su categoría y su diferencia respecto a él"""
+    # Filtrar por categoría antes de la ventana no cambia los promedios, que son por categoría
+    h = hechos(categorias)
+    promedio = func.avg(h.c.precio, type_=Float).over(partition_by=h.c.categoria_id)
+    return select(
+        h.c.upc,
+        h.c.titulo,
+        h.c.categoria,
+        h.c.precio,
+        promedio.label("promedio"),
+        (h.c.precio - promedio).label("diferencia")
+    ).subquery("diferencias")
+
+
+def sentencia_diferencia_vs_promedio_categoria():
+    d = diferencias_vs_promedio()
+    return (
+        select(d.c.titulo, d.c.categoria, d.c.precio, d.c.promedio, d.c.diferencia)
+        .order_by(d.c.categoria, d.c.titulo)
+    )
+
+
+def formatear_diferencia(titulo, categoria, precio, promedio, diferencia) -> Dict:
+    porcentaje = (diferencia / promedio * 100) if promedio > 0 else 0
+    return {
+        "titulo": titulo,
+        "categoria": categoria,
+        "precio": precio,
+        "promedio_categoria": round(promedio, 2),
+        "diferencia": round(diferencia, 2),
+        "porcentaje_diferencia": round(porcentaje, 2),
+        "estado": "más caro" if diferencia > 0 else "más barato" if diferencia < 0 else "igual"
+    }
+
+
+def formatear_diferencia_vs_promedio_categoria(filas) -> List[Dict]:
+    return [formatear_diferencia(*fila) for fila in filas]
+
+
+# f'. Los k libros que más se alejan del promedio de su categoría
+
+DIRECCIONES = ("baratos", "caros")
+
+
+def sentencia_ranking_diferencias(k: int = 5, direccion: str = "baratos",
+                                  categorias: Optional[Sequence[str]] = None):
+    """
+    Top-k de diferencias respecto al promedio: ORDER BY ... LIMIT k sobre la
+    ventana, de modo que la base de datos solo conserva k filas al ordenar.
+    Se ordena por la diferencia redondeada a centavos, como la que se muestra,
+    y se desempata por categoría, título y UPC.
+    """
+    if direccion not in DIRECCIONES:
+        raise ValueError(f"Dirección desconocida: {direccion} (use {' o '.join(DIRECCIONES)})")
+    d = diferencias_vs_promedio(categorias)
+    diferencia = func.round(cast(d.c.diferencia, Numeric), 2)
+    orden = (diferencia, d.c.categoria, d.c.titulo, d.c.upc)
+    if direccion == "caros":
+        orden = tuple(columna.desc() for columna in orden)
+    return (
+        select(d.c.titulo, d.c.categoria, d.c.precio, d.c.promedio, d.c.diferencia)
+        .order_by(*orden)
+        .limit(k)
+    )
+
+
+# g. Libro con mayor ingreso potencial por categoría
+
+def sentencia_libro_mayor_ingreso_por_categoria():
+    h = hechos()
+    ingreso = h.c.precio * h.c.stock
+    posicion = func.row_number().over(
+        partition_by=h.c.categoria_id,
+        order_by=(ingreso.desc(), h.c.upc)
+    )
+    ranking = (
+        select(
+            h.c.categoria, h.c.titulo, h.c.precio, h.c.stock, h.c.upc,
+            ingreso.label("ingreso_potencial"),
+            posicion.label("posicion")
+        )
+        .where(h.c.stock.is_not(None))
+        .subquery("ranking")
+    )
+    return (
+        select(
+            ranking.c.categoria, ranking.c.titulo, ranking.c.precio,
+            ranking.c.stock, ranking.c.ingreso_potencial, ranking.c.upc
+        )
+        .where(ranking.c.posicion == 1)
+        .order_by(ranking.c.categoria)
+    )
+
+
+def formatear_libro_mayor_ingreso_por_categoria(filas) -> Dict[str, Dict]:
+    return {
+        categoria: {
+            "titulo": titulo,
+            "precio": precio,
+            "stock": stock,
+            "ingreso_potencial": round(ingreso, 2),
+            "upc": upc
+        }
+        for categoria, titulo, precio, stock, ingreso, upc in filas
+    }
+
+
+# Resúmenes materializados
+
+def _medidas(resumen):
+    return (
+        resumen.book_count, resumen.min_price, resumen.max_price,
+        resumen.avg_price, resumen.total_stock, resumen.potential_revenue
+    )
+
+
+def _formatear_medidas(libros, minimo, maximo, promedio, stock, ingreso) -> Dict:
+    return {
+        "libros": libros,
+        "precio_minimo": minimo,
+        "precio_maximo": maximo,
+        "precio_promedio": round(promedio, 2),
+        "stock_total": stock,
+        "ingreso_potencial": round(ingreso, 2)
+    }
+
+
+def sentencia_resumen_por_categoria():
+    resumen = category_summary.c
+    return (
+        select(resumen.category_name, *_medidas(resumen))
+        .where(resumen.book_count > 0)
+        .order_by(resumen.category_name)
+    )
+
+
+def formatear_resumen_por_categoria(filas) -> Dict[str, Dict]:
+    return {categoria: _formatear_medidas(*medidas) for categoria, *medidas in filas}
+
+
+def sentencia_resumen_por_rango_y_stock():
+    resumen = price_stock_summary.c
+    return (
+        select(resumen.price_range, resumen.stock_status, *_medidas(resumen))
+        .order_by(resumen.price_range, resumen.stock_status)
+    )
+
+
+def formatear_resumen_por_rango_y_stock(filas) -> List[Dict]:
+    return [
+        {"rango_precio": rango, "estado_stock": estado, **_formatear_medidas(*medidas)}
+        for rango, estado, *medidas in filas
+    ]
+
+
+CONSULTAS: Dict[str, Consulta] = {
+    "contar_categorias": Consulta(
+        sentencia_contar_categorias, formatear_contar_categorias),
+    "libros_por_categoria": Consulta(
+        sentencia_libros_por_categoria, formatear_libros_por_categoria),
+    "libro_mas_caro": Consulta(
+        sentencia_libro_mas_caro, formatear_libro_mas_caro),
+    "libros_en_multiples_categorias": Consulta(
+        sentencia_libros_en_multiples_categorias, formatear_libros_en_multiples_categorias),
+    "libro_mas_barato_por_categoria": Consulta(
+        sentencia_libro_mas_barato_por_categoria, formatear_libro_mas_barato_por_categoria),
+    "diferencia_vs_promedio_categoria": Consulta(
+        sentencia_diferencia_vs_promedio_categoria, formatear_diferencia_vs_promedio_categoria),
+    "ranking_diferencias": Consulta(
+        sentencia_ranking_diferencias, formatear_diferencia_vs_promedio_categoria),
+    "libro_mayor_ingreso_por_categoria": Consulta(
+        sentencia_libro_mayor_ingreso_por_categoria, formatear_libro_mayor_ingreso_por_categoria),
+    "resumen_por_categoria": Consulta(
+        sentencia_resumen_por_categoria, formatear_resumen_por_categoria),
+    "resumen_por_rango_y_stock": Consulta(
+        sentencia_resumen_por_rango_y_stock, formatear_resumen_por_rango_y_stock),
+}
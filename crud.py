@@ -1,10 +1,12 @@
 from typing import List, Optional
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlmodel import Session, select
 from models_transactional import Book, Category, Stock, Scores, TaxRate
 from database import get_session
+from scraped_books import ScrapedBook, ScrapedBookBatch
 
 
-def save_book_information(book_information: dict, category_name: str):
+def save_book_information(book_information: ScrapedBook, category_name: str):
     # First save the category
     category = CategoryCRUD.create(category_name)
     if not category:
@@ -12,21 +14,80 @@ def save_book_information(book_information: dict, category_name: str):
         return
 
     book = BookCRUD.create(
-        upc=book_information['upc'],
-        title=book_information['title'],
-        price=book_information['price'],
+        upc=book_information.upc,
+        title=book_information.title,
+        price=book_information.price,
         category_id=category.id,
-        description=book_information['description'],
-        image_url=book_information['image_url'],
-        stock_int=book_information['stock']
+        description=book_information.description,
+        image_url=book_information.image_url,
+        stock_int=book_information.stock
     )
     
     if not book:
-        print(f"Failed to create book: {book_information['title']}")
+        print(f"Failed to create book: {book_information.title}")
         return
 
-    ScoreCRUD.create(book_id=book.id, score=book_information.get('rating', 0.0))
-    StockCRUD.create(book_id=book.id, quantity=book_information['stock'])
+    ScoreCRUD.create(book_id=book.id, score=book_information.rating)
+    StockCRUD.create(book_id=book.id, quantity=book_information.stock)
+
+
+def save_book_batch(batch: ScrapedBookBatch) -> int:
+    """
+    Save a chunk of scraped books in one transaction, with one statement per
+    table instead of several per book. Books whose UPC already exists are
+    skipped, as in save_book_information. Returns the number of new books.
+    """
+    if not len(batch):
+        return 0
+
+    with get_session() as session:
+        written = insert_book_batch(session, batch)
+        session.commit()
+    return written
+
+
+def insert_book_batch(session, batch: ScrapedBookBatch) -> int:
+    """The statements of save_book_batch, in the caller's session and transaction"""
+    names = sorted(set(batch.categories))
+    session.execute(
+        pg_insert(Category).values([{"name": name} for name in names])
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    category_ids = dict(session.execute(
+        select(Category.name, Category.id).where(Category.name.in_(names))
+    ).all())
+
+    # The first occurrence wins when a UPC repeats within the batch
+    first_row = {}
+    for i, upc in enumerate(batch.upcs):
+        first_row.setdefault(upc, i)
+    book_ids = dict(session.execute(
+        pg_insert(Book).values([
+            {
+                "upc": upc,
+                "title": batch.titles[i],
+                "price": batch.prices[i],
+                "stock_int": batch.stocks[i],
+                "image_url": batch.image_urls[i],
+                "category_id": category_ids[batch.categories[i]],
+                "description": batch.descriptions[i],
+            }
+            for upc, i in first_row.items()
+        ])
+        .on_conflict_do_nothing(index_elements=["upc"])
+        .returning(Book.upc, Book.id)
+    ).all())
+
+    if book_ids:
+        session.execute(pg_insert(Scores).values([
+            {"book_id": book_id, "score": batch.ratings[first_row[upc]]}
+            for upc, book_id in book_ids.items()
+        ]).on_conflict_do_nothing(index_elements=["book_id"]))
+        session.execute(pg_insert(Stock).values([
+            {"book_id": book_id, "quantity": batch.stocks[first_row[upc]]}
+            for upc, book_id in book_ids.items()
+        ]).on_conflict_do_nothing(index_elements=["book_id"]))
+    return len(book_ids)
 
 
 class CategoryCRUD:
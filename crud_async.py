@@ -0,0 +1,123 @@
+"""
+Async counterparts of crud.py on the asyncpg driver.
+
+Same models and same results: every create returns the existing row when
+its natural key (category name, UPC, book id) is already there. The
+existence checks are INSERT ... ON CONFLICT statements instead of
+SELECT-then-INSERT, so thousands of coroutines saving books of the same
+category at once do not race on the unique constraints.
+"""
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import select
+
+from crud import insert_book_batch
+from database_async import get_async_session
+from models_transactional import Book, Category, Stock, Scores
+from scraped_books import ScrapedBook, ScrapedBookBatch
+
+
+async def save_book_information(book_information: ScrapedBook, category_name: str):
+    # First save the category
+    category = await CategoryCRUD.create(category_name)
+    if not category:
+        print(f"Failed to create category: {category_name}")
+        return
+
+    book = await BookCRUD.create(
+        upc=book_information.upc,
+        title=book_information.title,
+        price=book_information.price,
+        category_id=category.id,
+        description=book_information.description,
+        image_url=book_information.image_url,
+        stock_int=book_information.stock
+    )
+
+    if not book:
+        print(f"Failed to create book: {book_information.title}")
+        return
+
+    await ScoreCRUD.create(book_id=book.id, score=book_information.rating)
+    await StockCRUD.create(book_id=book.id, quantity=book_information.stock)
+
+
+async def save_book_batch(batch: ScrapedBookBatch) -> int:
+    """crud.save_book_batch on the async engine. Returns the number of new books"""
+    if not len(batch):
+        return 0
+
+    async with get_async_session() as session:
+        # Same statements as the sync sink; run_sync sends them through asyncpg
+        written = await session.run_sync(insert_book_batch, batch)
+        await session.commit()
+    return written
+
+
+async def _insert_or_get(session, model_class, key: str, values: dict):
+    """Insert a row unless its unique key exists, and return the row either way"""
+    await session.execute(
+        pg_insert(model_class).values(**values).on_conflict_do_nothing(index_elements=[key])
+    )
+    row = (await session.exec(
+        select(model_class).where(getattr(model_class, key) == values[key])
+    )).one()
+    await session.commit()
+    return row
+
+
+class CategoryCRUD:
+    @staticmethod
+    async def create(name: str) -> Optional[Category]:
+        try:
+            async with get_async_session() as session:
+                return await _insert_or_get(session, Category, "name", {"name": name})
+        except Exception as e:
+            print(f"Error creating category: {e}")
+            return None
+
+
+class BookCRUD:
+    @staticmethod
+    async def create(
+        upc: str,
+        title: str,
+        price: float,
+        category_id: int,
+        description: str,
+        image_url: str,
+        stock_int: int = 0
+    ) -> Optional[Book]:
+        try:
+            async with get_async_session() as session:
+                return await _insert_or_get(session, Book, "upc", {
+                    "upc": upc,
+                    "title": title,
+                    "price": price,
+                    "category_id": category_id,
+                    "description": description,
+                    "image_url": image_url,
+                    "stock_int": stock_int,
+                })
+        except Exception as e:
+            print(f"Error creating book: {e}")
+            return None
+
+
+class StockCRUD:
+    @staticmethod
+    async def create(book_id: int, quantity: int) -> Optional[Stock]:
+        async with get_async_session() as session:
+            return await _insert_or_get(session, Stock, "book_id", {"book_id": book_id, "quantity": quantity})
+
+
+class ScoreCRUD:
+    @staticmethod
+    async def create(book_id: int, score: float) -> Optional[Scores]:
+        try:
+            async with get_async_session() as session:
+                return await _insert_or_get(session, Scores, "book_id", {"book_id": book_id, "score": score})
+        except Exception as e:
+            print(f"Error creating score: {e}")
+            return None
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""
+Cubos OLAP sobre las dimensiones analíticas.
+
+agregar() responde cualquier corte del catálogo sin escribir una función
+nueva: recibe dimensiones (categoría, rango de precio, estado de stock,
+puntuación, tasa y fecha de impuesto), medidas (libros, suma, promedio,
+mínimo y máximo del precio, stock e ingreso potencial) y filtros, y planifica
+una única sentencia GROUP BY ROLLUP(...) o CUBE(...) que trae todos los
+subtotales en un viaje. Solo se unen las dimensiones que se usan; con
+ANALISIS_FUENTE=ancha se lee fact_books_wide sin joins.
+
+Con cachear=True el cubo calculado queda en memoria (por versión de datos,
+igual que la caché de análisis) y las consultas siguientes que caben en él,
+como bajar de categoría a categoría × estado de stock o fijar un valor de
+otra dimensión, se responden reagregando en memoria sin ir a la base:
+
+  agregar(("categoria", "rango_precio", "estado_stock"), tipo="cube", cachear=True)
+  agregar(("estado_stock",), filtros={"categoria": "Poetry"}, cachear=True)  # desde memoria
+
+Uso:
+  python cubo.py estado_stock rango_precio puntuacion --medidas libros precio_promedio
+  python cubo.py categoria estado_stock --tipo cube --filtro rango_precio=Premium
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from itertools import combinations
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, literal, or_, select
+
+from cache_analisis import cache
+from consultas import FUENTES, FUENTE_HECHOS
+from etl import analytical_engine
+from models_analytical import FactBook, FactBookWide, DimCategory, DimStock, DimScore, DimPrice, DimTax
+
+
+TIPOS = ("rollup", "cube")
+
+# Cubos que se guardan en memoria con cachear=True
+CUBO_CACHE_SIZE = int(os.getenv("CUBO_CACHE_SIZE", "16"))
+
+
+class Dimension(NamedTuple):
+    estrella: Any                 # columna en el copo de nieve
+    ancha: Any                    # columna de fact_books_wide, None si la proyección no la tiene
+    tabla: Any = None             # dimensión a unir en el copo de nieve si no se une siempre
+    convertir: Callable[[str], Any] = str
+
+
+DIMENSIONES: Dict[str, Dimension] = {
+    "categoria": Dimension(DimCategory.name, FactBookWide.category_name, DimCategory),
+    "rango_precio": Dimension(DimPrice.price_range, FactBookWide.price_range),
+    "estado_stock": Dimension(DimStock.stock_status, FactBookWide.stock_status),
+    "puntuacion": Dimension(DimScore.score, FactBookWide.score, DimScore, float),
+    "tasa_impuesto": Dimension(DimTax.tax_rate, FactBookWide.tax_rate, DimTax, float),
+    "fecha_impuesto": Dimension(DimTax.date, None, DimTax, datetime.fromisoformat),
+}
+
+MEDIDAS = (
+    "libros", "suma_precio", "precio_promedio", "precio_minimo",
+    "precio_maximo", "stock_total", "ingreso_potencial",
+)
+
+# Medidas redondeadas a dos decimales al formatear
+_MEDIDAS_MONETARIAS = {"suma_precio", "precio_promedio", "ingreso_potencial"}
+
+Filtros = Tuple[Tuple[str, Tuple[Any, ...]], ...]
+
+
+def normalizar_filtros(filtros: Optional[Dict[str, Any]]) -> Filtros:
+    """{dimensión: valor o lista de valores} como tupla ordenada, usable como clave de caché"""
+    normalizados = []
+    for nombre, valores in (filtros or {}).items():
+        _validar_dimensiones([nombre])
+        if not isinstance(valores, (list, tuple, set, frozenset)):
+            valores = (valores,)
+        normalizados.append((nombre, tuple(sorted(set(valores), key=repr))))
+    return tuple(sorted(normalizados))
+
+
+def _validar_dimensiones(dimensiones: Sequence[str]):
+    desconocidas = [nombre for nombre in dimensiones if nombre not in DIMENSIONES]
+    if desconocidas:
+        raise ValueError(
+            f"Dimensión desconocida: {', '.join(desconocidas)} (use {', '.join(DIMENSIONES)})"
+        )
+    if len(set(dimensiones)) != len(dimensiones):
+        raise ValueError("Dimensión repetida")
+
+
+def _validar_medidas(medidas: Optional[Sequence[str]]) -> Sequence[str]:
+    if medidas is None:
+        return MEDIDAS
+    desconocidas = [nombre for nombre in medidas if nombre not in MEDIDAS]
+    if desconocidas:
+        raise ValueError(f"Medida desconocida: {', '.join(desconocidas)} (use {', '.join(MEDIDAS)})")
+    return medidas
+
+
+def _condicion(columna, valores: Tuple[Any, ...]):
+    valores_no_nulos = [valor for valor in valores if valor is not None]
+    condicion = columna.in_(valores_no_nulos)
+    return or_(condicion, columna.is_(None)) if None in valores else condicion
+
+
+def sentencia_cubo(dimensiones: Sequence[str], filtros: Filtros = (), tipo: str = "rollup",
+                   fuente: Optional[str] = None):
+    """
+    Una sentencia con GROUP BY ROLLUP o CUBE de las dimensiones, todas las
+    medidas y la columna _agrupacion (bit a 1 por cada dimensión agregada)
+    """
+    _validar_dimensiones(dimensiones)
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo desconocido: {tipo} (use {' o '.join(TIPOS)})")
+    fuente = fuente or FUENTE_HECHOS
+    if fuente not in FUENTES:
+        raise ValueError(f"Fuente desconocida: {fuente} (use {' o '.join(FUENTES)})")
+
+    usadas = [DIMENSIONES[nombre] for nombre in (*dimensiones, *(nombre for nombre, _ in filtros))]
+    # La proyección ancha no tiene todas las dimensiones (la fecha de impuesto)
+    ancha = fuente == "ancha" and all(dimension.ancha is not None for dimension in usadas)
+
+    def columna(nombre):
+        dimension = DIMENSIONES[nombre]
+        return dimension.ancha if ancha else dimension.estrella
+
+    if ancha:
+        precio, stock = FactBookWide.price_before_tax, FactBookWide.stock_quantity
+    else:
+        precio, stock = DimPrice.price_before_tax, DimStock.quantity
+
+    columnas = [columna(nombre) for nombre in dimensiones]
+    consulta = select(
+        *(col.label(nombre) for col, nombre in zip(columnas, dimensiones)),
+        (func.grouping(*columnas) if columnas else literal(0)).label("_agrupacion"),
+        func.count().label("libros"),
+        func.sum(precio).label("suma_precio"),
+        func.avg(precio).label("precio_promedio"),
+        func.min(precio).label("precio_minimo"),
+        func.max(precio).label("precio_maximo"),
+        func.coalesce(func.sum(stock), 0).label("stock_total"),
+        func.coalesce(func.sum(precio * stock), 0).label("ingreso_potencial"),
+    )
+
+    if ancha:
+        consulta = consulta.select_from(FactBookWide)
+    else:
+        # Las mismas uniones que fact_books_wide, solo con las dimensiones necesarias;
+        # los libros sin categoría cuentan, con la categoría a NULL
+        consulta = (
+            consulta.select_from(FactBook)
+            .join(DimPrice, FactBook.price_id == DimPrice.id)
+            .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        )
+        tablas = {dimension.tabla for dimension in usadas}
+        if DimCategory in tablas:
+            consulta = consulta.outerjoin(DimCategory, FactBook.category_id == DimCategory.id)
+        if DimScore in tablas:
+            consulta = consulta.outerjoin(DimScore, FactBook.score_id == DimScore.id)
+        if DimTax in tablas:
+            consulta = consulta.outerjoin(DimTax, DimPrice.tax_id == DimTax.id)
+
+    for nombre, valores in filtros:
+        consulta = consulta.where(_condicion(columna(nombre), valores))
+    if columnas:
+        agrupar = func.rollup if tipo == "rollup" else func.cube
+        consulta = consulta.group_by(agrupar(*columnas))
+    return consulta
+
+
+class Celda(NamedTuple):
+    valores: Dict[str, Any]       # solo las dimensiones por las que está agrupada
+    medidas: Dict[str, Any]
+
+
+def _combinar(celdas: Iterable[Celda], dimensiones: Sequence[str]) -> List[Celda]:
+    """Reagrupa celdas por dimensiones; todas las medidas se pueden recombinar"""
+    grupos: Dict[tuple, Dict[str, Any]] = {}
+    for celda in celdas:
+        clave = tuple(celda.valores[nombre] for nombre in dimensiones)
+        medidas = celda.medidas
+        grupo = grupos.get(clave)
+        if grupo is None:
+            grupos[clave] = dict(medidas)
+            continue
+        for nombre in ("libros", "suma_precio", "stock_total", "ingreso_potencial"):
+            grupo[nombre] += medidas[nombre]
+        grupo["precio_minimo"] = min(grupo["precio_minimo"], medidas["precio_minimo"])
+        grupo["precio_maximo"] = max(grupo["precio_maximo"], medidas["precio_maximo"])
+    for grupo in grupos.values():
+        grupo["precio_promedio"] = grupo["suma_precio"] / grupo["libros"]
+    return [Celda(dict(zip(dimensiones, clave)), medidas) for clave, medidas in grupos.items()]
+
+
+def _orden(dimensiones: Sequence[str]):
+    """Detalle primero y subtotales después, como ROLLUP; los NULL reales al final de su nivel"""
+    def clave(valores: Dict[str, Any]):
+        return tuple(
+            (2,) if nombre not in valores
+            else (1,) if valores[nombre] is None
+            else (0, valores[nombre])
+            for nombre in dimensiones
+        )
+    return clave
+
+
+def _formatear(celda: Celda, medidas: Sequence[str]) -> Dict:
+    fila = dict(celda.valores)
+    for nombre in medidas:
+        valor = celda.medidas[nombre]
+        fila[nombre] = round(valor, 2) if nombre in _MEDIDAS_MONETARIAS and valor is not None else valor
+    return fila
+
+
+def conjuntos_de_agrupacion(dimensiones: Sequence[str], tipo: str) -> List[Tuple[str, ...]]:
+    """Los niveles que calcula ROLLUP (prefijos) o CUBE (todos los subconjuntos)"""
+    if tipo == "rollup":
+        return [tuple(dimensiones[:n]) for n in range(len(dimensiones), -1, -1)]
+    return [
+        conjunto
+        for n in range(len(dimensiones), -1, -1)
+        for conjunto in combinations(dimensiones, n)
+    ]
+
+
+class Cubo:
+    """
+    Resultado de un ROLLUP o CUBE en memoria. agregar() responde cualquier
+    nivel de sus dimensiones: lo toma directamente si la sentencia lo calculó
+    o lo reagrega desde el nivel calculado más pequeño que lo contiene (el
+    más detallado siempre está).
+    """
+
+    def __init__(self, dimensiones: Sequence[str], filtros: Filtros, tipo: str, celdas: List[Celda]):
+        self.dimensiones = tuple(dimensiones)
+        self.filtros = filtros
+        self.tipo = tipo
+        self.niveles: Dict[FrozenSet[str], List[Celda]] = {}
+        for celda in celdas:
+            self.niveles.setdefault(frozenset(celda.valores), []).append(celda)
+
+    @classmethod
+    def desde_filas(cls, dimensiones: Sequence[str], filtros: Filtros, tipo: str, filas) -> "Cubo":
+        celdas = []
+        for fila in filas:
+            fila = fila._mapping
+            agrupacion = fila["_agrupacion"]
+            valores = {
+                nombre: fila[nombre]
+                for posicion, nombre in enumerate(dimensiones)
+                if not agrupacion & (1 << (len(dimensiones) - 1 - posicion))
+            }
+            celdas.append(Celda(valores, {nombre: fila[nombre] for nombre in MEDIDAS}))
+        return cls(dimensiones, filtros, tipo, celdas)
+
+    @property
+    def celdas(self) -> int:
+        return sum(len(celdas) for celdas in self.niveles.values())
+
+    def cubre(self, dimensiones: Sequence[str], filtros: Filtros) -> bool:
+        """Si la consulta se puede responder desde este cubo"""
+        if not set(self.filtros) <= set(filtros):
+            return False
+        restantes = set(filtros) - set(self.filtros)
+        necesarias = set(dimensiones) | {nombre for nombre, _ in restantes}
+        return necesarias <= set(self.dimensiones)
+
+    def agregar(self, dimensiones: Sequence[str] = (), medidas: Optional[Sequence[str]] = None,
+                filtros: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Un nivel del cubo (drill-down, roll-up o corte) sin consultar la base de datos"""
+        medidas = _validar_medidas(medidas)
+        filtros = set(normalizar_filtros(filtros)) - set(self.filtros)
+        necesarias = set(dimensiones) | {nombre for nombre, _ in filtros}
+        if not necesarias <= set(self.dimensiones):
+            faltan = necesarias - set(self.dimensiones)
+            raise ValueError(f"El cubo no tiene las dimensiones {', '.join(sorted(faltan))}")
+
+        nivel = min(
+            (nivel for nivel in self.niveles if necesarias <= nivel),
+            key=lambda nivel: len(self.niveles[nivel])
+        )
+        celdas = [
+            celda for celda in self.niveles[nivel]
+            if all(celda.valores[nombre] in valores for nombre, valores in filtros)
+        ]
+        if nivel != set(dimensiones):
+            celdas = _combinar(celdas, dimensiones)
+        else:
+            celdas = [Celda({nombre: celda.valores[nombre] for nombre in dimensiones}, celda.medidas)
+                      for celda in celdas]
+        orden = _orden(dimensiones)
+        return [_formatear(celda, medidas) for celda in sorted(celdas, key=lambda celda: orden(celda.valores))]
+
+    def filas(self, medidas: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Todas las celdas calculadas, con los subtotales de cada nivel"""
+        medidas = _validar_medidas(medidas)
+        celdas = [celda for celdas in self.niveles.values() for celda in celdas]
+        orden = _orden(self.dimensiones)
+        return [_formatear(celda, medidas) for celda in sorted(celdas, key=lambda celda: orden(celda.valores))]
+
+
+class CacheCubos:
+    """Cubos calculados de la versión de datos actual, los más recientes primero"""
+
+    def __init__(self, capacidad: int = CUBO_CACHE_SIZE):
+        self.capacidad = capacidad
+        self._cubos: "OrderedDict[tuple, Cubo]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def buscar(self, version: int, fuente: str, dimensiones: Sequence[str], filtros: Filtros) -> Optional[Cubo]:
+        with self._lock:
+            if version != self._version:
+                self._cubos.clear()
+                self._version = version
+            candidatos = [
+                (clave, cubo) for clave, cubo in self._cubos.items()
+                if clave[0] == fuente and cubo.cubre(dimensiones, filtros)
+            ]
+            if not candidatos:
+                self.fallos += 1
+                return None
+            clave, cubo = min(candidatos, key=lambda candidato: candidato[1].celdas)
+            self._cubos.move_to_end(clave)
+            self.aciertos += 1
+            return cubo
+
+    def guardar(self, version: int, fuente: str, cubo: Cubo):
+        with self._lock:
+            if version != self._version:
+                self._cubos.clear()
+                self._version = version
+            self._cubos[(fuente, cubo.dimensiones, cubo.filtros, cubo.tipo)] = cubo
+            while len(self._cubos) > self.capacidad:
+                self._cubos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._cubos.clear()
+            self._version = None
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "cubos": len(self._cubos)}
+
+
+cubos = CacheCubos()
+
+
+def calcular_cubo(dimensiones: Sequence[str], filtros: Optional[Dict[str, Any]] = None,
+                  tipo: str = "rollup", fuente: Optional[str] = None) -> Cubo:
+    """Ejecuta el ROLLUP o CUBE de las dimensiones en un solo viaje a la base de datos"""
+    dimensiones = tuple(dimensiones)
+    filtros_normalizados = normalizar_filtros(filtros)
+    consulta = sentencia_cubo(dimensiones, filtros_normalizados, tipo, fuente)
+    with analytical_engine.connect() as conn:
+        filas = conn.execute(consulta).all()
+    return Cubo.desde_filas(dimensiones, filtros_normalizados, tipo, filas)
+
+
+def agregar(dimensiones: Sequence[str], medidas: Optional[Sequence[str]] = None,
+            filtros: Optional[Dict[str, Any]] = None, tipo: str = "rollup",
+            fuente: Optional[str] = None, cachear: bool = False) -> List[Dict]:
+    """
+    Las celdas del ROLLUP (o CUBE) de las dimensiones: una fila por
+    combinación de valores de cada nivel, con solo las claves de las
+    dimensiones por las que está agrupada (la fila sin dimensiones es el
+    total). Con cachear, se responde desde un cubo en memoria que la
+    contenga, o se calcula y se guarda.
+    """
+    dimensiones = tuple(dimensiones)
+    _validar_dimensiones(dimensiones)
+    medidas = _validar_medidas(medidas)
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo desconocido: {tipo} (use {' o '.join(TIPOS)})")
+    fuente = fuente or FUENTE_HECHOS
+    filtros_normalizados = normalizar_filtros(filtros)
+
+    version = cache.version_datos() if cachear and cache.activa else None
+    if version is None:
+        return calcular_cubo(dimensiones, filtros, tipo, fuente).filas(medidas)
+
+    cubo = cubos.buscar(version, fuente, dimensiones, filtros_normalizados)
+    if cubo is None:
+        cubo = calcular_cubo(dimensiones, filtros, tipo, fuente)
+        cubos.guardar(version, fuente, cubo)
+        return cubo.filas(medidas)
+
+    filas = []
+    for conjunto in conjuntos_de_agrupacion(dimensiones, tipo):
+        filas.extend(cubo.agregar(conjunto, medidas, filtros))
+    return sorted(filas, key=_orden(dimensiones))
+
+
+def estadisticas_cubos() -> Dict:
+    """Aciertos, fallos y cubos guardados de la caché de cubos"""
+    return cubos.estadisticas()
+
+
+def _parsear_filtros(textos: Sequence[str]) -> Dict[str, List[Any]]:
+    filtros: Dict[str, List[Any]] = {}
+    for texto in textos:
+        nombre, separador, valor = texto.partition("=")
+        if not separador or nombre not in DIMENSIONES:
+            raise SystemExit(f"Filtro inválido: {texto} (use dimensión=valor)")
+        filtros.setdefault(nombre, []).append(DIMENSIONES[nombre].convertir(valor))
+    return filtros
+
+
+def imprimir_filas(filas: List[Dict], dimensiones: Sequence[str], medidas: Sequence[str]):
+    print("  ".join(f"{nombre:>18}" for nombre in (*dimensiones, *medidas)))
+    for fila in filas:
+        valores = [
+            str(fila[nombre]) if nombre in fila else "(todos)"
+            for nombre in dimensiones
+        ] + [str(fila[nombre]) for nombre in medidas]
+        print("  ".join(f"{valor[:18]:>18}" for valor in valores))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agregaciones ROLLUP/CUBE sobre las dimensiones analíticas")
+    parser.add_argument("dimensiones", nargs="*", choices=list(DIMENSIONES), metavar="DIMENSION",
+                        help=f"Dimensiones en orden de jerarquía ({', '.join(DIMENSIONES)})")
+    parser.add_argument("--medidas", nargs="+", choices=MEDIDAS, default=list(MEDIDAS))
+    parser.add_argument("--tipo", choices=TIPOS, default="rollup")
+    parser.add_argument("--filtro", action="append", default=[], metavar="DIMENSION=VALOR",
+                        help="Solo los libros con ese valor (repetible; varios valores de una dimensión se combinan con OR)")
+    parser.add_argument("--fuente", choices=FUENTES, default=None)
+    args = parser.parse_args()
+
+    filas = agregar(args.dimensiones, args.medidas, _parsear_filtros(args.filtro), args.tipo, args.fuente)
+    imprimir_filas(filas, args.dimensiones, args.medidas)
@@ -0,0 +1,67 @@
+"""
+Async engines on the asyncpg driver.
+
+The URLs are the same ones the synchronous engines use (DATABASE_URL and
+ANALYTICAL_DATABASE_URL); only the driver is swapped. Each engine keeps a
+small pool (ASYNC_POOL_SIZE + ASYNC_MAX_OVERFLOW connections) that any
+number of coroutines on one event loop share; the ones that find it busy
+wait for a connection instead of needing a thread each.
+"""
+import os
+from contextlib import asynccontextmanager
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import DATABASE_URL
+from etl import ANALYTICAL_DB_URL, ANALYTICAL_SCHEMA
+
+
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "10"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW", "10"))
+
+
+def to_async_url(url: str):
+    """Same database URL with the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+def search_path_args(schema: str) -> dict:
+    """asyncpg connect_args equivalent to etl.search_path_args"""
+    return {} if schema == "public" else {"server_settings": {"search_path": schema}}
+
+
+transactional_async_engine = create_async_engine(
+    to_async_url(DATABASE_URL),
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=ASYNC_POOL_SIZE,
+    max_overflow=ASYNC_MAX_OVERFLOW
+)
+
+analytical_async_engine = create_async_engine(
+    to_async_url(ANALYTICAL_DB_URL),
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=ASYNC_POOL_SIZE,
+    max_overflow=ASYNC_MAX_OVERFLOW,
+    connect_args=search_path_args(ANALYTICAL_SCHEMA)
+)
+
+
+@asynccontextmanager
+async def get_async_session(engine=None):
+    """
+    Async counterpart of database.get_session, on the transactional database
+    by default. Objects stay loaded after commit, since an expired attribute
+    cannot be refreshed implicitly under asyncio.
+    """
+    async with AsyncSession(engine or transactional_async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def dispose_async_engines():
+    """Close the pooled connections, before the event loop that opened them ends"""
+    await transactional_async_engine.dispose()
+    await analytical_async_engine.dispose()
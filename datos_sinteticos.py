@@ -0,0 +1,181 @@
+"""
+Hechos sintéticos para pruebas de rendimiento de la base analítica.
+
+Genera libros directamente en fact_books y sus dimensiones con
+generate_series, sin pasar por el scraper ni por el ETL, para poder medir
+los análisis a 10k, 100k o 1M de hechos. Los libros sintéticos llevan el
+prefijo SINT- en el UPC y sus categorías el prefijo "Sintética", de modo
+que se pueden borrar sin tocar los datos reales.
+
+Uso:
+  python datos_sinteticos.py --libros 100000
+  python datos_sinteticos.py --limpiar
+"""
+import argparse
+import time
+from datetime import datetime
+
+from sqlalchemy import column, text
+from sqlalchemy.dialects import postgresql
+
+from aggregates import refresh_aggregates
+from etl import (
+    analytical_engine, bump_data_version, create_analytical_tables,
+    price_range_case, stock_status_case, upsert_dimension
+)
+from models_analytical import DimTax
+
+
+PREFIJO_UPC = "SINT-"
+PREFIJO_CATEGORIA = "Sintética"
+NUM_CATEGORIAS = 50
+# Impuesto propio de los datos sintéticos, para poder borrar sus precios
+IMPUESTO_SINTETICO = 0.16
+FECHA_IMPUESTO_SINTETICO = datetime(2000, 1, 1)
+# Uno de cada DUPLICADOS_CADA libros repite el título del anterior
+DUPLICADOS_CADA = 100
+
+
+def _sql(expresion) -> str:
+    """Compila una expresión de SQLAlchemy a SQL literal de PostgreSQL"""
+    return str(expresion.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True}
+    ))
+
+
+def generar_hechos(num_libros: int, semilla: float = 0.42) -> int:
+    """
+    Inserta num_libros libros sintéticos con sus dimensiones y refresca los
+    agregados. Las categorías siguen una distribución sesgada, los precios
+    van de 10.00 a 60.00 y el stock de 0 a 22, como en books.toscrape.com.
+    """
+    create_analytical_tables()
+    stock_status = _sql(stock_status_case(column("quantity")))
+    price_range = _sql(price_range_case(column("precio")))
+
+    with analytical_engine.begin() as conn:
+        # La semilla hace que random() sea reproducible en esta sesión
+        conn.execute(text("SELECT setseed(:semilla)"), {"semilla": semilla})
+
+        conn.execute(text(
+            "INSERT INTO dim_category (name) "
+            "SELECT :prefijo || ' ' || lpad(n::text, 2, '0') FROM generate_series(1, :n) n "
+            "ON CONFLICT (name) DO NOTHING"
+        ), {"prefijo": PREFIJO_CATEGORIA, "n": NUM_CATEGORIAS})
+
+        conn.execute(text(
+            f"INSERT INTO dim_stock (quantity, stock_status) "
+            f"SELECT quantity, {stock_status} FROM generate_series(0, 22) quantity "
+            f"ON CONFLICT ON CONSTRAINT uq_dim_stock_natural_key DO NOTHING"
+        ))
+        conn.execute(text(
+            "INSERT INTO dim_score (score) SELECT s FROM generate_series(1, 5) s "
+            "ON CONFLICT (score) DO NOTHING"
+        ))
+
+        tax_id = upsert_dimension(
+            conn, DimTax, tax_rate=IMPUESTO_SINTETICO, date=FECHA_IMPUESTO_SINTETICO
+        )
+
+        # Un miembro de dim_price por cada precio posible, en centavos
+        conn.execute(text(
+            f"INSERT INTO dim_price (price_before_tax, price_after_tax, price_range, tax_id) "
+            f"SELECT precio, round((precio * (1 + :impuesto))::numeric, 2)::float, "
+            f"{price_range}, :tax_id "
+            f"FROM (SELECT (c / 100.0)::float AS precio FROM generate_series(1000, 6000) c) p "
+            f"ON CONFLICT ON CONSTRAINT uq_dim_price_natural_key DO NOTHING"
+        ), {"impuesto": IMPUESTO_SINTETICO, "tax_id": tax_id})
+
+        # Sin estadísticas de las dimensiones recién llenadas el planificador
+        # elige bucles anidados y la inserción masiva se vuelve cuadrática
+        conn.execute(text("ANALYZE dim_category, dim_stock, dim_score, dim_price"))
+
+        inicio = conn.execute(text(
+            "SELECT count(*) FROM fact_books WHERE upc LIKE :prefijo || '%'"
+        ), {"prefijo": PREFIJO_UPC}).scalar_one()
+
+        # random()^2 concentra los libros en las primeras categorías
+        resultado = conn.execute(text("""
+            WITH categorias AS (
+                SELECT id, row_number() OVER (ORDER BY name) - 1 AS posicion
+                FROM dim_category WHERE name LIKE :prefijo_categoria || ' %'
+            ),
+            precios AS (
+                SELECT id, round(price_before_tax * 100)::int AS centavos
+                FROM dim_price WHERE tax_id = :tax_id
+            ),
+            libros AS (
+                SELECT n,
+                       floor(power(random(), 2) * :num_categorias)::int AS categoria,
+                       1000 + floor(random() * 5001)::int AS centavos,
+                       floor(random() * 23)::int AS stock,
+                       1 + floor(random() * 5)::int AS puntuacion
+                FROM generate_series(:desde, :hasta) n
+            )
+            INSERT INTO fact_books (upc, title, description, image_url,
+                                    category_id, stock_id, score_id, price_id)
+            SELECT :prefijo_upc || lpad(l.n::text, 9, '0'),
+                   'Libro sintético ' || CASE WHEN l.n % :duplicados = 0 THEN l.n - 1 ELSE l.n END,
+                   '', '',
+                   c.id, s.id, sc.id, p.id
+            FROM libros l
+            JOIN categorias c ON c.posicion = l.categoria
+            JOIN precios p ON p.centavos = l.centavos
+            JOIN dim_stock s ON s.quantity = l.stock
+            JOIN dim_score sc ON sc.score = l.puntuacion
+            ON CONFLICT (upc) DO NOTHING
+        """), {
+            "prefijo_categoria": PREFIJO_CATEGORIA,
+            "prefijo_upc": PREFIJO_UPC,
+            "tax_id": tax_id,
+            "num_categorias": NUM_CATEGORIAS,
+            "duplicados": DUPLICADOS_CADA,
+            "desde": inicio + 1,
+            "hasta": inicio + num_libros,
+        })
+        insertados = resultado.rowcount
+        conn.execute(text("ANALYZE fact_books"))
+
+        refresh_aggregates(conn)
+    bump_data_version()
+    return insertados
+
+
+def limpiar_hechos() -> int:
+    """Borra los libros sintéticos, sus categorías y sus precios"""
+    with analytical_engine.begin() as conn:
+        borrados = conn.execute(text(
+            "DELETE FROM fact_books WHERE upc LIKE :prefijo || '%'"
+        ), {"prefijo": PREFIJO_UPC}).rowcount
+        conn.execute(text(
+            "DELETE FROM dim_price WHERE tax_id IN "
+            "(SELECT id FROM dim_tax WHERE tax_rate = :impuesto AND date = :fecha)"
+        ), {"impuesto": IMPUESTO_SINTETICO, "fecha": FECHA_IMPUESTO_SINTETICO})
+        conn.execute(text(
+            "DELETE FROM dim_tax WHERE tax_rate = :impuesto AND date = :fecha"
+        ), {"impuesto": IMPUESTO_SINTETICO, "fecha": FECHA_IMPUESTO_SINTETICO})
+        conn.execute(text(
+            "DELETE FROM dim_category WHERE name LIKE :prefijo || ' %'"
+        ), {"prefijo": PREFIJO_CATEGORIA})
+        refresh_aggregates(conn)
+    bump_data_version()
+    return borrados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera hechos sintéticos en la base analítica")
+    parser.add_argument("--libros", type=int, default=10_000,
+                        help="Número de libros sintéticos a generar")
+    parser.add_argument("--semilla", type=float, default=0.42,
+                        help="Semilla de random() entre -1 y 1")
+    parser.add_argument("--limpiar", action="store_true",
+                        help="Borra los libros sintéticos en lugar de generarlos")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.limpiar:
+        print(f"Libros sintéticos borrados: {limpiar_hechos()}")
+    else:
+        print(f"Libros sintéticos generados: {generar_hechos(args.libros, args.semilla)}")
+    print(f"Tiempo: {time.perf_counter() - inicio:.2f}s")
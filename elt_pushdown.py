@@ -0,0 +1,352 @@
+"""
+In-database ELT for co-located transactional and analytical schemas.
+
+Builds the same snowflake schema as transfer_data_to_analytical, but with
+set-based SQL executed by the analytical database. The transactional tables
+must be reachable from it, either because both live in the same database
+(in the same or in different schemas) or through a postgres_fdw foreign
+schema created with setup_foreign_source.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, String, Table,
+    and_, case, exists, func, insert, inspect, literal, select, text
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import make_url
+from sqlmodel import Session
+
+from database import DATABASE_URL
+from etl import (
+    analytical_engine, bump_data_version, count_rows, load_lock, price_range_case,
+    record_etl_run, stock_status_case, upsert_dimension
+)
+from aggregates import refresh_aggregates
+from instrumentation import EtlRunMetrics
+from models_analytical import (
+    FactBook, DimCategory, DimStock, DimScore, DimPrice, DimTax
+)
+from models_transactional import Book, Category, Stock, Scores, TaxRate
+from snapshots import write_snapshot_from
+
+
+# Schema of the analytical database where the transactional tables are found
+ELT_SOURCE_SCHEMA = os.getenv("ELT_SOURCE_SCHEMA", "public")
+
+FOREIGN_SERVER_NAME = "transactional_server"
+
+SOURCE_MODELS = (Category, Book, Stock, Scores, TaxRate)
+
+
+def source_tables(schema: str) -> dict:
+    """Copies of the transactional tables bound to the given schema"""
+    metadata = MetaData()
+    return {
+        model.__tablename__: model.__table__.to_metadata(metadata, schema=schema)
+        for model in SOURCE_MODELS
+    }
+
+
+def _staging_table() -> Table:
+    """Temporary table holding the transformed books of a single ELT run"""
+    return Table(
+        "elt_staged_books", MetaData(),
+        Column("upc", String),
+        Column("title", String),
+        Column("description", String),
+        Column("image_url", String),
+        Column("category_name", String),
+        Column("quantity", Integer),
+        Column("stock_status", String),
+        Column("score", Float),
+        Column("price_before_tax", Float),
+        Column("price_after_tax", Float),
+        Column("price_range", String),
+        prefixes=["TEMPORARY"],
+        postgresql_on_commit="DROP"
+    )
+
+
+def staged_books_query(src: dict, tax_multiplier: float):
+    """
+    Transform every source book into its dimension values,
+    applying the same rules as etl.transform_book
+    """
+    books = src["books"]
+    categories = src["categories"]
+    stocks = src["stocks"]
+    scores = src["scores"]
+
+    # A stock row wins over books.stock_int, which only counts when non-zero
+    quantity = case(
+        (stocks.c.id.is_not(None), stocks.c.quantity),
+        (books.c.stock_int != 0, books.c.stock_int)
+    )
+
+    return (
+        select(
+            books.c.upc,
+            books.c.title,
+            books.c.description,
+            books.c.image_url,
+            categories.c.name,
+            quantity,
+            case((quantity.is_not(None), stock_status_case(quantity))),
+            scores.c.score,
+            books.c.price,
+            books.c.price * literal(tax_multiplier, Float),
+            price_range_case(books.c.price)
+        )
+        .select_from(
+            books
+            .outerjoin(categories, books.c.category_id == categories.c.id)
+            .outerjoin(stocks, stocks.c.book_id == books.c.id)
+            .outerjoin(scores, scores.c.book_id == books.c.id)
+        )
+        .where(books.c.price.is_not(None))
+    )
+
+
+def _insert_missing(session, model_class, columns: dict, where=None) -> int:
+    """INSERT ... SELECT DISTINCT the staged dimension values, skipping existing natural keys"""
+    query = select(*(expr.label(name) for name, expr in columns.items())).distinct()
+    if where is not None:
+        query = query.where(where)
+
+    result = session.execute(
+        pg_insert(model_class)
+        .from_select(list(columns), query)
+        .on_conflict_do_nothing(index_elements=list(columns))
+    )
+    return result.rowcount
+
+
+def load_staged_books(session, staged: Table, dim_tax_id: int) -> int:
+    """Fill the dimensions and fact_books from the staged books"""
+    _insert_missing(
+        session, DimCategory,
+        {"name": staged.c.category_name},
+        where=staged.c.category_name.is_not(None)
+    )
+    _insert_missing(
+        session, DimStock,
+        {"quantity": staged.c.quantity, "stock_status": staged.c.stock_status},
+        where=staged.c.quantity.is_not(None)
+    )
+    _insert_missing(
+        session, DimScore,
+        {"score": staged.c.score},
+        where=staged.c.score.is_not(None)
+    )
+    _insert_missing(
+        session, DimPrice,
+        {
+            "price_before_tax": staged.c.price_before_tax,
+            "price_after_tax": staged.c.price_after_tax,
+            "price_range": staged.c.price_range,
+            "tax_id": literal(dim_tax_id)
+        }
+    )
+
+    facts = (
+        select(
+            staged.c.upc,
+            staged.c.title,
+            staged.c.description,
+            staged.c.image_url,
+            DimCategory.id,
+            DimStock.id,
+            DimScore.id,
+            DimPrice.id
+        )
+        .select_from(staged)
+        .outerjoin(DimCategory, DimCategory.name == staged.c.category_name)
+        .outerjoin(DimStock, and_(
+            DimStock.quantity == staged.c.quantity,
+            DimStock.stock_status == staged.c.stock_status
+        ))
+        .outerjoin(DimScore, DimScore.score == staged.c.score)
+        .join(DimPrice, and_(
+            DimPrice.price_before_tax == staged.c.price_before_tax,
+            DimPrice.price_after_tax == staged.c.price_after_tax,
+            DimPrice.price_range == staged.c.price_range,
+            DimPrice.tax_id == dim_tax_id
+        ))
+    )
+
+    result = session.execute(
+        pg_insert(FactBook)
+        .from_select(
+            ["upc", "title", "description", "image_url",
+             "category_id", "stock_id", "score_id", "price_id"],
+            facts
+        )
+        .on_conflict_do_nothing(index_elements=["upc"])
+    )
+    return result.rowcount
+
+
+def check_source_schema(schema: str):
+    """Fail early when the transactional tables are not visible from the analytical database"""
+    inspector = inspect(analytical_engine)
+    missing = [
+        model.__tablename__ for model in SOURCE_MODELS
+        if not inspector.has_table(model.__tablename__, schema=schema)
+    ]
+    if missing:
+        raise RuntimeError(
+            f"Transactional tables {', '.join(missing)} not found in schema '{schema}' "
+            "of the analytical database. Use a shared database or run "
+            "setup_foreign_source() to import them through postgres_fdw."
+        )
+
+
+def setup_foreign_source(schema: str = "transactional"):
+    """
+    Import the transactional tables into a local schema of the analytical
+    database through postgres_fdw, using the connection data of DATABASE_URL
+    """
+    if schema == "public":
+        raise ValueError("Import the foreign tables into a dedicated schema, not public")
+
+    url = make_url(DATABASE_URL)
+    host = url.host or url.query.get("host", "localhost")
+
+    def quote_literal(value) -> str:
+        return "'" + str(value).replace("'", "''") + "'"
+
+    with analytical_engine.begin() as conn:
+        preparer = conn.dialect.identifier_preparer
+        quoted_schema = preparer.quote(schema)
+        server = preparer.quote(FOREIGN_SERVER_NAME)
+
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgres_fdw"))
+        conn.execute(text(
+            f"CREATE SERVER IF NOT EXISTS {server} FOREIGN DATA WRAPPER postgres_fdw "
+            f"OPTIONS (host {quote_literal(host)}, port {quote_literal(url.port or 5432)}, "
+            f"dbname {quote_literal(url.database)})"
+        ))
+        mapping_options = f"user {quote_literal(url.username)}"
+        if url.password:
+            mapping_options += f", password {quote_literal(url.password)}"
+        conn.execute(text(
+            f"CREATE USER MAPPING IF NOT EXISTS FOR CURRENT_USER SERVER {server} "
+            f"OPTIONS ({mapping_options})"
+        ))
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {quoted_schema}"))
+
+        table_names = [model.__tablename__ for model in SOURCE_MODELS]
+        for name in table_names:
+            conn.execute(text(f"DROP FOREIGN TABLE IF EXISTS {quoted_schema}.{preparer.quote(name)}"))
+        conn.execute(text(
+            f"IMPORT FOREIGN SCHEMA public LIMIT TO ({', '.join(table_names)}) "
+            f"FROM SERVER {server} INTO {quoted_schema}"
+        ))
+
+    print(f"Transactional tables imported into schema '{schema}'")
+
+
+def transfer_data_to_analytical_elt(source_schema: str = None) -> dict:
+    """
+    Build the snowflake schema inside the database with set-based SQL.
+    Produces the same dimensions and facts as transfer_data_to_analytical.
+    """
+    source_schema = source_schema or ELT_SOURCE_SCHEMA
+
+    print("\n" + "="*50)
+    print(f"Starting in-database ELT (source schema: {source_schema})")
+    print("="*50)
+
+    check_source_schema(source_schema)
+    src = source_tables(source_schema)
+
+    metrics = EtlRunMetrics(analytical_engine, mode="elt")
+    try:
+        with load_lock(), metrics, Session(analytical_engine) as session:
+            # 1. Latest tax rate and number of source books
+            with metrics.stage("extract"):
+                tax_rates = src["tax_rates"]
+                latest_tax = session.execute(
+                    select(tax_rates.c.tax_float, tax_rates.c.date)
+                    .order_by(tax_rates.c.date.desc())
+                    .limit(1)
+                ).first()
+                books = src["books"]
+                total_books, skipped = session.execute(
+                    select(
+                        func.count(),
+                        func.count().filter(exists().where(FactBook.upc == books.c.upc))
+                    ).select_from(books)
+                ).one()
+            metrics.counts["extracted"] = total_books
+            metrics.set_rows("extract", total_books)
+            print(f"\nFound {total_books} books in the transactional schema")
+
+            if latest_tax:
+                tax_float, tax_date = latest_tax
+            else:
+                print("Warning: No tax rate found, using default 0.0")
+                tax_float, tax_date = 0.0, datetime.now()
+
+            # 2. Stage the transformed books
+            with metrics.stage("transform"):
+                staged = _staging_table()
+                staged.create(session.connection())
+                staged_rows = session.execute(insert(staged).from_select(
+                    [column.name for column in staged.columns],
+                    staged_books_query(src, 1 + tax_float)
+                )).rowcount
+                session.execute(text(f"ANALYZE {staged.name}"))
+            metrics.set_rows("transform", staged_rows)
+
+            # The staged table is dropped on commit, so the history goes first
+            with metrics.stage("snapshot"):
+                snapshots = write_snapshot_from(session.connection(), metrics.started_at, select(
+                    staged.c.upc, staged.c.title, staged.c.category_name,
+                    staged.c.price_before_tax, staged.c.price_after_tax, staged.c.price_range,
+                    literal(tax_float, Float).label("tax_rate"),
+                    staged.c.quantity, staged.c.stock_status, staged.c.score
+                ))
+            metrics.set_rows("snapshot", snapshots)
+
+            # 3. Set-based load of dimensions and facts
+            with metrics.stage("load"):
+                dim_tax_id = upsert_dimension(
+                    session, DimTax, tax_rate=tax_float, date=tax_date
+                )
+                transferred = load_staged_books(session, staged, dim_tax_id)
+                session.commit()
+            metrics.set_rows("load", transferred)
+
+            with metrics.stage("refresh"):
+                refresh_aggregates(session.connection())
+                session.commit()
+                bump_data_version()
+
+            metrics.counts.update(
+                transferred=transferred,
+                skipped=skipped,
+                failed=total_books - skipped - transferred
+            )
+
+            print("\n" + "="*50)
+            print("ELT Process Complete!")
+            print(f"Transferred: {transferred} books")
+            print(f"Skipped (already exists): {skipped} books")
+            print("="*50)
+
+            print("\nAnalytical Database Summary:")
+            print(f"Total Fact Records: {count_rows(session, FactBook)}")
+            print(f"Total Categories: {count_rows(session, DimCategory)}")
+            print(f"Total Stock Dimensions: {count_rows(session, DimStock)}")
+    finally:
+        print("\nELT Run Metrics:")
+        print(metrics.to_json())
+        try:
+            record_etl_run(metrics)
+        except Exception as e:
+            print(f"Warning: could not record ELT run: {e}")
+
+    return metrics.to_dict()
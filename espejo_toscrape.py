@@ -0,0 +1,329 @@
+"""
+Espejo local de books.toscrape.com para medir el scraper sin salir a internet.
+
+Sirve un catálogo generado de forma determinista (misma semilla, mismas
+páginas) con la estructura HTML del sitio real, de modo que las XPath de
+scraper.py funcionan sin cambios: portada con la lista de categorías,
+páginas de categoría de 20 libros con paginación (page-2.html, ...) y una
+página por libro.
+
+Se pueden inyectar fallos para probar el rendimiento y los reintentos:
+  --latencia / --variacion   milisegundos de espera antes de cada respuesta
+  --tasa-errores             fracción de peticiones que responden 503
+  --limite                   peticiones por segundo; el exceso recibe 429 con Retry-After
+
+GET /_espejo/estadisticas devuelve los contadores de peticiones del espejo.
+
+Uso:
+  python espejo_toscrape.py --libros 5000 --puerto 8081 --latencia 50 --tasa-errores 0.01
+  python scraper.py --url http://127.0.0.1:8081/index.html
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import random
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+LIBROS_POR_PAGINA = 20
+
+# Las categorías de books.toscrape.com, en el orden de su barra lateral
+CATEGORIAS = [
+    "Travel", "Mystery", "Historical Fiction", "Sequential Art", "Classics",
+    "Philosophy", "Romance", "Womens Fiction", "Fiction", "Childrens",
+    "Religion", "Nonfiction", "Music", "Default", "Science Fiction",
+    "Sports and Games", "Add a comment", "Fantasy", "New Adult", "Young Adult",
+    "Science", "Poetry", "Paranormal", "Art", "Psychology",
+    "Autobiography", "Parenting", "Adult Fiction", "Humor", "Horror",
+    "History", "Food and Drink", "Christian Fiction", "Business", "Biography",
+    "Thriller", "Contemporary", "Spirituality", "Academic", "Self Help",
+    "Historical", "Christian", "Suspense", "Short Stories", "Novels",
+    "Health", "Politics", "Cultural", "Erotica", "Crime",
+]
+
+PUNTUACIONES = ["One", "Two", "Three", "Four", "Five"]
+
+PALABRAS = (
+    "the a of and night river house garden secret letter city winter summer "
+    "light shadow story king queen girl boy last first lost found road sea "
+    "star fire stone dream heart world time war peace book"
+).split()
+
+# GIF transparente de 1x1 para las portadas
+IMAGEN = bytes.fromhex(
+    "47494638396101000100800000000000ffffff21f90401000000002c00000000"
+    "010001000002024401003b"
+)
+
+
+def _slug(texto: str) -> str:
+    return "-".join("".join(c if c.isalnum() else " " for c in texto.lower()).split())
+
+
+class Catalogo:
+    """
+    Catálogo generado: cada libro se deriva de la semilla y de su número, así
+    que solo se guarda a qué categoría pertenece cada uno
+    """
+
+    def __init__(self, num_libros: int = 1000, num_categorias: int = len(CATEGORIAS),
+                 semilla: int = 42):
+        self.num_libros = num_libros
+        self.semilla = semilla
+        self.categorias = [
+            CATEGORIAS[i] if i < len(CATEGORIAS) else f"Category {i + 1}"
+            for i in range(num_categorias)
+        ]
+        generador = random.Random(semilla)
+        self.libros_por_categoria: List[array] = [array("i") for _ in self.categorias]
+        self.categoria_de = array("i")
+        for libro in range(1, num_libros + 1):
+            # Pocas categorías grandes y muchas pequeñas, como en el sitio real
+            categoria = int(generador.random() ** 3 * num_categorias)
+            self.categoria_de.append(categoria)
+            self.libros_por_categoria[categoria].append(libro)
+
+    def libro(self, libro: int) -> Dict:
+        generador = random.Random(f"{self.semilla}-{libro}")
+        titulo = " ".join(generador.choice(PALABRAS) for _ in range(generador.randint(2, 6))).title()
+        precio = generador.randint(1000, 6000) / 100
+        return {
+            "id": libro,
+            "upc": hashlib.md5(f"{self.semilla}-{libro}".encode()).hexdigest()[:16],
+            "titulo": titulo,
+            "slug": f"{_slug(titulo)}_{libro}",
+            "precio": precio,
+            # Un 5% agotado; el resto de 1 a 22, concentrado en valores bajos
+            "stock": 0 if generador.random() < 0.05 else 1 + int(generador.random() ** 2 * 22),
+            "puntuacion": generador.choice(PUNTUACIONES),
+            "descripcion": " ".join(generador.choice(PALABRAS) for _ in range(generador.randint(40, 250))),
+            "categoria": self.categoria_de[libro - 1],
+        }
+
+    def url_categoria(self, categoria: int, pagina: int = 1) -> str:
+        nombre = "index.html" if pagina == 1 else f"page-{pagina}.html"
+        return f"/catalogue/category/books/{_slug(self.categorias[categoria])}_{categoria + 2}/{nombre}"
+
+
+def _pagina(titulo: str, cuerpo: str) -> str:
+    return (
+        "<!DOCTYPE html><html lang=\"en-us\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(titulo)} | Books to Scrape - Sandbox</title></head>"
+        "<body id=\"default\" class=\"default\">"
+        "<header class=\"header container-fluid\"><div class=\"page_inner\"><div class=\"row\">"
+        "<div class=\"col-sm-8 h1\"><a href=\"/index.html\">Books to Scrape</a></div>"
+        "</div></div></header>"
+        f"<div class=\"container-fluid page\"><div class=\"page_inner\">{cuerpo}</div></div>"
+        "</body></html>"
+    )
+
+
+def _barra_lateral(catalogo: Catalogo) -> str:
+    enlaces = "".join(
+        f"<li><a href=\"{catalogo.url_categoria(i)}\">{html.escape(nombre)}</a></li>"
+        for i, nombre in enumerate(catalogo.categorias)
+    )
+    return (
+        "<aside class=\"sidebar col-sm-4 col-md-3\"><div id=\"promotions_left\"></div>"
+        "<div class=\"side_categories\"><ul class=\"nav nav-list\"><li>"
+        "<a href=\"/catalogue/category/books_1/index.html\">Books</a>"
+        f"<ul>{enlaces}</ul></li></ul></div></aside>"
+    )
+
+
+def _listado(catalogo: Catalogo, titulo: str, libros, pagina: int, url_pagina) -> str:
+    paginas = max(1, -(-len(libros) // LIBROS_POR_PAGINA))
+    if pagina < 1 or pagina > paginas:
+        raise web.HTTPNotFound()
+    desde = (pagina - 1) * LIBROS_POR_PAGINA
+    articulos = []
+    for numero in libros[desde:desde + LIBROS_POR_PAGINA]:
+        libro = catalogo.libro(numero)
+        url = f"/catalogue/{libro['slug']}/index.html"
+        articulos.append(
+            "<li class=\"col-xs-6 col-sm-4 col-md-3 col-lg-3\"><article class=\"product_pod\">"
+            f"<div class=\"image_container\"><a href=\"{url}\"><img src=\"/media/cache/{libro['upc']}.jpg\" "
+            f"alt=\"{html.escape(libro['titulo'])}\" class=\"thumbnail\"></a></div>"
+            f"<p class=\"star-rating {libro['puntuacion']}\"></p>"
+            f"<h3><a href=\"{url}\" title=\"{html.escape(libro['titulo'])}\">{html.escape(libro['titulo'])}</a></h3>"
+            f"<div class=\"product_price\"><p class=\"price_color\">£{libro['precio']:.2f}</p></div>"
+            "</article></li>"
+        )
+    paginador = f"<li class=\"current\">Page {pagina} of {paginas}</li>"
+    if pagina > 1:
+        paginador = f"<li class=\"previous\"><a href=\"{url_pagina(pagina - 1)}\">previous</a></li>" + paginador
+    if pagina < paginas:
+        paginador += f"<li class=\"next\"><a href=\"{url_pagina(pagina + 1)}\">next</a></li>"
+    return _pagina(titulo, (
+        "<ul class=\"breadcrumb\"><li><a href=\"/index.html\">Home</a></li></ul>"
+        f"<div class=\"row\">{_barra_lateral(catalogo)}<div class=\"col-sm-8 col-md-9\">"
+        f"<div class=\"page-header action\"><h1>{html.escape(titulo)}</h1></div>"
+        "<div id=\"messages\"></div><div id=\"promotions\"></div><section>"
+        f"<div class=\"alert alert-warning\" role=\"alert\"><strong>{len(libros)}</strong> results.</div>"
+        f"<div><ol class=\"row\">{''.join(articulos)}</ol>"
+        f"<div><ul class=\"pager\">{paginador}</ul></div></div>"
+        "</section></div></div>"
+    ))
+
+
+def _html(texto: str) -> web.Response:
+    return web.Response(text=texto, content_type="text/html")
+
+
+async def portada(request):
+    catalogo: Catalogo = request.app["catalogo"]
+    pagina = int(request.match_info.get("pagina", 1))
+    return _html(_listado(
+        catalogo, "All products", range(1, catalogo.num_libros + 1), pagina,
+        lambda n: "/index.html" if n == 1 else f"/catalogue/page-{n}.html"
+    ))
+
+
+async def categoria(request):
+    catalogo: Catalogo = request.app["catalogo"]
+    indice = int(request.match_info["id"]) - 2
+    if not 0 <= indice < len(catalogo.categorias):
+        raise web.HTTPNotFound()
+    pagina = int(request.match_info.get("pagina", 1))
+    return _html(_listado(
+        catalogo, catalogo.categorias[indice], catalogo.libros_por_categoria[indice], pagina,
+        lambda n: catalogo.url_categoria(indice, n)
+    ))
+
+
+async def libro(request):
+    catalogo: Catalogo = request.app["catalogo"]
+    numero = int(request.match_info["id"])
+    if not 1 <= numero <= catalogo.num_libros:
+        raise web.HTTPNotFound()
+    datos = catalogo.libro(numero)
+    titulo = html.escape(datos["titulo"])
+    nombre_categoria = catalogo.categorias[datos["categoria"]]
+    disponibilidad = f"In stock ({datos['stock']} available)" if datos["stock"] else "Out of stock"
+    filas = [
+        ("UPC", datos["upc"]),
+        ("Product Type", "Books"),
+        ("Price (excl. tax)", f"£{datos['precio']:.2f}"),
+        ("Price (incl. tax)", f"£{datos['precio']:.2f}"),
+        ("Tax", "£0.00"),
+        ("Availability", disponibilidad),
+        ("Number of reviews", "0"),
+    ]
+    tabla = "".join(f"<tr><th>{campo}</th><td>{valor}</td></tr>" for campo, valor in filas)
+    return _html(_pagina(datos["titulo"], (
+        "<ul class=\"breadcrumb\"><li><a href=\"/index.html\">Home</a></li>"
+        f"<li><a href=\"{catalogo.url_categoria(datos['categoria'])}\">{html.escape(nombre_categoria)}</a></li>"
+        f"<li class=\"active\">{titulo}</li></ul>"
+        "<div id=\"messages\"></div><div class=\"content\"><div id=\"promotions\"></div>"
+        "<div id=\"content_inner\"><article class=\"product_page\"><div class=\"row\">"
+        "<div class=\"col-sm-6\"><div id=\"product_gallery\" class=\"carousel\"><div class=\"thumbnail\">"
+        "<div class=\"carousel-inner\"><div class=\"item active\">"
+        f"<img src=\"/media/cache/{datos['upc']}.jpg\" alt=\"{titulo}\"></div></div></div></div></div>"
+        f"<div class=\"col-sm-6 product_main\"><h1>{titulo}</h1>"
+        f"<p class=\"price_color\">£{datos['precio']:.2f}</p>"
+        f"<p class=\"instock availability\">{disponibilidad}</p>"
+        f"<p class=\"star-rating {datos['puntuacion']}\"></p><hr></div></div>"
+        "<div id=\"product_description\" class=\"sub-header\"><h2>Product Description</h2></div>"
+        f"<p>{html.escape(datos['descripcion'])}</p>"
+        "<div class=\"sub-header\"><h2>Product Information</h2></div>"
+        f"<table class=\"table table-striped\"><tbody>{tabla}</tbody></table>"
+        "</article></div></div>"
+    )))
+
+
+async def imagen(request):
+    return web.Response(body=IMAGEN, content_type="image/gif")
+
+
+async def estadisticas(request):
+    return web.json_response(dict(request.app["estadisticas"]))
+
+
+class LimiteTasa:
+    """Cubeta de fichas global: como mucho `tasa` peticiones por segundo, con ráfagas de `tasa`"""
+
+    def __init__(self, tasa: float):
+        self.tasa = tasa
+        self.fichas = tasa
+        self.actualizado = time.monotonic()
+
+    def permitir(self) -> bool:
+        ahora = time.monotonic()
+        self.fichas = min(self.tasa, self.fichas + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+        if self.fichas >= 1:
+            self.fichas -= 1
+            return True
+        return False
+
+
+@web.middleware
+async def inyectar_fallos(request, handler):
+    app = request.app
+    contadores: Counter = app["estadisticas"]
+    if request.path.startswith("/_espejo/"):
+        return await handler(request)
+
+    contadores["peticiones"] += 1
+    limite: Optional[LimiteTasa] = app["limite"]
+    if limite is not None and not limite.permitir():
+        contadores["limitadas_429"] += 1
+        return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+
+    if app["latencia"] or app["variacion"]:
+        espera = max(0.0, random.gauss(app["latencia"], app["variacion"])) / 1000
+        await asyncio.sleep(espera)
+
+    if app["tasa_errores"] and random.random() < app["tasa_errores"]:
+        contadores["errores_503"] += 1
+        return web.Response(status=503, text="Service Unavailable")
+
+    respuesta = await handler(request)
+    contadores[f"respuestas_{respuesta.status}"] += 1
+    return respuesta
+
+
+def crear_app(num_libros: int = 1000, num_categorias: int = len(CATEGORIAS), semilla: int = 42,
+              latencia: float = 0.0, variacion: float = 0.0, tasa_errores: float = 0.0,
+              limite: Optional[float] = None) -> web.Application:
+    app = web.Application(middlewares=[inyectar_fallos])
+    app["catalogo"] = Catalogo(num_libros, num_categorias, semilla)
+    app["latencia"] = latencia
+    app["variacion"] = variacion
+    app["tasa_errores"] = tasa_errores
+    app["limite"] = LimiteTasa(limite) if limite else None
+    app["estadisticas"] = Counter()
+    app.router.add_get("/", portada)
+    app.router.add_get("/index.html", portada)
+    app.router.add_get("/catalogue/page-{pagina:\\d+}.html", portada)
+    app.router.add_get("/catalogue/category/books_1/index.html", portada)
+    app.router.add_get("/catalogue/category/books/{slug}_{id:\\d+}/index.html", categoria)
+    app.router.add_get("/catalogue/category/books/{slug}_{id:\\d+}/page-{pagina:\\d+}.html", categoria)
+    app.router.add_get("/catalogue/{slug}_{id:\\d+}/index.html", libro)
+    app.router.add_get("/media/cache/{nombre}", imagen)
+    app.router.add_get("/_espejo/estadisticas", estadisticas)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Espejo local de books.toscrape.com")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8081)
+    parser.add_argument("--libros", type=int, default=1000)
+    parser.add_argument("--categorias", type=int, default=len(CATEGORIAS))
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Milisegundos de espera por respuesta")
+    parser.add_argument("--variacion", type=float, default=0.0, help="Desviación estándar de la latencia en ms")
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--limite", type=float, help="Peticiones por segundo antes de responder 429")
+    args = parser.parse_args()
+
+    web.run_app(crear_app(args.libros, args.categorias, args.semilla, args.latencia,
+                          args.variacion, args.tasa_errores, args.limite),
+                host=args.host, port=args.puerto)
@@ -0,0 +1,161 @@
+"""
+The ETL of etl.py on the async engines.
+
+Extract, transform and load are the same steps as transfer_data_to_analytical,
+with the same batching and book-by-book retry and the same metrics, but every
+statement is awaited on asyncpg. A load can therefore share an event loop
+with the analysis service or an async crawler without blocking them.
+
+Usage:
+  python etl_async.py
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+
+from aggregates import refresh_aggregates
+from database_async import (
+    analytical_async_engine, dispose_async_engines, get_async_session, transactional_async_engine
+)
+from etl import LOAD_LOCK_KEY, load_books, record_etl_run, transform_books
+from instrumentation import EtlRunMetrics
+from models_analytical import analytical_data_version
+from models_transactional import Book, TaxRate
+from snapshots import write_snapshot
+
+
+async def extract_books_async(trans_session, book_ids: Optional[Iterable[int]] = None):
+    """etl.extract_books on an AsyncSession: the books with their category, stock and score, plus the latest tax rate"""
+    query = select(Book).options(
+        selectinload(Book.category),
+        selectinload(Book.stock),
+        selectinload(Book.scores)
+    )
+    if book_ids is not None:
+        query = query.where(Book.id.in_(list(book_ids)))
+    books = (await trans_session.exec(query)).all()
+
+    latest_tax = (await trans_session.exec(
+        select(TaxRate).order_by(TaxRate.date.desc())
+    )).first()
+
+    return books, latest_tax
+
+
+async def load_books_async(anal_session, rows: List[dict], tax: TaxRate, refresh_existing: bool = False):
+    """
+    etl.load_books on an AsyncSession. The batching, dimension cache and
+    book-by-book retry run through run_sync, so there is a single
+    implementation and every statement still goes out on asyncpg.
+
+    Returns (transferred, skipped, failed)
+    """
+    return await anal_session.run_sync(load_books, rows, tax, refresh_existing)
+
+
+@asynccontextmanager
+async def load_lock_async():
+    """
+    etl.load_lock (shared) on the async engine: waiting for an exclusive
+    holder awaits on asyncpg instead of blocking the event loop
+    """
+    async with analytical_async_engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock_shared(hashtext(:key))"), {"key": LOAD_LOCK_KEY})
+        # The lock belongs to the session; do not stay idle in a transaction during the load
+        await conn.commit()
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock_shared(hashtext(:key))"), {"key": LOAD_LOCK_KEY})
+            await conn.commit()
+
+
+async def bump_data_version_async() -> int:
+    """etl.bump_data_version on the async engine"""
+    async with analytical_async_engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: analytical_data_version.create(sync_conn, checkfirst=True))
+        return (await conn.execute(select(analytical_data_version.next_value()))).scalar_one()
+
+
+async def transfer_data_to_analytical_async() -> dict:
+    """
+    transfer_data_to_analytical with awaited extract, load and refresh.
+    Returns the run metrics, which are also printed as JSON and stored in
+    the etl_runs table
+    """
+    print("\n" + "="*50)
+    print("Starting async ETL Process")
+    print("="*50)
+
+    metrics = EtlRunMetrics(
+        transactional_async_engine.sync_engine, analytical_async_engine.sync_engine, mode="async"
+    )
+    try:
+        async with load_lock_async():
+            with metrics:
+                await _run_etl_async(metrics)
+    finally:
+        print("\nETL Run Metrics:")
+        print(metrics.to_json())
+        try:
+            await asyncio.to_thread(record_etl_run, metrics)
+        except Exception as e:
+            print(f"Warning: could not record ETL run: {e}")
+
+    return metrics.to_dict()
+
+
+async def _run_etl_async(metrics: EtlRunMetrics):
+    async with get_async_session() as trans_session:
+        with metrics.stage("extract"):
+            books, latest_tax = await extract_books_async(trans_session)
+    total_books = len(books)
+    metrics.counts["extracted"] = total_books
+    metrics.set_rows("extract", total_books)
+    print(f"\nFound {total_books} books to transfer")
+
+    if not latest_tax:
+        print("Warning: No tax rate found, using default 0.0")
+        latest_tax = TaxRate(tax_float=0.0, date=datetime.now())
+
+    with metrics.stage("transform"):
+        rows, failed = transform_books(books, latest_tax.tax_float)
+    metrics.set_rows("transform", len(rows))
+
+    async with get_async_session(analytical_async_engine) as anal_session:
+        with metrics.stage("load"):
+            transferred, skipped, load_failed = await load_books_async(anal_session, rows, latest_tax)
+        failed += load_failed
+        metrics.set_rows("load", transferred)
+
+        with metrics.stage("snapshot"):
+            snapshots = await anal_session.run_sync(
+                lambda session: write_snapshot(
+                    session.connection(), metrics.started_at, rows, latest_tax.tax_float
+                )
+            )
+        metrics.set_rows("snapshot", snapshots)
+
+        with metrics.stage("refresh"):
+            await anal_session.run_sync(lambda session: refresh_aggregates(session.connection()))
+            await anal_session.commit()
+            await bump_data_version_async()
+
+    metrics.counts.update(transferred=transferred, skipped=skipped, failed=failed)
+    print(f"\nTransferred: {transferred} books, skipped (already exists): {skipped}, failed: {failed}")
+
+
+async def main():
+    try:
+        return await transfer_data_to_analytical_async()
+    finally:
+        await dispose_async_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Continuous micro-batch ETL.
+
+Triggers on books, stocks and scores publish the id of every changed book
+on the book_changes channel (LISTEN/NOTIFY), and the UPC of every deleted
+book, whose facts are then removed. The daemon coalesces those ids
+and loads them into the analytical database once a batch is full or the
+oldest pending change reaches the latency target. SIGINT/SIGTERM stop it
+after the pending changes are drained.
+
+Usage:
+  python etl_daemon.py --install-triggers
+  python etl_daemon.py --batch-size 200 --max-latency 2 --catch-up
+"""
+
+import argparse
+import os
+import select
+import signal
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Set, Union
+
+from sqlalchemy import delete, text
+from sqlmodel import Session
+
+from database import engine as transactional_engine
+from etl import (
+    analytical_engine, bump_data_version, extract_books, load_books, load_lock,
+    record_etl_run, transfer_data_to_analytical, transform_books
+)
+from aggregates import refresh_aggregates
+from snapshots import write_snapshot
+from instrumentation import EtlRunMetrics
+from models_analytical import FactBook
+from models_transactional import TaxRate
+
+
+CHANGES_CHANNEL = "book_changes"
+
+DEFAULT_BATCH_SIZE = int(os.getenv("ETL_DAEMON_BATCH_SIZE", "100"))
+DEFAULT_MAX_LATENCY = float(os.getenv("ETL_DAEMON_MAX_LATENCY", "2.0"))
+
+# A failed batch stays pending and is retried after RETRY_BASE seconds,
+# doubling on every consecutive failure up to RETRY_MAX
+RETRY_BASE = float(os.getenv("ETL_DAEMON_RETRY_BASE", "1.0"))
+RETRY_MAX = float(os.getenv("ETL_DAEMON_RETRY_MAX", "60.0"))
+# Attempts per batch while draining on shutdown before giving up
+DRAIN_ATTEMPTS = 3
+
+# Tables whose changes are published, with the column holding the book id
+WATCHED_TABLES = {
+    "books": "id",
+    "stocks": "book_id",
+    "scores": "book_id",
+}
+
+# A deleted book is published by UPC, the key of its facts: its id means
+# nothing on the analytical side once the row is gone
+DELETED_BOOK_PREFIX = "deleted:"
+
+# A pending change: the id of a changed book or the UPC of a deleted one
+Change = Union[int, str]
+
+
+def install_change_triggers():
+    """Create the triggers that publish changed book ids on the transactional database"""
+    with transactional_engine.begin() as conn:
+        for table, column in WATCHED_TABLES.items():
+            # Deleting a stock or score changes its book; deleting a book removes it
+            deleted = (
+                f"'{DELETED_BOOK_PREFIX}' || OLD.upc" if table == "books" else f"OLD.{column}::text"
+            )
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION notify_{table}_change() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        PERFORM pg_notify('{CHANGES_CHANNEL}', {deleted});
+                        RETURN OLD;
+                    END IF;
+                    PERFORM pg_notify('{CHANGES_CHANNEL}', NEW.{column}::text);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_notify ON {table}"))
+            conn.execute(text(f"""
+                CREATE TRIGGER {table}_change_notify
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION notify_{table}_change()
+            """))
+    print(f"Change triggers installed on {', '.join(WATCHED_TABLES)}")
+
+
+def load_book_batch(book_ids: Set[int], deleted_upcs: Set[str] = frozenset()) -> dict:
+    """Extract, transform and upsert a set of changed books, and remove the deleted ones"""
+    metrics = EtlRunMetrics(transactional_engine, analytical_engine, mode="micro_batch")
+    try:
+        with load_lock(), metrics:
+            _load_book_batch(metrics, book_ids, deleted_upcs)
+    finally:
+        try:
+            record_etl_run(metrics)
+        except Exception as e:
+            print(f"Warning: could not record micro-batch run: {e}")
+    return metrics.to_dict()
+
+
+def _load_book_batch(metrics: EtlRunMetrics, book_ids: Set[int], deleted_upcs: Set[str]):
+    with Session(transactional_engine) as trans_session:
+        with metrics.stage("extract"):
+            books, latest_tax = extract_books(trans_session, book_ids)
+        metrics.counts["extracted"] = len(books)
+        metrics.set_rows("extract", len(books))
+
+        if not latest_tax:
+            latest_tax = TaxRate(tax_float=0.0, date=datetime.now())
+
+        with metrics.stage("transform"):
+            rows, failed = transform_books(books, latest_tax.tax_float)
+        metrics.set_rows("transform", len(rows))
+
+    with Session(analytical_engine) as anal_session:
+        with metrics.stage("load"):
+            transferred, skipped, load_failed = load_books(
+                anal_session, rows, latest_tax, refresh_existing=True
+            )
+        metrics.set_rows("load", transferred)
+
+        with metrics.stage("delete"):
+            # A UPC deleted and inserted again in the same batch is a changed book
+            deleted_upcs = set(deleted_upcs) - {row["upc"] for row in rows}
+            deleted = anal_session.connection().execute(
+                delete(FactBook).where(FactBook.upc.in_(deleted_upcs))
+            ).rowcount if deleted_upcs else 0
+        metrics.set_rows("delete", deleted)
+
+        with metrics.stage("snapshot"):
+            snapshots = write_snapshot(
+                anal_session.connection(), metrics.started_at, rows, latest_tax.tax_float
+            )
+        metrics.set_rows("snapshot", snapshots)
+
+        with metrics.stage("refresh"):
+            # Only the changed books are rewritten in the wide projection
+            refresh_aggregates(
+                anal_session.connection(), upcs=[row["upc"] for row in rows] + sorted(deleted_upcs)
+            )
+            anal_session.commit()
+            bump_data_version()
+
+    metrics.counts.update(
+        transferred=transferred, skipped=skipped, failed=failed + load_failed, deleted=deleted
+    )
+
+
+class MicroBatchEtl:
+    """Listen for book changes and load them in small batches"""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, max_latency: float = DEFAULT_MAX_LATENCY):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.pending: Set[Change] = set()
+        self.oldest_change = None
+        self.stopping = False
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def stop(self, *_):
+        """Signal handler: finish the current wait, drain and exit"""
+        if not self.stopping:
+            print("\nStopping, draining pending changes...")
+        self.stopping = True
+
+    def _collect(self, conn):
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            if not self.pending:
+                self.oldest_change = time.monotonic()
+            payload = notify.payload
+            self.pending.add(
+                payload if payload.startswith(DELETED_BOOK_PREFIX) else int(payload)
+            )
+
+    def _due(self) -> bool:
+        if not self.pending or time.monotonic() < self.retry_at:
+            return False
+        return (
+            len(self.pending) >= self.batch_size
+            or time.monotonic() - self.oldest_change >= self.max_latency
+        )
+
+    def _load(self, batch: Set[Change]) -> bool:
+        """
+        Load one batch and drop it from the pending changes. On failure the
+        batch stays pending and the next attempt waits with exponential backoff.
+        """
+        waited = time.monotonic() - self.oldest_change
+        try:
+            result = load_book_batch(
+                {change for change in batch if isinstance(change, int)},
+                {change[len(DELETED_BOOK_PREFIX):] for change in batch if isinstance(change, str)}
+            )
+        except Exception as e:
+            self.failures += 1
+            delay = min(RETRY_MAX, RETRY_BASE * 2 ** (self.failures - 1))
+            self.retry_at = time.monotonic() + delay
+            print(f"Error loading {len(batch)} changed books, retrying in {delay:.1f}s: {e}")
+            return False
+
+        self.failures = 0
+        self.retry_at = 0.0
+        self.pending -= batch
+        print(
+            f"Loaded {result['counts']['transferred']}/{len(batch)} changed books, "
+            f"removed {result['counts']['deleted']} deleted "
+            f"in {result['total_seconds']:.3f}s (oldest change waited {waited:.3f}s)"
+        )
+        return True
+
+    def _flush(self, drain: bool = False):
+        """Load the due batches, or every pending change when draining"""
+        while self.pending and (drain or self._due()):
+            batch = set(islice(self.pending, self.batch_size))
+            if self._load(batch):
+                continue
+            if not drain:
+                break
+            if self.failures >= DRAIN_ATTEMPTS:
+                print(
+                    f"Giving up on {len(self.pending)} pending changes; "
+                    f"start with --catch-up to load them"
+                )
+                break
+            time.sleep(max(0.0, self.retry_at - time.monotonic()))
+        if not self.pending:
+            self.oldest_change = None
+
+    def run(self, catch_up: bool = False):
+        """
+        Listen for changes and load them until stopped. With catch_up, a full
+        ETL runs after LISTEN is issued, so books changed during it are
+        notified and loaded afterwards.
+        """
+        raw = transactional_engine.raw_connection()
+        conn = raw.driver_connection
+        # The listening connection stays in autocommit and never goes back to the pool
+        raw.detach()
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {CHANGES_CHANNEL}")
+
+        try:
+            if catch_up:
+                # Changes made during the full load queue up on the channel
+                transfer_data_to_analytical()
+
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+            print(
+                f"Listening on '{CHANGES_CHANNEL}' "
+                f"(batch size {self.batch_size}, max latency {self.max_latency}s)"
+            )
+            while not self.stopping:
+                if self.pending:
+                    now = time.monotonic()
+                    timeout = max(
+                        0.0,
+                        self.max_latency - (now - self.oldest_change),
+                        self.retry_at - now
+                    )
+                else:
+                    timeout = self.max_latency
+                try:
+                    ready, _, _ = select.select([conn], [], [], timeout)
+                except InterruptedError:
+                    continue
+                if ready:
+                    self._collect(conn)
+                if self._due():
+                    self._flush()
+
+            # Graceful drain: pick up the last notifications and load everything
+            self._collect(conn)
+            self._flush(drain=True)
+        finally:
+            conn.close()
+        print("ETL daemon stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuous micro-batch ETL")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Maximum number of books loaded per batch")
+    parser.add_argument("--max-latency", type=float, default=DEFAULT_MAX_LATENCY,
+                        help="Seconds a change may wait before its batch is loaded")
+    parser.add_argument("--install-triggers", action="store_true",
+                        help="Install the change triggers and exit")
+    parser.add_argument("--catch-up", action="store_true",
+                        help="Run a full ETL before listening for changes")
+    args = parser.parse_args()
+
+    if args.install_triggers:
+        install_change_triggers()
+    else:
+        MicroBatchEtl(args.batch_size, args.max_latency).run(catch_up=args.catch_up)
@@ -0,0 +1,267 @@
+"""
+Exportación de datos analíticos a CSV, JSON Lines y Parquet.
+
+Las filas se leen con un cursor del servidor en lotes de tamaño fijo y se
+escriben lote a lote, de modo que la memoria no depende del número de
+filas. Se puede exportar la tabla de hechos unida a sus dimensiones o el
+resultado de cualquier consulta registrada en consultas.CONSULTAS.
+
+CSV y JSON Lines admiten compresión gzip o zstd (esta última requiere el
+paquete zstandard); Parquet (requiere pyarrow) comprime internamente con
+el códec indicado. Con --filas-por-archivo la salida se divide en varios
+archivos numerados y se escribe un manifiesto con las filas de cada uno.
+
+Uso:
+  python exportar.py hechos --formato parquet --compresion zstd --salida export/hechos
+  python exportar.py hechos --formato csv --compresion gzip --filas-por-archivo 100000
+  python exportar.py libro_mas_barato_por_categoria --formato jsonl
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, String, select, text
+
+from consultas import CONSULTAS
+from etl import analytical_engine
+from models_analytical import FactBook, DimCategory, DimStock, DimScore, DimPrice, DimTax
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+FORMATOS = ("csv", "jsonl", "parquet")
+COMPRESIONES = ("gzip", "zstd")
+EXTENSIONES = {"csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet",
+               "gzip": ".gz", "zstd": ".zst"}
+
+# Filas leídas del cursor y escritas por lote
+TAMANO_LOTE = int(os.getenv("EXPORTAR_TAMANO_LOTE", "10000"))
+
+
+def sentencia_hechos():
+    """Cada libro con todas sus dimensiones, en el orden de fact_books"""
+    return (
+        select(
+            FactBook.id.label("libro_id"),
+            FactBook.upc.label("upc"),
+            FactBook.title.label("titulo"),
+            DimCategory.name.label("categoria"),
+            DimPrice.price_before_tax.label("precio"),
+            DimPrice.price_after_tax.label("precio_con_impuesto"),
+            DimPrice.price_range.label("rango_precio"),
+            DimTax.tax_rate.label("impuesto"),
+            DimStock.quantity.label("stock"),
+            DimStock.stock_status.label("estado_stock"),
+            DimScore.score.label("puntuacion"),
+        )
+        .outerjoin(DimCategory, FactBook.category_id == DimCategory.id)
+        .outerjoin(DimPrice, FactBook.price_id == DimPrice.id)
+        .outerjoin(DimTax, DimPrice.tax_id == DimTax.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        .outerjoin(DimScore, FactBook.score_id == DimScore.id)
+        .order_by(FactBook.id)
+    )
+
+
+def sentencia_origen(origen: str, *args):
+    """'hechos' o el nombre de una consulta de consultas.CONSULTAS"""
+    if origen == "hechos":
+        return sentencia_hechos()
+    if origen not in CONSULTAS:
+        raise ValueError(f"Origen desconocido: {origen}")
+    return CONSULTAS[origen].sentencia(*args)
+
+
+def _abrir_texto(ruta: str, compresion: Optional[str]):
+    if compresion == "gzip":
+        return gzip.open(ruta, "wt", encoding="utf-8", newline="")
+    if compresion == "zstd":
+        if zstandard is None:
+            raise RuntimeError("La compresión zstd requiere el paquete zstandard (pip install zstandard)")
+        return zstandard.open(ruta, "wt", encoding="utf-8", newline="")
+    return open(ruta, "w", encoding="utf-8", newline="")
+
+
+class EscritorCsv:
+    def __init__(self, ruta: str, columnas: List[str], compresion: Optional[str], tipos):
+        self.archivo = _abrir_texto(ruta, compresion)
+        self.csv = csv.writer(self.archivo)
+        self.csv.writerow(columnas)
+
+    def escribir(self, filas):
+        self.csv.writerows(filas)
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+class EscritorJsonl:
+    def __init__(self, ruta: str, columnas: List[str], compresion: Optional[str], tipos):
+        self.archivo = _abrir_texto(ruta, compresion)
+        self.columnas = columnas
+
+    def escribir(self, filas):
+        self.archivo.writelines(
+            json.dumps(dict(zip(self.columnas, fila)), ensure_ascii=False, default=str) + "\n"
+            for fila in filas
+        )
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+def _tipo_arrow(tipo):
+    """Tipo de Arrow de una columna de la consulta, o None si hay que deducirlo de los datos"""
+    if isinstance(tipo, Integer):
+        return pa.int64()
+    if isinstance(tipo, Float):
+        return pa.float64()
+    if isinstance(tipo, DateTime):
+        return pa.timestamp("us")
+    if isinstance(tipo, String):
+        return pa.string()
+    return None
+
+
+class EscritorParquet:
+    """
+    Un grupo de filas de Parquet por lote. El esquema se toma de los tipos de
+    la consulta; las columnas sin tipo (NullType, Numeric...) lo deducen del
+    primer lote.
+    """
+
+    def __init__(self, ruta: str, columnas: List[str], compresion: Optional[str], tipos):
+        if pa is None:
+            raise RuntimeError("La exportación a Parquet requiere pyarrow (pip install pyarrow)")
+        self.ruta = ruta
+        self.columnas = columnas
+        self.compresion = compresion or "none"
+        self.tipos = [_tipo_arrow(tipo) for tipo in tipos]
+        self.esquema = None
+        self.escritor = None
+
+    def _abrir(self, columnas_lote):
+        tipos = [
+            tipo if tipo is not None else pa.array(valores).type
+            for tipo, valores in zip(self.tipos, columnas_lote)
+        ]
+        # Una columna sin tipo y solo con nulos en el primer lote se guarda como texto
+        self.esquema = pa.schema([
+            (columna, pa.string() if pa.types.is_null(tipo) else tipo)
+            for columna, tipo in zip(self.columnas, tipos)
+        ])
+        self.escritor = pq.ParquetWriter(self.ruta, self.esquema, compression=self.compresion)
+
+    def escribir(self, filas):
+        columnas = list(zip(*filas)) or [()] * len(self.columnas)
+        if self.escritor is None:
+            self._abrir(columnas)
+        self.escritor.write_table(pa.Table.from_arrays(
+            [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, self.esquema)],
+            schema=self.esquema
+        ))
+
+    def cerrar(self):
+        if self.escritor is None:
+            self._abrir([()] * len(self.columnas))
+        self.escritor.close()
+
+
+ESCRITORES = {"csv": EscritorCsv, "jsonl": EscritorJsonl, "parquet": EscritorParquet}
+
+
+def _ruta_archivo(ruta_base: str, formato: str, compresion: Optional[str], parte: Optional[int]) -> str:
+    ruta = ruta_base if parte is None else f"{ruta_base}-{parte:05d}"
+    ruta += EXTENSIONES[formato]
+    if compresion and formato != "parquet":
+        ruta += EXTENSIONES[compresion]
+    return ruta
+
+
+def exportar(sentencia, ruta_base: str, formato: str = "csv", compresion: Optional[str] = None,
+             filas_por_archivo: Optional[int] = None, tamano_lote: int = TAMANO_LOTE) -> List[Dict]:
+    """
+    Escribe el resultado de una sentencia en uno o varios archivos y devuelve
+    la lista de archivos con sus filas. Nunca hay más de un lote en memoria.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}")
+    if compresion not in (None, *COMPRESIONES):
+        raise ValueError(f"Compresión desconocida: {compresion}")
+    directorio = os.path.dirname(ruta_base)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+
+    tipos = [columna.type for columna in sentencia.selected_columns]
+    archivos: List[Dict] = []
+    escritor = None
+
+    def abrir():
+        parte = len(archivos) if filas_por_archivo else None
+        ruta = _ruta_archivo(ruta_base, formato, compresion, parte)
+        archivos.append({"archivo": ruta, "filas": 0})
+        return ESCRITORES[formato](ruta, columnas, compresion, tipos)
+
+    with analytical_engine.connect() as conn:
+        # El cursor del servidor se planifica para leer todas las filas, no solo las primeras
+        conn.execute(text("SET LOCAL cursor_tuple_fraction = 1.0"))
+        resultado = conn.execution_options(yield_per=tamano_lote).execute(sentencia)
+        columnas = list(resultado.keys())
+        try:
+            escritor = abrir()
+            for lote in resultado.partitions():
+                while lote:
+                    if filas_por_archivo and archivos[-1]["filas"] >= filas_por_archivo:
+                        escritor.cerrar()
+                        escritor = abrir()
+                    cabe = filas_por_archivo - archivos[-1]["filas"] if filas_por_archivo else len(lote)
+                    parte, lote = lote[:cabe], lote[cabe:]
+                    escritor.escribir(parte)
+                    archivos[-1]["filas"] += len(parte)
+        finally:
+            if escritor is not None:
+                escritor.cerrar()
+    return archivos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta datos analíticos por lotes")
+    parser.add_argument("origen", help="'hechos' o el nombre de una consulta de análisis")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--compresion", choices=COMPRESIONES)
+    parser.add_argument("--filas-por-archivo", type=int,
+                        help="Divide la salida en archivos de como máximo estas filas")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE,
+                        help="Filas leídas del cursor del servidor por lote")
+    parser.add_argument("--salida", help="Ruta base de los archivos (por defecto export/<origen>)")
+    args = parser.parse_args()
+
+    ruta_base = args.salida or os.path.join("export", args.origen)
+    inicio = time.perf_counter()
+    archivos = exportar(
+        sentencia_origen(args.origen), ruta_base, args.formato, args.compresion,
+        args.filas_por_archivo, args.tamano_lote
+    )
+    segundos = time.perf_counter() - inicio
+
+    manifiesto = f"{ruta_base}.manifest.json"
+    with open(manifiesto, "w", encoding="utf-8") as archivo:
+        json.dump({"origen": args.origen, "formato": args.formato,
+                   "compresion": args.compresion, "archivos": archivos}, archivo, indent=2)
+
+    total = sum(a["filas"] for a in archivos)
+    print(f"{total} filas exportadas en {len(archivos)} archivo(s) en {segundos:.2f}s")
+    print(f"Manifiesto: {manifiesto}")
@@ -0,0 +1,228 @@
+"""
+Rate and concurrency control for page fetches.
+
+Each host gets a token bucket (at most SCRAPER_RATE_PER_HOST requests per
+second, bursts of SCRAPER_BURST) and an AIMD concurrency limit: the limit
+grows by one per window of healthy responses and is halved on a 429, a 5xx,
+a failed fetch or a latency that climbs above SCRAPER_LATENCY_TOLERANCE
+times the best latency seen (or above SCRAPER_LATENCY_TARGET). Retryable
+responses are retried with exponential backoff and jitter, and a 429 also
+pauses the whole host for SCRAPER_THROTTLE_PAUSE seconds.
+
+The crawler thus settles at the fastest rate the site sustains without
+tuning the number of browsers or the delay between pages by hand.
+"""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+
+RATE_PER_HOST = float(os.getenv("SCRAPER_RATE_PER_HOST", "5"))
+BURST = float(os.getenv("SCRAPER_BURST", "5"))
+MAX_CONCURRENCY = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "4"))
+LATENCY_TARGET = float(os.getenv("SCRAPER_LATENCY_TARGET", "5.0"))
+LATENCY_TOLERANCE = float(os.getenv("SCRAPER_LATENCY_TOLERANCE", "3.0"))
+# Latencies below this are never treated as rising, however they compare to the best one
+LATENCY_FLOOR = float(os.getenv("SCRAPER_LATENCY_FLOOR", "0.1"))
+MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("SCRAPER_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("SCRAPER_BACKOFF_MAX", "30"))
+THROTTLE_PAUSE = float(os.getenv("SCRAPER_THROTTLE_PAUSE", "1.0"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    def __init__(self, url: str, status: Optional[int], retries: int):
+        super().__init__(f"{url} answered {status} after {retries} retries")
+        self.url = url
+        self.status = status
+
+
+class TokenBucket:
+    """At most `rate` acquisitions per second, with bursts of up to `burst`"""
+
+    def __init__(self, rate: float = RATE_PER_HOST, burst: float = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the given time (the server asked us to wait)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AimdLimiter:
+    """
+    Concurrency limit with additive increase and multiplicative decrease:
+    +1 after `limit` healthy responses (about one round trip of the whole
+    window), times `decrease` on overload, at most once per cooldown so one
+    burst of errors does not collapse the limit to the minimum.
+    """
+
+    def __init__(self, initial: float = 1, minimum: float = 1, maximum: float = MAX_CONCURRENCY,
+                 decrease: float = 0.5, latency_target: float = LATENCY_TARGET,
+                 latency_tolerance: float = LATENCY_TOLERANCE):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.smoothed_latency: Optional[float] = None
+        self.best_latency: Optional[float] = None
+        self.last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def _latency_rising(self, latency: float) -> bool:
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency = 0.8 * self.smoothed_latency + 0.2 * latency
+        self.best_latency = min(self.best_latency or latency, self.smoothed_latency)
+        return (
+            self.smoothed_latency > self.latency_target
+            or self.smoothed_latency > self.latency_tolerance * max(self.best_latency, LATENCY_FLOOR)
+        )
+
+    def release(self, latency: float, overloaded: bool):
+        with self._condition:
+            self.in_flight -= 1
+            if self._latency_rising(latency) or overloaded:
+                now = time.monotonic()
+                # Wait about one smoothed round trip before cutting again
+                if now - self.last_decrease > (self.smoothed_latency or 0):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class Slot:
+    """Outcome of one fetch, filled in by the caller"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+
+
+class HostGovernor:
+    def __init__(self, max_concurrency: int, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AimdLimiter(maximum=max_concurrency)
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, status: Optional[int], overloaded: bool):
+        """Count one finished fetch; every thread of the crawler reports here"""
+        with self._lock:
+            self.requests += 1
+            if status == 429:
+                self.throttled += 1
+            elif overloaded:
+                self.errors += 1
+
+
+class FetchGovernor:
+    """Token bucket and AIMD limit per host, shared by every thread of the crawler"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, rate: float = RATE_PER_HOST,
+                 burst: float = BURST, max_retries: int = MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.hosts: Dict[str, HostGovernor] = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostGovernor:
+        name = urlsplit(url).netloc
+        with self._lock:
+            if name not in self.hosts:
+                self.hosts[name] = HostGovernor(self.max_concurrency, self.rate, self.burst)
+            return self.hosts[name]
+
+    @contextmanager
+    def slot(self, url: str):
+        """Wait for a concurrency slot and a token of the URL's host, and record how the fetch went"""
+        host = self.host(url)
+        host.limiter.acquire()
+        slot = Slot()
+        overloaded = True
+        start = None
+        try:
+            host.bucket.acquire()
+            start = time.monotonic()
+            yield slot
+            overloaded = slot.status in RETRYABLE_STATUSES
+        finally:
+            latency = time.monotonic() - start if start is not None else 0.0
+            host.limiter.release(latency, overloaded)
+            host.record(slot.status, overloaded)
+            if slot.status == 429:
+                host.bucket.pause(THROTTLE_PAUSE)
+
+    def fetch(self, url: str, load: Callable[[], Optional[int]]):
+        """
+        Run load() (which fetches url and returns its HTTP status, or None if
+        unknown) under the host's limits, retrying retryable statuses and
+        exceptions with exponential backoff and jitter
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.slot(url) as slot:
+                    slot.status = load()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if slot.status not in RETRYABLE_STATUSES:
+                    return slot.status
+                if attempt == self.max_retries:
+                    raise FetchError(url, slot.status, self.max_retries)
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "concurrency_limit": host.limiter.limit,
+                "in_flight": host.limiter.in_flight,
+                "smoothed_latency": host.limiter.smoothed_latency,
+                "requests": host.requests,
+                "throttled": host.throttled,
+                "errors": host.errors,
+            }
+            for name, host in self.hosts.items()
+        }
@@ -0,0 +1,422 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# How often MemoryPeak samples the resident memory of the process
+MEMORY_SAMPLE_SECONDS = float(os.getenv("ETL_MEMORY_SAMPLE_SECONDS", "0.05"))
+
+
+def peak_memory_bytes() -> Optional[int]:
+    """Peak resident memory of the current process over its whole lifetime, in bytes"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_memory_bytes() -> Optional[int]:
+    """Resident memory of the current process right now, in bytes (None without /proc)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryPeak:
+    """
+    Peak resident memory during a block. The process peak only belongs to
+    the block if it rose while the block ran (a daemon or a service runs many
+    loads in one process), so otherwise a background thread samples the
+    current resident memory every MEMORY_SAMPLE_SECONDS.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_SECONDS):
+        self.interval = interval
+        self.process_peak_before: Optional[int] = None
+        self.sampled: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        current = current_memory_bytes()
+        if current is not None:
+            self.sampled = max(self.sampled or 0, current)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.process_peak_before = peak_memory_bytes()
+        self._sample()
+        if self.sampled is not None:
+            self._thread = threading.Thread(target=self._run, name="memory-peak", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+
+    @property
+    def bytes(self) -> Optional[int]:
+        process_peak = peak_memory_bytes()
+        if process_peak is not None and self.process_peak_before is not None \
+                and process_peak > self.process_peak_before:
+            return process_peak
+        return self.sampled
+
+
+class QueryCounter:
+    """Count the SQL statements executed on a set of engines"""
+
+    def __init__(self, *engines):
+        self.engines = engines
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+class EtlRunMetrics:
+    """
+    Collect per-stage timings, row counts, query counts and peak memory
+    for a single ETL run
+    """
+
+    def __init__(self, *engines, mode: str = "python"):
+        self.mode = mode
+        self.status = "running"
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.stages: Dict[str, Dict] = {}
+        self.counts: Dict[str, int] = {}
+        self.queries = QueryCounter(*engines)
+        self.memory = MemoryPeak()
+        self._start = None
+        self._total_seconds = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self.memory.__enter__()
+        self.queries.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.queries.__exit__(exc_type, exc, tb)
+        self.memory.__exit__(exc_type, exc, tb)
+        self._total_seconds = time.perf_counter() - self._start
+        self.finished_at = datetime.now()
+        self.status = "failed" if exc_type else "completed"
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage and count the queries it issues"""
+        start = time.perf_counter()
+        queries_before = self.queries.count
+        try:
+            with profile_stage(name):
+                yield
+        finally:
+            self.stages.setdefault(name, {}).update(
+                seconds=time.perf_counter() - start,
+                queries=self.queries.count - queries_before,
+            )
+
+    def set_rows(self, stage: str, rows: int):
+        """Record how many rows a stage handled, for its rows/sec figure"""
+        self.stages.setdefault(stage, {"seconds": 0.0, "queries": 0})["rows"] = rows
+
+    def stage_seconds(self, name: str) -> float:
+        return self.stages.get(name, {}).get("seconds", 0.0)
+
+    @property
+    def total_seconds(self) -> float:
+        if self.finished_at is None and self._start is not None:
+            return time.perf_counter() - self._start
+        return self._total_seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        rows = self.counts.get("transferred", 0)
+        return rows / self.total_seconds if self.total_seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        stages = {}
+        for name, data in self.stages.items():
+            stage = dict(data)
+            if "rows" in stage:
+                stage["rows_per_second"] = (
+                    stage["rows"] / stage["seconds"] if stage["seconds"] > 0 else 0.0
+                )
+            stages[name] = stage
+
+        return {
+            "mode": self.mode,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "total_seconds": self.total_seconds,
+            "rows_per_second": self.rows_per_second,
+            "query_count": self.queries.count,
+            "peak_memory_bytes": self.memory.bytes,
+            "counts": dict(self.counts),
+            "stages": stages,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+
+# A statement repeated more than this many times within one stage is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("PROFILE_N_PLUS_ONE", "10"))
+# Functions listed per stage in the cProfile report
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "15"))
+# If set, each stage's cProfile data is also written there as <stage>.prof
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+_IN_LIST = re.compile(r"\(%\([^)]+\)s(?:, %\([^)]+\)s)*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_active_profiler: Optional["Profiler"] = None
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse whitespace and expanded IN lists so repeated statements compare equal"""
+    return _IN_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class StageProfile:
+    """Wall time, SQL statements and cProfile data accumulated by one named stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements: Counter = Counter()
+        self.statement_seconds: Counter = Counter()
+        self.profile = cProfile.Profile()
+        self.profiling = False
+        self.profiled = False
+
+    def repeated_statements(self, threshold: int) -> List[Tuple[str, int, float]]:
+        return [
+            (statement, count, self.statement_seconds[statement])
+            for statement, count in self.statements.most_common()
+            if count > threshold
+        ]
+
+    def to_dict(self, threshold: int) -> Dict:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "sql_count": self.sql_count,
+            "sql_seconds": self.sql_seconds,
+            "n_plus_one": [
+                {"statement": statement, "count": count, "seconds": seconds}
+                for statement, count, seconds in self.repeated_statements(threshold)
+            ],
+        }
+
+
+class Profiler:
+    """
+    Profile the named stages of a run: wall time, cProfile statistics and
+    the SQL statements each stage issues, counted and timed through
+    SQLAlchemy events. Stages with the same name accumulate; nested stages
+    own the statements and Python time spent inside them.
+
+    Without engines, every SQLAlchemy engine in the process is observed.
+    cProfile only follows the thread that created the profiler; stages run
+    in other threads still record their time and SQL.
+    """
+
+    def __init__(self, name: str, *engines, n_plus_one: int = N_PLUS_ONE_THRESHOLD,
+                 top: int = PROFILE_TOP, output_dir: Optional[str] = PROFILE_DIR):
+        self.name = name
+        self.engines = engines or (Engine,)
+        self.n_plus_one = n_plus_one
+        self.top = top
+        self.output_dir = output_dir
+        self.stages: Dict[str, StageProfile] = {}
+        self._thread = threading.current_thread()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._root = None
+
+    def _stack(self) -> List[Tuple[StageProfile, bool]]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _current(self) -> StageProfile:
+        stack = self._stack()
+        return stack[-1][0] if stack else self.stages[self.name]
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        key = normalize_statement(statement)
+        stage = self._current()
+        with self._lock:
+            stage.sql_count += 1
+            stage.sql_seconds += elapsed
+            stage.statements[key] += 1
+            stage.statement_seconds[key] += elapsed
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage, profile it and attribute the SQL it issues to it"""
+        with self._lock:
+            stage = self.stages.setdefault(name, StageProfile(name))
+        stack = self._stack()
+        parent_profiling = bool(stack) and stack[-1][1]
+        profiling = threading.current_thread() is self._thread and not stage.profiling
+        if profiling:
+            if parent_profiling:
+                stack[-1][0].profile.disable()
+            stage.profiling = stage.profiled = True
+            stage.profile.enable()
+        stack.append((stage, profiling))
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if profiling:
+                stage.profile.disable()
+                stage.profiling = False
+                if parent_profiling:
+                    stack[-1][0].profile.enable()
+            with self._lock:
+                stage.calls += 1
+                stage.seconds += elapsed
+
+    def __enter__(self):
+        global _active_profiler
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._before_execute)
+            event.listen(engine, "after_cursor_execute", self._after_execute)
+        _active_profiler = self
+        self._root = self.stage(self.name)
+        self._root.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_profiler
+        self._root.__exit__(exc_type, exc, tb)
+        _active_profiler = None
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._before_execute)
+            event.remove(engine, "after_cursor_execute", self._after_execute)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "n_plus_one_threshold": self.n_plus_one,
+            "stages": {name: stage.to_dict(self.n_plus_one) for name, stage in self.stages.items()},
+        }
+
+    def function_stats(self, stage: StageProfile) -> str:
+        """The top functions of a stage by cumulative time, as printed by pstats"""
+        output = io.StringIO()
+        stats = pstats.Stats(stage.profile, stream=output)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(self.top)
+        return output.getvalue()
+
+    def report(self) -> str:
+        lines = [f"Profile: {self.name}", ""]
+        lines.append(f"{'stage':40} {'calls':>7} {'seconds':>10} {'sql':>8} {'sql seconds':>12}")
+        for stage in self.stages.values():
+            lines.append(
+                f"{stage.name[:40]:40} {stage.calls:7d} {stage.seconds:10.3f} "
+                f"{stage.sql_count:8d} {stage.sql_seconds:12.3f}"
+            )
+
+        repeated = [
+            (stage.name, statement, count, seconds)
+            for stage in self.stages.values()
+            for statement, count, seconds in stage.repeated_statements(self.n_plus_one)
+        ]
+        if repeated:
+            lines += ["", f"Likely N+1 patterns (same statement more than {self.n_plus_one} times in a stage):"]
+            for stage_name, statement, count, seconds in repeated:
+                lines.append(f"  [{stage_name}] {count}x, {seconds:.3f}s: {statement[:160]}")
+
+        for stage in self.stages.values():
+            if stage.profiled:
+                lines += ["", f"--- {stage.name} ---", self.function_stats(stage).rstrip()]
+        return "\n".join(lines)
+
+    def dump_stats(self, directory: str):
+        """Write each stage's cProfile data as <stage>.prof, for pstats or snakeviz"""
+        os.makedirs(directory, exist_ok=True)
+        for stage in self.stages.values():
+            if stage.profiled:
+                filename = re.sub(r"[^\w.-]+", "_", stage.name) + ".prof"
+                stage.profile.dump_stats(os.path.join(directory, filename))
+
+
+def profile_stage(name: str):
+    """A stage of the active profiler, or a no-op when nothing is being profiled"""
+    if _active_profiler is None:
+        return nullcontext()
+    return _active_profiler.stage(name)
+
+
+@contextmanager
+def profiled(name: str, enabled: bool = True):
+    """
+    Profile the enclosed block when enabled and print the report at the end,
+    also when the block fails
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = Profiler(name)
+    try:
+        with profiler:
+            yield profiler
+    finally:
+        print("\n" + profiler.report())
+        if profiler.output_dir:
+            profiler.dump_stats(profiler.output_dir)
+            print(f"\ncProfile data written to {profiler.output_dir}")
@@ -1,4 +1,7 @@
+import argparse
+
 from database import create_tables, drop_tables
+from instrumentation import profile_stage, profiled
 from scraper import perform_scraping
 from etl import (
     transfer_data_to_analytical, 
@@ -40,21 +43,26 @@ def main():
     if option == "1":
         confirm = input("¿Esto eliminará todos los datos existentes. Continuar? (s/n): ")
         if confirm.lower() == 's':
-            drop_tables()
-            initialize_database()
+            with profile_stage("inicializar_transaccional"):
+                drop_tables()
+                initialize_database()
     elif option == "2":
-        perform_scraping()
+        with profile_stage("scraping"):
+            perform_scraping()
     elif option == "3":
         confirm = input("¿Esto eliminará todos los datos analíticos existentes. Continuar? (s/n): ")
         if confirm.lower() == 's':
-            drop_analytical_tables()
-            initialize_analytical_database()
+            with profile_stage("inicializar_analitica"):
+                drop_analytical_tables()
+                initialize_analytical_database()
     elif option == "4":
         print("\nIniciando proceso ETL...")
         print("Transfiriendo datos de base transaccional a analítica...")
-        transfer_data_to_analytical()
+        with profile_stage("etl"):
+            transfer_data_to_analytical()
     elif option == "5":
-        show_analytical_statistics()
+        with profile_stage("estadisticas"):
+            show_analytical_statistics()
     elif option == "6":
         print("\n¡Hasta luego!")
         return
@@ -67,4 +75,16 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sistema de gestión de biblioteca")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada operación y contar las consultas SQL por etapa")
+    parser.add_argument("--scrape", action="store_true",
+                        help="Ejecutar el web scraper directamente, sin el menú")
+    args = parser.parse_args()
+
+    with profiled("main", args.profile):
+        if args.scrape:
+            with profile_stage("scraping"):
+                perform_scraping()
+        else:
+            main()
\ No newline at end of file
@@ -1,11 +1,18 @@
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, Float, MetaData
+from sqlalchemy import (
+    BigInteger, Column, DDL, Float, Index, Integer, JSON, MetaData, Sequence, UniqueConstraint, event
+)
+import os
 
 # Create separate metadata for analytical models
 analytical_metadata = MetaData()
 
+# Bumped after every committed load; cached analysis results are keyed by it.
+# Pinned to public, like etl_runs, so that it survives blue-green schema swaps
+analytical_data_version = Sequence("analytical_data_version", schema="public", metadata=analytical_metadata)
+
 # Base class for analytical models
 class AnalyticalBase(SQLModel):
     metadata = analytical_metadata
@@ -13,6 +20,7 @@ class AnalyticalBase(SQLModel):
 
 class DimTax(AnalyticalBase, table=True):
     __tablename__ = "dim_tax"
+    __table_args__ = (UniqueConstraint("tax_rate", "date", name="uq_dim_tax_natural_key"),)
     
     id: Optional[int] = Field(default=None, primary_key=True)
     tax_rate: float = Field(sa_column=Column(Float))
@@ -32,6 +40,9 @@ class DimCategory(AnalyticalBase, table=True):
 
 class DimStock(AnalyticalBase, table=True):
     __tablename__ = "dim_stock"
+    __table_args__ = (
+        UniqueConstraint("quantity", "stock_status", name="uq_dim_stock_natural_key"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     quantity: int
@@ -44,13 +55,21 @@ class DimScore(AnalyticalBase, table=True):
     __tablename__ = "dim_score"
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    score: float = Field(sa_column=Column(Float))
+    score: float = Field(sa_column=Column(Float, unique=True))
     
     fact_books: List["FactBook"] = Relationship(back_populates="score")
 
 
 class DimPrice(AnalyticalBase, table=True):
     __tablename__ = "dim_price"
+    __table_args__ = (
+        UniqueConstraint(
+            "price_before_tax", "price_after_tax", "price_range", "tax_id",
+            name="uq_dim_price_natural_key"
+        ),
+        # Covering index: ORDER BY price reads the id without visiting the heap
+        Index("ix_dim_price_price_before_tax", "price_before_tax", postgresql_include=["id"]),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     price_before_tax: float = Field(sa_column=Column(Float))
@@ -64,6 +83,14 @@ class DimPrice(AnalyticalBase, table=True):
 
 class FactBook(AnalyticalBase, table=True):
     __tablename__ = "fact_books"
+    __table_args__ = (
+        # Covering index for per-category queries: the dimension keys are read
+        # from the index, so filtering by category never scans the whole table
+        Index(
+            "ix_fact_books_category_id", "category_id",
+            postgresql_include=["price_id", "stock_id"]
+        ),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     upc: str = Field(unique=True)
@@ -72,11 +99,114 @@ class FactBook(AnalyticalBase, table=True):
     image_url: str
 
     category_id: Optional[int] = Field(foreign_key="dim_category.id")
-    stock_id: Optional[int] = Field(foreign_key="dim_stock.id")
-    score_id: Optional[int] = Field(foreign_key="dim_score.id")
-    price_id: Optional[int] = Field(foreign_key="dim_price.id")
+    stock_id: Optional[int] = Field(foreign_key="dim_stock.id", index=True)
+    score_id: Optional[int] = Field(foreign_key="dim_score.id", index=True)
+    price_id: Optional[int] = Field(foreign_key="dim_price.id", index=True)
 
     category: Optional[DimCategory] = Relationship(back_populates="fact_books")
     stock: Optional[DimStock] = Relationship(back_populates="fact_books")
     score: Optional[DimScore] = Relationship(back_populates="fact_books")
-    price: Optional[DimPrice] = Relationship(back_populates="fact_books")
\ No newline at end of file
+    price: Optional[DimPrice] = Relationship(back_populates="fact_books")
+
+# Hash partitions of fact_books_wide by category_id; 0 keeps it a plain table.
+# Hash rather than list partitioning, so new categories need no new partitions;
+# books without a category (NULL key) land in the partition of remainder 0
+WIDE_PROJECTION_PARTITIONS = int(os.getenv("WIDE_PROJECTION_PARTITIONS", "0"))
+WIDE_PROJECTION_PARTITION_KEY = "HASH (category_id)"
+
+
+class FactBookWide(AnalyticalBase, table=True):
+    """
+    Denormalized projection of fact_books: one row per book with its
+    category, price, tax, stock and score, so analyses need no joins.
+    Books without a category are kept with a NULL category, as in fact_books.
+    Rebuilt from the snowflake by aggregates.refresh_wide_projection.
+    """
+    __tablename__ = "fact_books_wide"
+    __table_args__ = (
+        Index("ix_fact_books_wide_upc", "upc"),
+        Index("ix_fact_books_wide_category_id", "category_id"),
+        Index("ix_fact_books_wide_price_before_tax", "price_before_tax"),
+        {"postgresql_partition_by": WIDE_PROJECTION_PARTITION_KEY} if WIDE_PROJECTION_PARTITIONS else {},
+    )
+    # The primary key of a partitioned table must include the partition key,
+    # which is NULL for books without a category, so partitioned it has none in
+    # PostgreSQL; refresh_wide_projection keeps one row per book either way
+    __mapper_args__ = {"primary_key": ["book_id"]}
+
+    book_id: int = Field(sa_column=Column(
+        Integer, primary_key=not WIDE_PROJECTION_PARTITIONS, nullable=False
+    ))
+    category_id: Optional[int] = None
+    upc: str
+    title: str
+    category_name: Optional[str] = None
+    price_before_tax: float = Field(sa_column=Column(Float))
+    price_after_tax: float = Field(sa_column=Column(Float))
+    price_range: str
+    tax_rate: Optional[float] = Field(default=None, sa_column=Column(Float))
+    stock_quantity: Optional[int] = None
+    stock_status: Optional[str] = None
+    score: Optional[float] = Field(default=None, sa_column=Column(Float))
+
+
+for remainder in range(WIDE_PROJECTION_PARTITIONS):
+    event.listen(FactBookWide.__table__, "after_create", DDL(
+        f"CREATE TABLE IF NOT EXISTS fact_books_wide_p{remainder} PARTITION OF fact_books_wide "
+        f"FOR VALUES WITH (MODULUS {WIDE_PROJECTION_PARTITIONS}, REMAINDER {remainder})"
+    ))
+
+
+class FactBookSnapshot(AnalyticalBase, table=True):
+    """
+    Append-only history: the state of every book as each load saw it.
+    Range-partitioned by month of snapshot_at (snapshots.ensure_snapshot_partitions),
+    with a BRIN index on snapshot_at since rows arrive in time order.
+    Pinned to public with etl_runs, so blue-green swaps never discard history;
+    it stores the category name because dimension ids change between loads.
+    """
+    __tablename__ = "fact_book_snapshot"
+    __table_args__ = (
+        Index("ix_fact_book_snapshot_snapshot_at", "snapshot_at", postgresql_using="brin"),
+        {"schema": "public", "postgresql_partition_by": "RANGE (snapshot_at)"},
+    )
+
+    # The partition key has to be part of the primary key; upc first serves per-book history
+    upc: str = Field(primary_key=True)
+    snapshot_at: datetime = Field(primary_key=True)
+    title: str
+    category_name: Optional[str] = None
+    price_before_tax: float = Field(sa_column=Column(Float))
+    price_after_tax: float = Field(sa_column=Column(Float))
+    price_range: str
+    tax_rate: Optional[float] = Field(default=None, sa_column=Column(Float))
+    stock_quantity: Optional[int] = None
+    stock_status: Optional[str] = None
+    score: Optional[float] = Field(default=None, sa_column=Column(Float))
+
+
+class EtlRun(AnalyticalBase, table=True):
+    __tablename__ = "etl_runs"
+    __table_args__ = (
+        # Named explicitly: the default name would include the schema
+        Index("ix_etl_runs_started_at", "started_at"),
+        {"schema": "public"},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    mode: str
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    books_extracted: int = Field(default=0)
+    books_transferred: int = Field(default=0)
+    books_skipped: int = Field(default=0)
+    books_failed: int = Field(default=0)
+    extract_seconds: float = Field(sa_column=Column(Float))
+    transform_seconds: float = Field(sa_column=Column(Float))
+    load_seconds: float = Field(sa_column=Column(Float))
+    total_seconds: float = Field(sa_column=Column(Float))
+    rows_per_second: float = Field(sa_column=Column(Float))
+    query_count: int = Field(default=0)
+    peak_memory_bytes: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
+    metrics: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
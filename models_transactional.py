@@ -1,7 +1,7 @@
 from typing import Optional, List
 from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, Float, MetaData
+from sqlalchemy import Column, Float, Index, MetaData, text
 
 # Create separate metadata for transactional models
 transactional_metadata = MetaData()
@@ -68,4 +68,44 @@ class TaxRate(TransactionalBase, table=True):
     
     id: Optional[int] = Field(default=None, primary_key=True)
     tax_float: float = Field(sa_column=Column(Float), default=0.0)
-    date: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    date: datetime = Field(default_factory=datetime.now)
+
+
+class ScrapeTask(TransactionalBase, table=True):
+    """A page to fetch in a distributed crawl (see scrape_queue.py)"""
+    __tablename__ = "scrape_tasks"
+    __table_args__ = (
+        # Claimable tasks in claim order; done and failed tasks stay out of the index
+        Index(
+            "ix_scrape_tasks_claimable", "priority", "id",
+            postgresql_where=text("status IN ('pending', 'leased')")
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    url: str = Field(unique=True)
+    kind: str
+    category_name: Optional[str] = None
+    # Lower runs first: books before category pages before the index, so the queue stays short
+    priority: int = Field(default=0)
+    status: str = Field(default="pending")
+    attempts: int = Field(default=0)
+    worker_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+class ScrapeWorker(TransactionalBase, table=True):
+    """A crawl worker process, with its heartbeat and counters"""
+    __tablename__ = "scrape_workers"
+
+    id: str = Field(primary_key=True)
+    host: str
+    pid: int
+    status: str = Field(default="running")
+    started_at: datetime = Field(default_factory=datetime.now)
+    last_heartbeat: datetime = Field(default_factory=datetime.now)
+    tasks_done: int = Field(default=0)
+    tasks_failed: int = Field(default=0)
@@ -0,0 +1,245 @@
+"""
+Motor analítico columnar en memoria.
+
+Carga una sola vez el esquema copo de nieve en arreglos de NumPy (una
+columna por atributo, con categorías y títulos codificados por diccionario)
+y responde los siete análisis de analisis_libros desde memoria, con los
+mismos nombres de función y los mismos tipos de resultado.
+
+    from motor_columnar import MotorColumnar
+    motor = MotorColumnar.cargar()
+    motor.libro_mas_barato_por_categoria()
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlmodel import Session
+
+from consultas import DIRECCIONES, formatear_diferencia, hechos
+from etl import analytical_engine
+from models_analytical import DimCategory
+
+
+# Filas leídas por lote al cargar, para no materializar todo el resultado en Python
+TAMANO_LOTE = 50_000
+
+
+def redondear_centavos(valores: np.ndarray) -> np.ndarray:
+    """
+    Redondeo a centavos como round(numeric, 2) de PostgreSQL: mitades lejos
+    de cero (np.round redondea al par). Se redondea antes el ruido binario,
+    como el paso de float a numeric, para que 1.005 quede en 1.01.
+    """
+    centavos = np.round(np.abs(valores) * 100, 9)
+    return np.sign(valores) * np.floor(centavos + 0.5) / 100
+
+
+class MotorColumnar:
+    """Hechos de libros en columnas NumPy, con categorías y títulos como códigos enteros"""
+
+    def __init__(self, upc, titulo_codigo, titulos, categoria_codigo, categorias,
+                 precio, stock, num_categorias: int):
+        self.upc = upc                            # object[n]
+        self.titulo_codigo = titulo_codigo        # int32[n] -> titulos
+        self.titulos = titulos                    # object[t], ordenados
+        self.categoria_codigo = categoria_codigo  # int32[n] -> categorias
+        self.categorias = categorias              # object[c], ordenadas por nombre
+        self.precio = precio                      # float64[n]
+        self.stock = stock                        # float64[n], NaN sin stock
+        self.num_categorias = num_categorias
+
+    @classmethod
+    def cargar(cls, engine=analytical_engine) -> "MotorColumnar":
+        """Lee fact_books con sus dimensiones en un solo recorrido"""
+        h = hechos()
+        upcs, titulos, categorias, precios, stocks = [], [], [], [], []
+        with Session(engine) as session:
+            num_categorias = len(session.execute(select(DimCategory.id)).all())
+            # yield_per abre un cursor del servidor, que por defecto se planifica para
+            # devolver pronto las primeras filas; aquí se leen todas
+            session.execute(text("SET LOCAL cursor_tuple_fraction = 1.0"))
+            resultado = session.execute(
+                select(h.c.upc, h.c.titulo, h.c.categoria, h.c.precio, h.c.stock)
+                .execution_options(yield_per=TAMANO_LOTE)
+            )
+            for lote in resultado.partitions():
+                for upc, titulo, categoria, precio, stock in lote:
+                    upcs.append(upc)
+                    titulos.append(titulo)
+                    categorias.append(categoria)
+                    precios.append(precio)
+                    stocks.append(stock)
+
+        nombres_titulos, titulo_codigo = np.unique(np.array(titulos, dtype=object), return_inverse=True)
+        nombres_categorias, categoria_codigo = np.unique(np.array(categorias, dtype=object), return_inverse=True)
+        return cls(
+            upc=np.array(upcs, dtype=object),
+            titulo_codigo=titulo_codigo.astype(np.int32),
+            titulos=nombres_titulos,
+            categoria_codigo=categoria_codigo.astype(np.int32),
+            categorias=nombres_categorias,
+            precio=np.array(precios, dtype=np.float64),
+            stock=np.array([np.nan if s is None else s for s in stocks], dtype=np.float64),
+            num_categorias=num_categorias
+        )
+
+    def __len__(self) -> int:
+        return len(self.precio)
+
+    def memoria_bytes(self) -> int:
+        """Tamaño aproximado de las columnas (sin contar las cadenas de los diccionarios)"""
+        return sum(columna.nbytes for columna in (
+            self.upc, self.titulo_codigo, self.titulos, self.categoria_codigo,
+            self.categorias, self.precio, self.stock
+        ))
+
+    def _por_categoria(self, valores, funcion, inicial):
+        """Reduce valores por categoría con un ufunc (np.minimum, np.maximum...)"""
+        resultado = np.full(len(self.categorias), inicial, dtype=np.float64)
+        funcion.at(resultado, self.categoria_codigo, valores)
+        return resultado
+
+    def contar_categorias(self) -> int:
+        """a. ¿Cuántas categorías de libros se tienen?"""
+        return self.num_categorias
+
+    def libros_por_categoria(self) -> Dict[str, int]:
+        """b. ¿Cuántos libros hay por categoría?"""
+        conteos = np.bincount(self.categoria_codigo, minlength=len(self.categorias))
+        return {
+            categoria: int(cantidad)
+            for categoria, cantidad in zip(self.categorias, conteos) if cantidad > 0
+        }
+
+    def libro_mas_caro(self) -> Dict:
+        """c. ¿Cuál es el libro más caro?"""
+        if not len(self):
+            return None
+        # Entre los empatados en el precio máximo, el de menor UPC, como la consulta SQL
+        empatados = np.flatnonzero(self.precio == self.precio.max())
+        i = int(min(empatados, key=lambda j: self.upc[j]))
+        return {
+            "titulo": self.titulos[self.titulo_codigo[i]],
+            "precio": float(self.precio[i]),
+            "categoria": self.categorias[self.categoria_codigo[i]],
+            "upc": self.upc[i]
+        }
+
+    def libros_en_multiples_categorias(self) -> List[Dict]:
+        """d. ¿Hay algún libro que esté en dos categorías?"""
+        num_titulos = len(self.titulos)
+        primera = np.full(num_titulos, np.iinfo(np.int32).max, dtype=np.int64)
+        ultima = np.full(num_titulos, -1, dtype=np.int64)
+        np.minimum.at(primera, self.titulo_codigo, self.categoria_codigo)
+        np.maximum.at(ultima, self.titulo_codigo, self.categoria_codigo)
+
+        filas = np.flatnonzero((primera != ultima)[self.titulo_codigo])
+        # Títulos y categorías están codificados en orden, así que ordenar códigos ordena nombres
+        filas = filas[np.lexsort((self.categoria_codigo[filas], self.titulo_codigo[filas]))]
+
+        libros_duplicados = {}
+        for i in filas:
+            titulo = self.titulos[self.titulo_codigo[i]]
+            libros_duplicados.setdefault(titulo, []).append(self.categorias[self.categoria_codigo[i]])
+        return [{"titulo": titulo, "categorias": categorias}
+                for titulo, categorias in libros_duplicados.items()]
+
+    def libro_mas_barato_por_categoria(self) -> Dict[str, List[Dict]]:
+        """e. ¿Cuál es el libro más barato por categoría? Si es más de uno, se deben mostrar."""
+        minimo = self._por_categoria(self.precio, np.minimum, np.inf)
+        filas = np.flatnonzero(self.precio == minimo[self.categoria_codigo])
+        filas = filas[np.lexsort((self.upc[filas], self.categoria_codigo[filas]))]
+
+        resultado = {}
+        for i in filas:
+            resultado.setdefault(self.categorias[self.categoria_codigo[i]], []).append({
+                "titulo": self.titulos[self.titulo_codigo[i]],
+                "precio": float(self.precio[i]),
+                "upc": self.upc[i]
+            })
+        return resultado
+
+    def promedio_por_categoria(self):
+        conteos = np.bincount(self.categoria_codigo, minlength=len(self.categorias))
+        sumas = np.bincount(self.categoria_codigo, weights=self.precio, minlength=len(self.categorias))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sumas / conteos
+
+    def diferencia_vs_promedio_categoria(self) -> List[Dict]:
+        """f. ¿Cuánto más caro o barato es cada libro respecto al promedio de su categoría?"""
+        promedio = self.promedio_por_categoria()[self.categoria_codigo]
+        diferencia = self.precio - promedio
+        orden = np.lexsort((self.titulo_codigo, self.categoria_codigo))
+        return [
+            formatear_diferencia(
+                self.titulos[self.titulo_codigo[i]],
+                self.categorias[self.categoria_codigo[i]],
+                float(self.precio[i]),
+                float(promedio[i]),
+                float(diferencia[i])
+            )
+            for i in orden
+        ]
+
+    def ranking_diferencias(self, k: int = 5, direccion: str = "baratos",
+                            categorias: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Top-k de diferencias respecto al promedio, con argpartition en lugar de ordenar todo"""
+        if direccion not in DIRECCIONES:
+            raise ValueError(f"Dirección desconocida: {direccion} (use {' o '.join(DIRECCIONES)})")
+        promedio = self.promedio_por_categoria()[self.categoria_codigo]
+        diferencia = self.precio - promedio
+        filas = np.arange(len(self))
+        if categorias:
+            codigos = np.flatnonzero(np.isin(self.categorias, list(categorias)))
+            filas = filas[np.isin(self.categoria_codigo, codigos)]
+        if not len(filas) or k <= 0:
+            return []
+
+        signo = -1 if direccion == "caros" else 1
+        # La diferencia en centavos, como se muestra y como ordena la consulta SQL
+        clave = signo * redondear_centavos(diferencia[filas])
+        if k < len(filas):
+            # Candidatos: los k menores y los empatados con el k-ésimo
+            limite = clave[np.argpartition(clave, k - 1)[k - 1]]
+            filas, clave = filas[clave <= limite], clave[clave <= limite]
+        upc_codigo = np.unique(self.upc[filas], return_inverse=True)[1]
+        orden = np.lexsort((
+            signo * upc_codigo, signo * self.titulo_codigo[filas],
+            signo * self.categoria_codigo[filas], clave
+        ))[:k]
+        return [
+            formatear_diferencia(
+                self.titulos[self.titulo_codigo[i]],
+                self.categorias[self.categoria_codigo[i]],
+                float(self.precio[i]),
+                float(promedio[i]),
+                float(diferencia[i])
+            )
+            for i in filas[orden]
+        ]
+
+    def extremos_vs_promedio_categoria(self, k: int = 5) -> Dict[str, List[Dict]]:
+        return {direccion: self.ranking_diferencias(k, direccion) for direccion in DIRECCIONES}
+
+    def libro_mayor_ingreso_por_categoria(self) -> Dict[str, Dict]:
+        """g. Asumiendo que se venden todos los libros que están en stock en este momento
+        ¿Cuál es el libro que daría más ingresos por categoría?"""
+        con_stock = np.flatnonzero(~np.isnan(self.stock))
+        ingreso = self.precio[con_stock] * self.stock[con_stock]
+        categoria = self.categoria_codigo[con_stock]
+        # Por categoría, mayor ingreso primero y el UPC menor en caso de empate
+        orden = np.lexsort((self.upc[con_stock], -ingreso, categoria))
+        primeros = orden[np.r_[True, categoria[orden][1:] != categoria[orden][:-1]]] if len(orden) else orden
+
+        resultado = {}
+        for j in primeros:
+            i = con_stock[j]
+            resultado[self.categorias[self.categoria_codigo[i]]] = {
+                "titulo": self.titulos[self.titulo_codigo[i]],
+                "precio": float(self.precio[i]),
+                "stock": int(self.stock[i]),
+                "ingreso_potencial": round(float(ingreso[j]), 2),
+                "upc": self.upc[i]
+            }
+        return resultado
@@ -0,0 +1,106 @@
+"""
+Prueba de carga local del servicio de análisis.
+
+Lanza N clientes concurrentes contra servicio_analisis.py durante un tiempo
+fijo, repartidos entre los análisis y las páginas de libros. Con
+--revalidar, cada cliente reenvía el ETag recibido en If-None-Match para
+medir el camino de las respuestas 304.
+
+Uso:
+  python servicio_analisis.py &
+  python prueba_carga.py --concurrencia 200 --duracion 20 --revalidar
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List
+
+import aiohttp
+
+
+RUTAS = [
+    "/analisis/contar_categorias",
+    "/analisis/libros_por_categoria",
+    "/analisis/libro_mas_caro",
+    "/analisis/libro_mas_barato_por_categoria",
+    "/analisis/ranking_diferencias?k=10&direccion=caros",
+    "/analisis/libro_mayor_ingreso_por_categoria",
+    "/analisis/resumen_por_categoria",
+    "/libros?limite=50",
+    "/libros?rango_precio=Budget&limite=50",
+    "/libros?estado_stock=In%20Stock&limite=100",
+]
+
+
+async def cliente(sesion, url_base: str, fin: float, revalidar: bool,
+                  latencias: Dict[str, List[float]], estados: Counter):
+    etags: Dict[str, str] = {}
+    while time.monotonic() < fin:
+        ruta = random.choice(RUTAS)
+        cabeceras = {"If-None-Match": etags[ruta]} if revalidar and ruta in etags else {}
+        inicio = time.perf_counter()
+        try:
+            async with sesion.get(url_base + ruta, headers=cabeceras) as respuesta:
+                await respuesta.read()
+                estados[respuesta.status] += 1
+                if "ETag" in respuesta.headers:
+                    etags[ruta] = respuesta.headers["ETag"]
+        except aiohttp.ClientError as e:
+            estados[type(e).__name__] += 1
+        latencias.setdefault(ruta, []).append(time.perf_counter() - inicio)
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    return statistics.quantiles(valores, n=100)[int(p) - 1] if len(valores) > 1 else valores[0]
+
+
+def _resumen_latencias(valores: List[float]) -> Dict:
+    return {
+        "peticiones": len(valores),
+        "p50_ms": _percentil(valores, 50) * 1000,
+        "p95_ms": _percentil(valores, 95) * 1000,
+        "p99_ms": _percentil(valores, 99) * 1000,
+        "max_ms": max(valores) * 1000,
+    }
+
+
+async def prueba_carga(url_base: str, concurrencia: int, duracion: float, revalidar: bool) -> Dict:
+    latencias: Dict[str, List[float]] = {}
+    estados: Counter = Counter()
+    conector = aiohttp.TCPConnector(limit=concurrencia)
+    async with aiohttp.ClientSession(connector=conector) as sesion:
+        inicio = time.monotonic()
+        fin = inicio + duracion
+        await asyncio.gather(*(
+            cliente(sesion, url_base, fin, revalidar, latencias, estados)
+            for _ in range(concurrencia)
+        ))
+        segundos = time.monotonic() - inicio
+
+    todas = [latencia for valores in latencias.values() for latencia in valores]
+    return {
+        "concurrencia": concurrencia,
+        "segundos": segundos,
+        "peticiones": len(todas),
+        "peticiones_por_segundo": len(todas) / segundos,
+        "estados": {str(estado): cantidad for estado, cantidad in estados.items()},
+        "latencia": _resumen_latencias(todas) if todas else {},
+        "por_ruta": {ruta: _resumen_latencias(valores) for ruta, valores in sorted(latencias.items())},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de análisis")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrencia", type=int, default=100)
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos de prueba")
+    parser.add_argument("--revalidar", action="store_true",
+                        help="Reenviar el ETag recibido en If-None-Match")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(prueba_carga(args.url, args.concurrencia, args.duracion, args.revalidar))
+    print(json.dumps(resultado, indent=2))
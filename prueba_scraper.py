@@ -0,0 +1,112 @@
+"""
+Prueba de rendimiento del scraper contra el espejo local.
+
+Arranca espejo_toscrape.py en un proceso aparte con el tamaño y los fallos
+indicados, ejecuta perform_scraping contra él y devuelve en JSON el tiempo
+de la corrida, el ritmo de páginas y libros y los contadores del espejo
+(peticiones, 429 y 503 inyectados). Si no se recogen todos los libros del
+espejo, el resultado lleva un error y el programa termina con código 1.
+Los libros se guardan en la base de DATABASE_URL, así que conviene
+apuntarla a una base de pruebas.
+
+Uso:
+  python prueba_scraper.py --libros 2000 --latencia 20 --tasa-errores 0.01 --salida scraper.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, Optional
+
+from scraper import perform_scraping
+
+
+ESPEJO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "espejo_toscrape.py")
+
+
+def _esperar_espejo(url_base: str, proceso: subprocess.Popen, tiempo_maximo: float = 30.0):
+    limite = time.monotonic() + tiempo_maximo
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El espejo terminó antes de aceptar conexiones")
+        try:
+            urllib.request.urlopen(f"{url_base}/_espejo/estadisticas", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"El espejo no respondió en {tiempo_maximo:.0f}s")
+
+
+def _estadisticas(url_base: str) -> Dict:
+    with urllib.request.urlopen(f"{url_base}/_espejo/estadisticas", timeout=5) as respuesta:
+        return json.load(respuesta)
+
+
+def prueba_scraper(libros: int = 1000, puerto: int = 8081, latencia: float = 0.0,
+                   variacion: float = 0.0, tasa_errores: float = 0.0, limite: Optional[float] = None,
+                   driver_path: str = "/usr/bin/chromedriver") -> Dict:
+    url_base = f"http://127.0.0.1:{puerto}"
+    comando = [
+        sys.executable, ESPEJO, "--puerto", str(puerto), "--libros", str(libros),
+        "--latencia", str(latencia), "--variacion", str(variacion), "--tasa-errores", str(tasa_errores),
+    ]
+    if limite:
+        comando += ["--limite", str(limite)]
+
+    espejo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _esperar_espejo(url_base, espejo)
+        error = None
+        inicio = time.perf_counter()
+        try:
+            recogidos = perform_scraping(driver_path, page_url=f"{url_base}/index.html")
+        except Exception as e:
+            recogidos = None
+            error = f"{type(e).__name__}: {e}"
+        segundos = time.perf_counter() - inicio
+        if error is None and recogidos != libros:
+            error = f"Se recogieron {recogidos} de {libros} libros"
+        estadisticas = _estadisticas(url_base)
+    finally:
+        espejo.terminate()
+        espejo.wait()
+
+    peticiones = estadisticas.get("peticiones", 0)
+    return {
+        "espejo": {"libros": libros, "latencia_ms": latencia, "variacion_ms": variacion,
+                   "tasa_errores": tasa_errores, "limite_por_segundo": limite},
+        "segundos": segundos,
+        "libros_recogidos": recogidos,
+        "libros_por_segundo": recogidos / segundos if error is None and segundos else None,
+        "peticiones_por_segundo": peticiones / segundos if segundos else None,
+        "estadisticas_espejo": estadisticas,
+        "error": error,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de rendimiento del scraper contra el espejo local")
+    parser.add_argument("--libros", type=int, default=1000)
+    parser.add_argument("--puerto", type=int, default=8081)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Milisegundos de espera por respuesta")
+    parser.add_argument("--variacion", type=float, default=0.0, help="Desviación estándar de la latencia en ms")
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="Fracción de respuestas 503")
+    parser.add_argument("--limite", type=float, help="Peticiones por segundo antes de responder 429")
+    parser.add_argument("--driver-path", default="/usr/bin/chromedriver")
+    parser.add_argument("--salida", help="Archivo donde guardar el JSON")
+    args = parser.parse_args()
+
+    resultado = prueba_scraper(args.libros, args.puerto, args.latencia, args.variacion,
+                               args.tasa_errores, args.limite, args.driver_path)
+    salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(salida)
+        print(f"Resultados guardados en {args.salida}")
+    else:
+        print(salida)
+    if resultado["error"]:
+        sys.exit(f"Error: {resultado['error']}")
@@ -5,8 +5,20 @@ Este script:
 1. Inicializa la base de datos analítica si es necesario
 2. Transfiere los datos de la base transaccional a la analítica
 3. Muestra estadísticas del proceso
+
+Opciones:
+  --elt                 Ejecuta el ETL dentro de la base de datos (SQL por conjuntos)
+  --source-schema NAME  Esquema donde la base analítica ve las tablas transaccionales
+  --setup-fdw           Importa las tablas transaccionales con postgres_fdw antes del ELT
+  --revalue-tax [ID]    Recalcula los precios con una tasa de impuesto (la última por defecto)
+  --blue-green          Construye el esquema completo aparte y lo publica con un cambio atómico
+  --rollback            Vuelve a publicar la versión anterior a la última carga blue-green
+  --async               Ejecuta el ETL con asyncpg (etl_async.py)
+  --profile             Perfila cada etapa con cProfile y cuenta las consultas SQL por etapa
 """
 
+import argparse
+
 from etl import (
     transfer_data_to_analytical, 
     create_analytical_tables,
@@ -15,39 +27,60 @@ from etl import (
 from sqlmodel import Session, select
 from models_analytical import FactBook
 from etl import analytical_engine
+from instrumentation import profile_stage, profiled
 
 
-def run_etl_process():
+def run_etl_process(elt: bool = False, source_schema: str = None, setup_fdw: bool = False,
+                    blue_green: bool = False, async_etl: bool = False):
     """Ejecuta el proceso ETL completo"""
     
     print("\n" + "="*60)
     print("PROCESO ETL - TRANSFERENCIA A BASE DE DATOS ANALÍTICA")
     print("="*60)
     
-    # Verificar si las tablas analíticas existen
-    try:
-        with Session(analytical_engine) as session:
-            # Intenta hacer una consulta simple para verificar si las tablas existen
-            session.exec(select(FactBook).limit(1)).first()
-            print("\n✓ Base de datos analítica detectada")
-    except Exception as e:
-        print("\n⚠ Base de datos analítica no encontrada. Creando tablas...")
-        create_analytical_tables()
-        print("✓ Tablas analíticas creadas exitosamente")
+    # Verificar si las tablas analíticas existen (la carga blue-green crea las suyas)
+    if not blue_green:
+        try:
+            with Session(analytical_engine) as session:
+                # Intenta hacer una consulta simple para verificar si las tablas existen
+                session.exec(select(FactBook).limit(1)).first()
+                print("\n✓ Base de datos analítica detectada")
+        except Exception as e:
+            print("\n⚠ Base de datos analítica no encontrada. Creando tablas...")
+            create_analytical_tables()
+            print("✓ Tablas analíticas creadas exitosamente")
     
     # Ejecutar transferencia de datos
     print("\n" + "-"*60)
     print("Iniciando transferencia de datos...")
     print("-"*60)
     
-    transfer_data_to_analytical()
+    if elt or setup_fdw:
+        from elt_pushdown import setup_foreign_source, transfer_data_to_analytical_elt
+
+        if setup_fdw:
+            source_schema = source_schema or "transactional"
+            setup_foreign_source(source_schema)
+        transfer_data_to_analytical_elt(source_schema)
+    elif blue_green:
+        from blue_green import transfer_data_to_analytical_blue_green
+
+        transfer_data_to_analytical_blue_green()
+    elif async_etl:
+        import asyncio
+        from etl_async import main as transfer_data_to_analytical_async
+
+        asyncio.run(transfer_data_to_analytical_async())
+    else:
+        transfer_data_to_analytical()
     
     # Mostrar estadísticas
     print("\n" + "-"*60)
     print("ESTADÍSTICAS FINALES")
     print("-"*60)
     
-    show_analytical_statistics()
+    with profile_stage("statistics"):
+        show_analytical_statistics()
     
     print("\n" + "="*60)
     print("PROCESO ETL COMPLETADO EXITOSAMENTE")
@@ -55,8 +88,35 @@ def run_etl_process():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proceso ETL hacia la base de datos analítica")
+    parser.add_argument("--elt", action="store_true",
+                        help="Construir el esquema copo de nieve con SQL dentro de la base de datos")
+    parser.add_argument("--source-schema", default=None,
+                        help="Esquema con las tablas transaccionales (por defecto ELT_SOURCE_SCHEMA)")
+    parser.add_argument("--setup-fdw", action="store_true",
+                        help="Importar las tablas transaccionales con postgres_fdw")
+    parser.add_argument("--revalue-tax", nargs="?", type=int, const=0, default=None, metavar="ID",
+                        help="Revaluar los precios con la tasa de impuesto ID (la última si se omite)")
+    parser.add_argument("--blue-green", action="store_true",
+                        help="Cargar en un esquema sombra y publicarlo con un cambio atómico (requiere ANALYTICAL_SCHEMA)")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Volver a publicar la versión anterior a la última carga blue-green")
+    parser.add_argument("--async", dest="async_etl", action="store_true",
+                        help="Ejecutar el ETL con el driver asíncrono asyncpg")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada etapa con cProfile y contar las consultas SQL por etapa")
+    args = parser.parse_args()
+
     try:
-        run_etl_process()
+        with profiled("run_etl", args.profile):
+            if args.revalue_tax is not None:
+                from etl import revalue_tax
+                revalue_tax(args.revalue_tax or None)
+            elif args.rollback:
+                from blue_green import rollback_analytical
+                rollback_analytical()
+            else:
+                run_etl_process(args.elt, args.source_schema, args.setup_fdw, args.blue_green, args.async_etl)
     except Exception as e:
         print(f"\n❌ Error durante el proceso ETL: {e}")
         print("\nPosibles causas:")
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""
+Distributed crawl on a PostgreSQL work queue.
+
+Every page to fetch is a row of scrape_tasks: the index page, each category
+page (following its pagination) and each book page. Any number of worker
+processes, on any host that reaches the transactional database, claim small
+batches with FOR UPDATE SKIP LOCKED, so no two workers get the same task and
+none waits on another. A claimed task is leased; a background thread renews
+the leases of its worker, and tasks whose lease expired (the worker died)
+go back to pending until they exhaust their attempts. Book pages are saved
+with save_book_information, which is idempotent by UPC, so a task retried
+after a crash does not duplicate books.
+
+Usage:
+  python scrape_queue.py seed --url https://books.toscrape.com/index.html
+  python scrape_queue.py worker --batch-size 5          # on as many hosts as wanted
+  python scrape_queue.py status --watch 5
+  python scrape_queue.py requeue --failed
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from crud import save_book_information
+from database import create_tables, engine as transactional_engine
+from models_transactional import ScrapeTask
+from scraper import (
+    PAGE_URL, WebDriverType, create_driver, next_page_url,
+    read_categories, read_category_page, visit_book_page
+)
+
+
+DEFAULT_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", "5"))
+LEASE_SECONDS = float(os.getenv("SCRAPE_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "3"))
+POLL_SECONDS = float(os.getenv("SCRAPE_POLL_SECONDS", "2"))
+
+# Books first, then category pages, then the index: the queue stays short
+PRIORITIES = {"book": 0, "category": 1, "index": 2}
+
+
+def enqueue(conn, tasks: List[Dict]) -> int:
+    """Add tasks ({url, kind, category_name}); URLs already queued are ignored"""
+    if not tasks:
+        return 0
+    statement = pg_insert(ScrapeTask.__table__).values([
+        {
+            "url": task["url"],
+            "kind": task["kind"],
+            "category_name": task.get("category_name"),
+            "priority": PRIORITIES[task["kind"]],
+            "status": "pending",
+            "attempts": 0,
+            "created_at": text("now()"),
+        }
+        for task in tasks
+    ]).on_conflict_do_nothing(index_elements=["url"])
+    return conn.execute(statement).rowcount
+
+
+def seed(page_url: str = PAGE_URL, reset: bool = False) -> int:
+    """Create the queue tables and enqueue the index page"""
+    create_tables()
+    with transactional_engine.begin() as conn:
+        if reset:
+            conn.execute(text("TRUNCATE scrape_tasks, scrape_workers"))
+        return enqueue(conn, [{"url": page_url, "kind": "index"}])
+
+
+def reap_expired(conn, max_attempts: int = MAX_ATTEMPTS) -> int:
+    """Return tasks whose lease expired to pending, or fail them after max_attempts"""
+    return conn.execute(text("""
+        UPDATE scrape_tasks
+        SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+            worker_id = NULL, lease_expires_at = NULL, error = 'lease expired'
+        WHERE id IN (
+            SELECT id FROM scrape_tasks
+            WHERE status = 'leased' AND lease_expires_at < now()
+            FOR UPDATE SKIP LOCKED
+        )
+    """), {"max_attempts": max_attempts}).rowcount
+
+
+def claim_tasks(worker_id: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS) -> List[Dict]:
+    """Lease up to batch_size pending tasks, skipping the rows other workers are claiming"""
+    with transactional_engine.begin() as conn:
+        reap_expired(conn, max_attempts)
+        rows = conn.execute(text("""
+            UPDATE scrape_tasks
+            SET status = 'leased', worker_id = :worker_id, attempts = attempts + 1,
+                lease_expires_at = now() + make_interval(secs => :lease_seconds)
+            WHERE id IN (
+                SELECT id FROM scrape_tasks
+                WHERE status = 'pending'
+                ORDER BY priority, id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, url, kind, category_name, attempts
+        """), {"worker_id": worker_id, "lease_seconds": lease_seconds, "batch_size": batch_size})
+        return sorted((dict(row) for row in rows.mappings()), key=lambda t: (PRIORITIES[t["kind"]], t["id"]))
+
+
+def heartbeat(worker_id: str, lease_seconds: float = LEASE_SECONDS):
+    """Renew the leases of a worker's tasks and record that it is alive"""
+    with transactional_engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE scrape_tasks SET lease_expires_at = now() + make_interval(secs => :lease_seconds)
+            WHERE worker_id = :worker_id AND status = 'leased'
+        """), {"worker_id": worker_id, "lease_seconds": lease_seconds})
+        conn.execute(text(
+            "UPDATE scrape_workers SET last_heartbeat = now() WHERE id = :worker_id"
+        ), {"worker_id": worker_id})
+
+
+def complete_task(task: Dict, worker_id: str, discovered: List[Dict]) -> bool:
+    """
+    Mark a task done and enqueue the pages found on it, in one transaction.
+    False if the lease was lost meanwhile (the task was handed to another worker).
+    """
+    with transactional_engine.begin() as conn:
+        owned = conn.execute(text("""
+            UPDATE scrape_tasks SET status = 'done', finished_at = now(), lease_expires_at = NULL, error = NULL
+            WHERE id = :id AND worker_id = :worker_id AND status = 'leased'
+        """), {"id": task["id"], "worker_id": worker_id}).rowcount
+        enqueue(conn, discovered)
+        if owned:
+            conn.execute(text(
+                "UPDATE scrape_workers SET tasks_done = tasks_done + 1 WHERE id = :worker_id"
+            ), {"worker_id": worker_id})
+    return bool(owned)
+
+
+def fail_task(task: Dict, worker_id: str, error: str, max_attempts: int = MAX_ATTEMPTS) -> bool:
+    """
+    Put a failed task back to pending, or mark it failed after max_attempts.
+    False if the lease was lost meanwhile; the failure is then not counted.
+    """
+    with transactional_engine.begin() as conn:
+        owned = conn.execute(text("""
+            UPDATE scrape_tasks
+            SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+                worker_id = NULL, lease_expires_at = NULL, error = :error
+            WHERE id = :id AND worker_id = :worker_id AND status = 'leased'
+        """), {"id": task["id"], "worker_id": worker_id, "error": error[:1000], "max_attempts": max_attempts}).rowcount
+        if owned:
+            conn.execute(text(
+                "UPDATE scrape_workers SET tasks_failed = tasks_failed + 1 WHERE id = :worker_id"
+            ), {"worker_id": worker_id})
+    return bool(owned)
+
+
+def release_tasks(worker_id: str):
+    """Give back the tasks a stopping worker still holds, without spending an attempt"""
+    with transactional_engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE scrape_tasks
+            SET status = 'pending', worker_id = NULL, lease_expires_at = NULL, attempts = attempts - 1
+            WHERE worker_id = :worker_id AND status = 'leased'
+        """), {"worker_id": worker_id})
+
+
+def queue_drained() -> bool:
+    """True when no task is pending or leased"""
+    with transactional_engine.connect() as conn:
+        return not conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM scrape_tasks WHERE status IN ('pending', 'leased'))"
+        )).scalar_one()
+
+
+def process_task(task: Dict, driver) -> List[Dict]:
+    """Fetch one page; returns the tasks for the pages it links to"""
+    if task["kind"] == "index":
+        return [
+            {"url": category["url"], "kind": "category", "category_name": category["name"]}
+            for category in read_categories(task["url"], driver)
+        ]
+    if task["kind"] == "category":
+        category_name, urls = read_category_page(task["url"], driver)
+        discovered = [{"url": url, "kind": "book", "category_name": category_name} for url in urls]
+        next_url = next_page_url(driver)
+        if next_url:
+            discovered.append({"url": next_url, "kind": "category", "category_name": category_name})
+        return discovered
+    if task["kind"] == "book":
+        save_book_information(visit_book_page(task["url"], driver), task["category_name"])
+        return []
+    raise ValueError(f"Unknown task kind: {task['kind']}")
+
+
+class QueueWorker:
+    """Claim, fetch and complete tasks until the queue is drained or the worker is stopped"""
+
+    def __init__(self, driver_path: str = "/usr/bin/chromedriver",
+                 web_driver_type: WebDriverType = WebDriverType.CHROME,
+                 batch_size: int = DEFAULT_BATCH_SIZE, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, exit_when_drained: bool = True):
+        self.driver_path = driver_path
+        self.web_driver_type = web_driver_type
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.exit_when_drained = exit_when_drained
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.stopping = False
+        self._heartbeat_stop = threading.Event()
+
+    def stop(self, *_):
+        """Signal handler: finish the current page, give back the rest and exit"""
+        if not self.stopping:
+            print("\nStopping after the current page...")
+        self.stopping = True
+
+    def _register(self):
+        with transactional_engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO scrape_workers (id, host, pid, status, started_at, last_heartbeat, tasks_done, tasks_failed)
+                VALUES (:id, :host, :pid, 'running', now(), now(), 0, 0)
+            """), {"id": self.id, "host": socket.gethostname(), "pid": os.getpid()})
+
+    def _unregister(self):
+        release_tasks(self.id)
+        with transactional_engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE scrape_workers SET status = 'stopped', last_heartbeat = now() WHERE id = :id"
+            ), {"id": self.id})
+
+    def _heartbeat_loop(self):
+        # Renew well before the lease runs out, so one slow round trip does not lose it
+        while not self._heartbeat_stop.wait(self.lease_seconds / 3):
+            try:
+                heartbeat(self.id, self.lease_seconds)
+            except Exception as e:
+                print(f"Warning: heartbeat failed: {e}")
+
+    def run(self):
+        self._register()
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat_thread.start()
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        print(f"Worker {self.id} started (batch size {self.batch_size}, lease {self.lease_seconds:.0f}s)")
+
+        driver = None
+        try:
+            driver = create_driver(self.driver_path, self.web_driver_type)
+            while not self.stopping:
+                tasks = claim_tasks(self.id, self.batch_size, self.lease_seconds, self.max_attempts)
+                if not tasks:
+                    if self.exit_when_drained and queue_drained():
+                        print("Queue drained")
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+                for task in tasks:
+                    if self.stopping:
+                        break
+                    try:
+                        discovered = process_task(task, driver)
+                    except Exception as e:
+                        print(f"Failed {task['kind']} {task['url']} (attempt {task['attempts']}): {e}")
+                        fail_task(task, self.id, f"{type(e).__name__}: {e}", self.max_attempts)
+                        continue
+                    if not complete_task(task, self.id, discovered):
+                        print(f"Lease lost on {task['url']}, another worker will redo it")
+        finally:
+            self._heartbeat_stop.set()
+            heartbeat_thread.join()
+            if driver is not None:
+                driver.quit()
+            self._unregister()
+        print(f"Worker {self.id} stopped")
+
+
+def queue_status() -> Dict:
+    """Task counts by kind and status, recent throughput and every worker with its rate"""
+    with transactional_engine.connect() as conn:
+        counts = conn.execute(text(
+            "SELECT kind, status, count(*) AS tasks FROM scrape_tasks GROUP BY kind, status ORDER BY kind, status"
+        )).mappings().all()
+        done_last_minute = conn.execute(text(
+            "SELECT count(*) FROM scrape_tasks WHERE status = 'done' AND finished_at > now() - interval '60 seconds'"
+        )).scalar_one()
+        workers = conn.execute(text("""
+            SELECT w.id, w.host, w.pid, w.status, w.started_at, w.last_heartbeat,
+                   w.tasks_done, w.tasks_failed,
+                   extract(epoch FROM w.last_heartbeat - w.started_at) AS seconds,
+                   extract(epoch FROM now() - w.last_heartbeat) AS heartbeat_age,
+                   (SELECT count(*) FROM scrape_tasks t WHERE t.worker_id = w.id AND t.status = 'leased') AS leased
+            FROM scrape_workers w
+            ORDER BY w.started_at
+        """)).mappings().all()
+
+    result = {"tasks": {}, "done_per_minute": done_last_minute, "workers": []}
+    for row in counts:
+        result["tasks"].setdefault(row["kind"], {})[row["status"]] = row["tasks"]
+    for worker in workers:
+        seconds = float(worker["seconds"] or 0)
+        status = worker["status"]
+        # A running worker that missed several heartbeats is presumed dead
+        if status == "running" and float(worker["heartbeat_age"]) > LEASE_SECONDS:
+            status = "dead"
+        result["workers"].append({
+            "id": worker["id"],
+            "host": worker["host"],
+            "pid": worker["pid"],
+            "status": status,
+            "leased": worker["leased"],
+            "tasks_done": worker["tasks_done"],
+            "tasks_failed": worker["tasks_failed"],
+            "tasks_per_minute": worker["tasks_done"] * 60 / seconds if seconds > 0 else 0.0,
+        })
+    return result
+
+
+def print_status(status: Dict):
+    print(f"\n{'kind':10} {'pending':>8} {'leased':>8} {'done':>8} {'failed':>8}")
+    for kind in sorted(status["tasks"], key=lambda k: PRIORITIES.get(k, 99)):
+        counts = status["tasks"][kind]
+        print(
+            f"{kind:10} {counts.get('pending', 0):8d} {counts.get('leased', 0):8d} "
+            f"{counts.get('done', 0):8d} {counts.get('failed', 0):8d}"
+        )
+    print(f"Throughput: {status['done_per_minute']} tasks in the last minute")
+
+    print(f"\n{'worker':36} {'status':8} {'leased':>6} {'done':>7} {'failed':>7} {'tasks/min':>10}")
+    for worker in status["workers"]:
+        print(
+            f"{worker['id'][:36]:36} {worker['status']:8} {worker['leased']:6d} "
+            f"{worker['tasks_done']:7d} {worker['tasks_failed']:7d} {worker['tasks_per_minute']:10.1f}"
+        )
+
+
+def requeue(failed: bool = False) -> int:
+    """Requeue expired leases now and, with failed=True, the tasks that exhausted their attempts"""
+    with transactional_engine.begin() as conn:
+        requeued = reap_expired(conn)
+        if failed:
+            requeued += conn.execute(text(
+                "UPDATE scrape_tasks SET status = 'pending', attempts = 0, error = NULL WHERE status = 'failed'"
+            )).rowcount
+    return requeued
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed crawl on a PostgreSQL work queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Create the queue and enqueue the index page")
+    seed_parser.add_argument("--url", default=PAGE_URL)
+    seed_parser.add_argument("--reset", action="store_true", help="Empty the queue and the worker list first")
+
+    worker_parser = commands.add_parser("worker", help="Run a worker until the queue is drained")
+    worker_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                               help="Tasks claimed per round trip")
+    worker_parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                               help="Seconds a claimed task stays leased without a heartbeat")
+    worker_parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    worker_parser.add_argument("--driver-path", default="/usr/bin/chromedriver")
+    worker_parser.add_argument("--driver", choices=[t.value for t in WebDriverType],
+                               default=WebDriverType.CHROME.value)
+    worker_parser.add_argument("--keep-running", action="store_true",
+                               help="Keep polling when the queue is empty instead of exiting")
+
+    status_parser = commands.add_parser("status", help="Show queue progress and worker throughput")
+    status_parser.add_argument("--watch", type=float, metavar="SECONDS",
+                               help="Refresh every SECONDS until interrupted")
+
+    requeue_parser = commands.add_parser("requeue", help="Requeue expired leases")
+    requeue_parser.add_argument("--failed", action="store_true",
+                                help="Also retry the tasks that exhausted their attempts")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        added = seed(args.url, args.reset)
+        print(f"Queued {args.url}" if added else f"{args.url} was already queued")
+    elif args.command == "worker":
+        QueueWorker(
+            args.driver_path, WebDriverType(args.driver), args.batch_size, args.lease,
+            args.max_attempts, exit_when_drained=not args.keep_running
+        ).run()
+    elif args.command == "status":
+        while True:
+            print_status(queue_status())
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    elif args.command == "requeue":
+        print(f"Requeued {requeue(args.failed)} tasks")
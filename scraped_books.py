@@ -0,0 +1,91 @@
+"""
+Typed records for scraped books.
+
+visit_book_page parses each product page into a ScrapedBook (price as float,
+stock and rating as int), so malformed values fail at extraction time instead
+of in the ORM. ScrapedBookBatch accumulates books column-wise for
+crud.save_book_batch: the numeric columns live in typed arrays and the text
+columns in plain lists, with no per-book object kept alive.
+"""
+import os
+import re
+from array import array
+from typing import Iterator, List, NamedTuple, Tuple
+
+
+# Books written to the database per bulk insert
+SAVE_BATCH_SIZE = int(os.getenv("SCRAPER_SAVE_BATCH", "200"))
+
+RATINGS = {"One": 1, "Two": 2, "Three": 3, "Four": 4, "Five": 5}
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+class ScrapedBook(NamedTuple):
+    upc: str
+    title: str
+    price: float
+    stock: int
+    image_url: str
+    description: str
+    rating: int
+
+
+def parse_price(text: str) -> float:
+    """'£51.77' -> 51.77"""
+    match = _NUMBER.search(text.replace(",", ""))
+    if not match:
+        raise ValueError(f"Price without a number: {text!r}")
+    return float(match.group())
+
+
+def parse_stock(text: str) -> int:
+    """'In stock (22 available)' -> 22, 'Out of stock' -> 0"""
+    match = _NUMBER.search(text)
+    return int(match.group()) if match else 0
+
+
+def parse_rating(css_class: str) -> int:
+    """'star-rating Three' -> 3, 0 when the class names no rating"""
+    for word in css_class.split():
+        if word in RATINGS:
+            return RATINGS[word]
+    return 0
+
+
+class ScrapedBookBatch:
+    """Chunk of scraped books stored column-wise, flushed by crud.save_book_batch"""
+
+    def __init__(self):
+        self.upcs: List[str] = []
+        self.titles: List[str] = []
+        self.prices = array("d")
+        self.stocks = array("i")
+        self.image_urls: List[str] = []
+        self.descriptions: List[str] = []
+        self.ratings = array("b")
+        self.categories: List[str] = []
+
+    def append(self, book: ScrapedBook, category_name: str):
+        self.upcs.append(book.upc)
+        self.titles.append(book.title)
+        self.prices.append(book.price)
+        self.stocks.append(book.stock)
+        self.image_urls.append(book.image_url)
+        self.descriptions.append(book.description)
+        self.ratings.append(book.rating)
+        self.categories.append(category_name)
+
+    def __len__(self) -> int:
+        return len(self.upcs)
+
+    def __iter__(self) -> Iterator[Tuple[ScrapedBook, str]]:
+        for i in range(len(self.upcs)):
+            yield ScrapedBook(
+                self.upcs[i], self.titles[i], self.prices[i], self.stocks[i],
+                self.image_urls[i], self.descriptions[i], self.ratings[i]
+            ), self.categories[i]
+
+    def clear(self):
+        for column in vars(self).values():
+            del column[:]
@@ -1,11 +1,22 @@
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from typing import Optional
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-from crud import save_book_information
+from crud import save_book_batch
+from fetch_governor import MAX_CONCURRENCY, FetchGovernor
+from instrumentation import profile_stage, profiled
+from scraped_books import (
+    SAVE_BATCH_SIZE, ScrapedBook, ScrapedBookBatch, parse_price, parse_rating, parse_stock
+)
 
 
 
@@ -17,79 +28,203 @@ class WebDriverType(Enum):
     INTERNET_EXPLORER = 'internet explorer'
 
 
-PAGE_URL = "https://books.toscrape.com/index.html"
+# Point SCRAPER_PAGE_URL at a local mirror (espejo_toscrape.py) to scrape offline
+PAGE_URL = os.getenv("SCRAPER_PAGE_URL", "https://books.toscrape.com/index.html")
 
-def perform_scraping(driver_path='/usr/bin/chromedriver', web_driver_type: WebDriverType=WebDriverType.CHROME):
+# Rate and concurrency limits per host, shared by every thread (and queue worker) of this process
+GOVERNOR = FetchGovernor()
+
+# The browser does not hand the HTTP status to WebDriver; Navigation Timing exposes it
+RESPONSE_STATUS_SCRIPT = (
+    "const entry = performance.getEntriesByType('navigation')[0];"
+    "return entry && entry.responseStatus ? entry.responseStatus : null;"
+)
+
+def create_driver(driver_path='/usr/bin/chromedriver', web_driver_type: WebDriverType=WebDriverType.CHROME):
     service = Service(executable_path=driver_path)
 
-    if web_driver_type == WebDriverType.CHROME:
-        driver = webdriver.Chrome(service=service)
-    elif web_driver_type == WebDriverType.EDGE:
-        driver = webdriver.Edge(service=service)
-    elif web_driver_type == WebDriverType.FIREFOX:
-        driver = webdriver.Firefox(service=service)
-    elif web_driver_type == WebDriverType.SAFARI:
-        driver = webdriver.Safari(service=service)
-    elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
-        driver = webdriver.Ie(service=service)
-    else:
-        raise ValueError(f"Web driver type {web_driver_type} not supported")
-
-    driver.get(PAGE_URL)
+    with profile_stage("webdriver_start"):
+        if web_driver_type == WebDriverType.CHROME:
+            return webdriver.Chrome(service=service)
+        elif web_driver_type == WebDriverType.EDGE:
+            return webdriver.Edge(service=service)
+        elif web_driver_type == WebDriverType.FIREFOX:
+            return webdriver.Firefox(service=service)
+        elif web_driver_type == WebDriverType.SAFARI:
+            return webdriver.Safari(service=service)
+        elif web_driver_type == WebDriverType.INTERNET_EXPLORER:
+            return webdriver.Ie(service=service)
+        else:
+            raise ValueError(f"Web driver type {web_driver_type} not supported")
 
-    wait = WebDriverWait(driver, 10)
-    list_of_categories = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/aside/div[2]/ul/li/ul')))
-    
-    # Get all category links
-    category_links = list_of_categories.find_elements(By.TAG_NAME, 'a')
-    
-    # Extract href and text from each link
-    categories = []
-    for link in category_links:
-        href = link.get_attribute('href')
-        text = link.text.strip()
-        categories.append({'name': text, 'url': href})
-        print(f"Category: {text} - URL: {href}")
-    
-    # Collect all books from all categories
-    all_books = []
-    for category in categories:
-        books = visit_category_page(category['url'], driver)
-        all_books.extend(books)
+
+class DriverPool:
+    """One browser per thread, started on first use"""
+
+    def __init__(self, driver_path='/usr/bin/chromedriver', web_driver_type: WebDriverType=WebDriverType.CHROME):
+        self.driver_path = driver_path
+        self.web_driver_type = web_driver_type
+        self.drivers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def get(self):
+        driver = getattr(self._local, "driver", None)
+        if driver is None:
+            driver = create_driver(self.driver_path, self.web_driver_type)
+            self._local.driver = driver
+            with self._lock:
+                self.drivers.append(driver)
+        return driver
+
+    def run(self, executor: Optional[ThreadPoolExecutor], read, *args):
+        """read(*args, driver) with a browser of the pool: on this thread, or on one of executor's"""
+        if executor is None:
+            return read(*args, self.get())
+        return executor.submit(lambda: read(*args, self.get())).result()
+
+    def quit_all(self):
+        for driver in self.drivers:
+            driver.quit()
+        self.drivers.clear()
+
+
+def perform_scraping(driver_path='/usr/bin/chromedriver', web_driver_type: WebDriverType=WebDriverType.CHROME,
+                     page_url: str = PAGE_URL, max_concurrency: int = MAX_CONCURRENCY) -> int:
+    """
+    Crawl every category and save its books, SAVE_BATCH_SIZE at a time.
+    Every page is fetched by one of at most max_concurrency browsers (the
+    index and category pages too, so the main thread starts none of its
+    own); how many actually run at once is decided by GOVERNOR from the
+    latency and errors of the site. Returns the number of books read.
+    """
+    pool = DriverPool(driver_path, web_driver_type)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency) if max_concurrency > 1 else None
+    batch = ScrapedBookBatch()
+    total_books = 0
+    try:
+        categories = pool.run(executor, read_categories, page_url)
+
+        for category in categories:
+            total_books += visit_category_page(category['url'], batch, pool, executor)
+        flush_batch(batch)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        pool.quit_all()
+
+    print(f"\nTotal books collected: {total_books}")
+    return total_books
+
+
+def flush_batch(batch: ScrapedBookBatch):
+    with profile_stage("save_batch"):
+        save_book_batch(batch)
+    batch.clear()
+
+
+def response_status(driver):
+    """HTTP status of the page just loaded, or None if the browser does not report it"""
+    try:
+        return driver.execute_script(RESPONSE_STATUS_SCRIPT)
+    except Exception:
+        return None
+
+
+def fetch_page(driver, url: str):
+    """Load url in the browser under the host's rate and concurrency limits, retrying 429/5xx"""
+    def load():
+        driver.get(url)
+        return response_status(driver)
+
+    return GOVERNOR.fetch(url, load)
+
+
+def read_categories(page_url: str, driver):
+    """Name and URL of every category listed in the sidebar of the index page"""
+    with profile_stage("category_list"):
+        fetch_page(driver, page_url)
+
+        wait = WebDriverWait(driver, 10)
+        list_of_categories = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/aside/div[2]/ul/li/ul')))
+        
+        # Get all category links
+        category_links = list_of_categories.find_elements(By.TAG_NAME, 'a')
         
-    driver.quit()
-    
-    print(f"\nTotal books collected: {len(all_books)}")
-    return all_books
+        # Extract href and text from each link
+        categories = []
+        for link in category_links:
+            href = link.get_attribute('href')
+            text = link.text.strip()
+            categories.append({'name': text, 'url': href})
+            print(f"Category: {text} - URL: {href}")
+    return categories
 
 
-def visit_category_page(link: str, driver):
-    driver.get(link)
+def read_category_page(link: str, driver):
+    """Category name and book URLs of a category page"""
+    with profile_stage("category_page"):
+        fetch_page(driver, link)
 
-    wait = WebDriverWait(driver, 10)
+        wait = WebDriverWait(driver, 10)
+
+        category_name = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/div/div[1]/h1'))).text
+        list_of_books = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/div/section/div[2]/ol')))
+        
+        # Get all book links
+        book_links = list_of_books.find_elements(By.CSS_SELECTOR, 'h3 a')
+        
+        urls = []
+        for link in book_links:
+            book_url = link.get_attribute('href')
+            urls.append(book_url)
+    return category_name, urls
+
+
+def next_page_url(driver):
+    """URL of the next page of the current listing, or None on the last page"""
+    next_links = driver.find_elements(By.CSS_SELECTOR, 'ul.pager li.next a')
+    return next_links[0].get_attribute('href') if next_links else None
+
+
+def read_category_listing(link: str, driver):
+    """Category name, book URLs and next page URL of a category page, read with the same browser"""
+    category_name, urls = read_category_page(link, driver)
+    return category_name, urls, next_page_url(driver)
 
-    category_name = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/div/div[1]/h1'))).text
-    list_of_books = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="default"]/div/div/div/div/section/div[2]/ol')))
-    
-    # Get all book links
-    book_links = list_of_books.find_elements(By.CSS_SELECTOR, 'h3 a')
-    
-    urls = []
-    for link in book_links:
-        book_url = link.get_attribute('href')
-        urls.append(book_url)
-
-    for url in urls:
-        book_information = visit_book_page(url, driver)
-        save_book_information(book_information, category_name)  # Save the information in the database
-    
-    return urls
-    
-    
-
-
-def visit_book_page(link: str, driver):
-    driver.get(link)
+
+def read_book(url: str, driver) -> ScrapedBook:
+    with profile_stage("book_page"):
+        return visit_book_page(url, driver)
+
+
+def visit_category_page(link: str, batch: ScrapedBookBatch, pool: DriverPool,
+                        executor: ThreadPoolExecutor = None) -> int:
+    """
+    Read the books of every page of a category into batch, saving it every
+    SAVE_BATCH_SIZE books, and return how many there were
+    """
+    total = 0
+    while link:
+        category_name, urls, link = pool.run(executor, read_category_listing, link)
+
+        if executor is None:
+            driver = pool.get()
+            books = (read_book(url, driver) for url in urls)
+        else:
+            # Each thread uses its own browser; map() yields in page order and re-raises the first error
+            books = executor.map(lambda url: read_book(url, pool.get()), urls)
+        for book in books:
+            batch.append(book, category_name)
+        total += len(urls)
+
+        if len(batch) >= SAVE_BATCH_SIZE:
+            flush_batch(batch)
+    return total
+
+
+def visit_book_page(link: str, driver) -> ScrapedBook:
+    fetch_page(driver, link)
 
     wait = WebDriverWait(driver, 10)
 
@@ -98,10 +233,8 @@ def visit_book_page(link: str, driver):
     book_title = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="content_inner"]/article/div[1]/div[2]/h1'))).text
 
     book_price = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="content_inner"]/article/table/tbody/tr[3]/td'))).text
-    book_price = book_price[1: len(book_price) - 1]
 
     book_stock = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="content_inner"]/article/table/tbody/tr[6]/td'))).text
-    book_stock = ''.join(filter(str.isdigit, book_stock))
 
     book_image_url = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="product_gallery"]/div/div/div/img'))).get_attribute('src')
 
@@ -114,25 +247,28 @@ def visit_book_page(link: str, driver):
         book_rating = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="content_inner"]/article/div[1]/div[2]/p[3]'))).get_attribute('class')
     except:
         book_rating = "star-rating Zero"
-    if 'One' in book_rating:
-        book_rating = 1
-    elif 'Two' in book_rating:
-        book_rating = 2
-    elif 'Three' in book_rating:
-        book_rating = 3
-    elif 'Four' in book_rating:
-        book_rating = 4
-    elif 'Five' in book_rating:
-        book_rating = 5
-    else:
-        book_rating = 0
-
-    return {
-        'upc': book_upc,
-        'title': book_title,
-        'price': book_price,
-        'stock': book_stock,
-        'image_url': book_image_url,
-        'description': book_description,
-        'rating': book_rating
-    }
\ No newline at end of file
+
+    return ScrapedBook(
+        upc=book_upc,
+        title=book_title,
+        price=parse_price(book_price),
+        stock=parse_stock(book_stock),
+        image_url=book_image_url,
+        description=book_description,
+        rating=parse_rating(book_rating)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraper de books.toscrape.com")
+    parser.add_argument("--driver-path", default='/usr/bin/chromedriver')
+    parser.add_argument("--url", default=PAGE_URL, help="Portada del sitio (por ejemplo el espejo local)")
+    parser.add_argument("--driver", choices=[t.value for t in WebDriverType], default=WebDriverType.CHROME.value)
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada etapa (WebDriver, páginas, escrituras) y contar las consultas SQL")
+    args = parser.parse_args()
+
+    with profiled("scraper", args.profile):
+        perform_scraping(args.driver_path, WebDriverType(args.driver), args.url)
+    if args.profile:
+        print(json.dumps(GOVERNOR.stats(), indent=2))
@@ -0,0 +1,251 @@
+"""
+Servicio HTTP asíncrono de análisis.
+
+Expone cada consulta de consultas.CONSULTAS y la navegación de libros por
+categoría, rango de precio y estado de stock, sobre un pool de conexiones
+asyncpg. Las respuestas llevan un ETag derivado de la versión de datos del
+ETL: un cliente que envía If-None-Match recibe 304 sin que se ejecute la
+consulta mientras no haya una carga nueva.
+
+  GET /analisis                              lista de análisis
+  GET /analisis/{nombre}                     resultado de un análisis
+  GET /analisis/ranking_diferencias?k=10&direccion=caros&categoria=Poetry
+  GET /libros?categoria=Poetry&rango_precio=Budget&estado_stock=In%20Stock&limite=50&despues=120
+
+Uso:
+  python servicio_analisis.py --puerto 8080
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+from sqlalchemy import select
+
+from analisis_libros import ejecutar_consulta_async
+from cache_analisis import CacheAnalisis, _SIN_RESULTADO
+from consultas import CONSULTAS, DIRECCIONES
+from database_async import analytical_async_engine
+from etl import current_data_version
+from models_analytical import FactBook, DimCategory, DimStock, DimPrice
+
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+# Segundos que se reutiliza la versión de datos leída antes de volver a consultarla
+TTL_VERSION = float(os.getenv("SERVICIO_TTL_VERSION", "1.0"))
+
+_json = functools.partial(json.dumps, ensure_ascii=False, default=str)
+
+
+class ErrorParametros(ValueError):
+    pass
+
+
+class VersionDatos:
+    """Versión de datos leída como mucho una vez por TTL, aunque haya muchas peticiones a la vez"""
+
+    def __init__(self, engine, ttl: float = TTL_VERSION):
+        self.engine = engine
+        self.ttl = ttl
+        self.valor: Optional[int] = None
+        self.leida_en = 0.0
+        self._lock = asyncio.Lock()
+
+    async def obtener(self) -> int:
+        if self.valor is not None and time.monotonic() - self.leida_en < self.ttl:
+            return self.valor
+        async with self._lock:
+            if self.valor is None or time.monotonic() - self.leida_en >= self.ttl:
+                async with self.engine.connect() as conn:
+                    self.valor = await conn.run_sync(current_data_version)
+                self.leida_en = time.monotonic()
+        return self.valor
+
+
+def _entero(request, nombre: str, defecto: Optional[int], minimo: int = 0,
+            maximo: Optional[int] = None) -> Optional[int]:
+    valor = request.query.get(nombre)
+    if valor is None:
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorParametros(f"'{nombre}' debe ser un entero")
+    if numero < minimo or (maximo is not None and numero > maximo):
+        raise ErrorParametros(f"'{nombre}' debe estar entre {minimo} y {maximo if maximo is not None else '∞'}")
+    return numero
+
+
+def _argumentos_ranking(request) -> tuple:
+    direccion = request.query.get("direccion", "baratos")
+    if direccion not in DIRECCIONES:
+        raise ErrorParametros(f"'direccion' debe ser {' o '.join(DIRECCIONES)}")
+    categorias = tuple(sorted(request.query.getall("categoria", []))) or None
+    return (_entero(request, "k", 5, 1, LIMITE_MAXIMO), direccion, categorias)
+
+
+# Análisis que aceptan parámetros: nombre -> función que los lee de la petición
+ARGUMENTOS = {
+    "ranking_diferencias": _argumentos_ranking,
+}
+
+
+def _etag(version: int) -> str:
+    return f'"v{version}"'
+
+
+def _respuesta(request, cuerpo, version: int) -> web.Response:
+    respuesta = web.json_response(cuerpo, dumps=_json)
+    respuesta.headers["ETag"] = _etag(version)
+    # El cliente puede guardar la respuesta pero debe revalidarla con If-None-Match
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
+async def _version_o_304(request):
+    version = await request.app["version"].obtener()
+    if_none_match = request.headers.get("If-None-Match", "")
+    if _etag(version) in [etiqueta.strip() for etiqueta in if_none_match.split(",")]:
+        raise web.HTTPNotModified(headers={"ETag": _etag(version), "Cache-Control": "no-cache"})
+    return version
+
+
+async def listar_analisis(request):
+    version = await _version_o_304(request)
+    return _respuesta(request, {"analisis": sorted(CONSULTAS)}, version)
+
+
+async def obtener_analisis(request):
+    nombre = request.match_info["nombre"]
+    if nombre not in CONSULTAS:
+        raise web.HTTPNotFound(text=_json({"error": f"Análisis desconocido: {nombre}"}),
+                               content_type="application/json")
+    argumentos = ARGUMENTOS[nombre](request) if nombre in ARGUMENTOS else ()
+    version = await _version_o_304(request)
+
+    resultado = await _cacheado(
+        request.app, ("analisis", nombre, argumentos, version),
+        lambda: ejecutar_consulta_async(nombre, *argumentos, engine=request.app["engine"])
+    )
+    return _respuesta(request, {"analisis": nombre, "version_datos": version, "resultado": resultado}, version)
+
+
+async def _cacheado(app, clave: tuple, calcular: Callable[[], Awaitable]):
+    """
+    Resultado cacheado por clave (que incluye la versión de datos). Las
+    peticiones simultáneas de una clave que falta esperan una sola consulta.
+    """
+    cache: CacheAnalisis = app["cache"]
+    resultado = cache.obtener(clave)
+    if resultado is not _SIN_RESULTADO:
+        return resultado
+
+    en_curso: Dict[tuple, asyncio.Future] = app["en_curso"]
+    if clave not in en_curso:
+        async def calcular_y_guardar():
+            try:
+                valor = await calcular()
+                cache.guardar(clave, valor)
+                return valor
+            finally:
+                en_curso.pop(clave, None)
+        en_curso[clave] = asyncio.ensure_future(calcular_y_guardar())
+    # shield: si un cliente se desconecta, la consulta sigue para los demás
+    return await asyncio.shield(en_curso[clave])
+
+
+def sentencia_libros(categoria=None, rango_precio=None, estado_stock=None,
+                     despues: int = 0, limite: int = LIMITE_POR_DEFECTO):
+    """Página de libros por clave (id > despues), sin OFFSET"""
+    sentencia = (
+        select(
+            FactBook.id.label("libro_id"),
+            FactBook.upc.label("upc"),
+            FactBook.title.label("titulo"),
+            DimCategory.name.label("categoria"),
+            DimPrice.price_before_tax.label("precio"),
+            DimPrice.price_range.label("rango_precio"),
+            DimStock.quantity.label("stock"),
+            DimStock.stock_status.label("estado_stock"),
+        )
+        .join(DimCategory, FactBook.category_id == DimCategory.id)
+        .join(DimPrice, FactBook.price_id == DimPrice.id)
+        .outerjoin(DimStock, FactBook.stock_id == DimStock.id)
+        .where(FactBook.id > despues)
+        .order_by(FactBook.id)
+        .limit(limite)
+    )
+    if categoria:
+        sentencia = sentencia.where(DimCategory.name == categoria)
+    if rango_precio:
+        sentencia = sentencia.where(DimPrice.price_range == rango_precio)
+    if estado_stock:
+        sentencia = sentencia.where(DimStock.stock_status == estado_stock)
+    return sentencia
+
+
+async def _pagina_libros(engine, filtros: Dict, despues: int, limite: int) -> List[Dict]:
+    async with engine.connect() as conn:
+        resultado = await conn.execute(sentencia_libros(**filtros, despues=despues, limite=limite))
+        return [dict(fila) for fila in resultado.mappings()]
+
+
+async def listar_libros(request):
+    filtros = {
+        campo: request.query.get(campo)
+        for campo in ("categoria", "rango_precio", "estado_stock")
+    }
+    limite = _entero(request, "limite", LIMITE_POR_DEFECTO, 1, LIMITE_MAXIMO)
+    despues = _entero(request, "despues", 0)
+    version = await _version_o_304(request)
+
+    # Dentro de una misma versión de datos una página no cambia, así que también se cachea
+    libros = await _cacheado(
+        request.app, ("libros", tuple(filtros.items()), despues, limite, version),
+        lambda: _pagina_libros(request.app["engine"], filtros, despues, limite)
+    )
+
+    siguiente = libros[-1]["libro_id"] if len(libros) == limite else None
+    respuesta = _respuesta(request, {"libros": libros, "siguiente": siguiente}, version)
+    if siguiente is not None:
+        url = request.rel_url.update_query({"despues": siguiente})
+        respuesta.headers["Link"] = f'<{url}>; rel="next"'
+    return respuesta
+
+
+@web.middleware
+async def errores_json(request, handler):
+    try:
+        return await handler(request)
+    except ErrorParametros as e:
+        return web.json_response({"error": str(e)}, status=400, dumps=_json)
+
+
+async def _cerrar_engine(app):
+    await app["engine"].dispose()
+
+
+def crear_app(engine=analytical_async_engine) -> web.Application:
+    app = web.Application(middlewares=[errores_json])
+    app["engine"] = engine
+    app["version"] = VersionDatos(engine)
+    app["cache"] = CacheAnalisis(capacidad=int(os.getenv("SERVICIO_CACHE_SIZE", "256")))
+    app["en_curso"] = {}
+    app.router.add_get("/analisis", listar_analisis)
+    app.router.add_get("/analisis/{nombre}", obtener_analisis)
+    app.router.add_get("/libros", listar_libros)
+    app.on_cleanup.append(_cerrar_engine)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de análisis de libros")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(crear_app(), host=args.host, port=args.puerto)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+Price and stock history of the catalogue.
+
+Loads keep only the current state of each book in fact_books, so every load
+also appends the state it saw to fact_book_snapshot: one row per book per
+load, stamped with the run's start time. The table is range-partitioned by
+month of snapshot_at and indexed with BRIN on snapshot_at, so a query bounded
+by a time window only opens the partitions (and block ranges) of that
+window. The helpers below always filter with constant bounds on
+snapshot_at for that reason; date_trunc or casts on the column would hide
+the bounds from the planner.
+
+Usage:
+  python snapshots.py revenue --start 2026-01-01 --end 2026-07-01 --bucket month --by-category
+  python snapshots.py history <upc> --start 2026-01-01
+  python snapshots.py movements --start 2026-06-01 --limit 20
+  python snapshots.py partitions
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import DateTime, and_, case, func, insert, literal, select, text
+
+from models_analytical import FactBookSnapshot
+
+
+# Snapshot rows sent per INSERT when writing transformed books
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "1000"))
+
+# Columns of a snapshot besides snapshot_at, in the order write_snapshot_from expects
+SNAPSHOT_COLUMNS = [
+    "upc", "title", "category_name", "price_before_tax", "price_after_tax", "price_range",
+    "tax_rate", "stock_quantity", "stock_status", "score",
+]
+
+BUCKETS = ("hour", "day", "week", "month")
+
+snapshot = FactBookSnapshot.__table__
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"fact_book_snapshot_y{month.year}m{month.month:02d}"
+
+
+def ensure_snapshot_partitions(conn, start: datetime, end: Optional[datetime] = None):
+    """Create fact_book_snapshot (if needed) and its monthly partitions covering start..end"""
+    snapshot.create(conn, checkfirst=True)
+    month = month_start(start)
+    while month <= (end or start):
+        name = partition_name(month)
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": f"public.{name}"}).scalar() is None:
+            # Two loads starting in a new month must not race on the same partition
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('fact_book_snapshot_partitions'))"))
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS public."{name}" PARTITION OF public.fact_book_snapshot '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+        month = next_month(month)
+
+
+def snapshot_values(row: dict, tax_rate: float) -> dict:
+    """A book transformed by etl.transform_book as a fact_book_snapshot row, without snapshot_at"""
+    return {
+        "upc": row["upc"],
+        "title": row["title"],
+        "category_name": row["category"]["name"] if row["category"] else None,
+        "price_before_tax": row["price"]["price_before_tax"],
+        "price_after_tax": row["price"]["price_after_tax"],
+        "price_range": row["price"]["price_range"],
+        "tax_rate": tax_rate,
+        "stock_quantity": row["stock"]["quantity"] if row["stock"] else None,
+        "stock_status": row["stock"]["stock_status"] if row["stock"] else None,
+        "score": row["score"]["score"] if row["score"] else None,
+    }
+
+
+def write_snapshot(conn, snapshot_at: datetime, rows: List[dict], tax_rate: float) -> int:
+    """
+    Append the transformed books of a load to fact_book_snapshot, in
+    multi-row inserts of SNAPSHOT_BATCH_SIZE. Runs in the caller's
+    transaction. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    ensure_snapshot_partitions(conn, snapshot_at)
+    for start in range(0, len(rows), SNAPSHOT_BATCH_SIZE):
+        conn.execute(insert(snapshot), [
+            {"snapshot_at": snapshot_at, **snapshot_values(row, tax_rate)}
+            for row in rows[start:start + SNAPSHOT_BATCH_SIZE]
+        ])
+    return len(rows)
+
+
+def write_snapshot_from(conn, snapshot_at: datetime, query) -> int:
+    """
+    Append the rows of query (selecting SNAPSHOT_COLUMNS in order) to
+    fact_book_snapshot with a single INSERT ... SELECT. Returns the number
+    of rows written.
+    """
+    ensure_snapshot_partitions(conn, snapshot_at)
+    source = query.subquery()
+    return conn.execute(insert(snapshot).from_select(
+        ["snapshot_at", *SNAPSHOT_COLUMNS],
+        select(literal(snapshot_at, DateTime).label("snapshot_at"), *source.c)
+    )).rowcount
+
+
+def in_window(start: datetime, end: datetime):
+    """snapshot_at in [start, end); constant bounds, so the planner prunes partitions"""
+    return and_(snapshot.c.snapshot_at >= start, snapshot.c.snapshot_at < end)
+
+
+def revenue_over_time(conn, start: datetime, end: datetime, bucket: str = "day",
+                      by_category: bool = False, categories: Optional[Iterable[str]] = None):
+    """
+    Potential revenue (price before tax times stock) per time bucket, and
+    per category with by_category. Each book counts once per bucket, with
+    the last state seen in it.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    bucket_start = func.date_trunc(bucket, snapshot.c.snapshot_at)
+    latest = (
+        select(
+            bucket_start.label("bucket"),
+            snapshot.c.category_name,
+            snapshot.c.price_before_tax,
+            snapshot.c.stock_quantity,
+            func.row_number().over(
+                partition_by=[bucket_start, snapshot.c.upc],
+                order_by=snapshot.c.snapshot_at.desc()
+            ).label("position"),
+        )
+        .where(in_window(start, end))
+    )
+    if categories is not None:
+        latest = latest.where(snapshot.c.category_name.in_(list(categories)))
+    latest = latest.subquery()
+
+    groups = [latest.c.bucket] + ([latest.c.category_name] if by_category else [])
+    return conn.execute(
+        select(
+            *groups,
+            func.count().label("books"),
+            func.avg(latest.c.price_before_tax).label("avg_price"),
+            func.coalesce(func.sum(latest.c.stock_quantity), 0).label("total_stock"),
+            func.coalesce(func.sum(latest.c.price_before_tax * latest.c.stock_quantity), 0)
+            .label("potential_revenue"),
+        )
+        .where(latest.c.position == 1)
+        .group_by(*groups)
+        .order_by(*groups)
+    ).all()
+
+
+def price_history(conn, upc: str, start: datetime, end: datetime):
+    """Every snapshot of one book in the window, oldest first"""
+    return conn.execute(
+        select(
+            snapshot.c.snapshot_at, snapshot.c.price_before_tax, snapshot.c.price_after_tax,
+            snapshot.c.stock_quantity, snapshot.c.stock_status, snapshot.c.score,
+        )
+        .where(snapshot.c.upc == upc, in_window(start, end))
+        .order_by(snapshot.c.snapshot_at)
+    ).all()
+
+
+def stock_movements(conn, start: datetime, end: datetime, limit: int = 20):
+    """
+    Books whose price or stock changed between their first and last
+    snapshot of the window, largest stock change first
+    """
+    ranked = (
+        select(
+            snapshot.c.upc,
+            snapshot.c.title,
+            snapshot.c.price_before_tax,
+            snapshot.c.stock_quantity,
+            func.row_number().over(
+                partition_by=snapshot.c.upc, order_by=snapshot.c.snapshot_at
+            ).label("first"),
+            func.row_number().over(
+                partition_by=snapshot.c.upc, order_by=snapshot.c.snapshot_at.desc()
+            ).label("last"),
+        )
+        .where(in_window(start, end))
+        .subquery()
+    )
+
+    def at(position, value):
+        return func.max(case((position == 1, value)))
+
+    first_stock = at(ranked.c.first, ranked.c.stock_quantity)
+    last_stock = at(ranked.c.last, ranked.c.stock_quantity)
+    first_price = at(ranked.c.first, ranked.c.price_before_tax)
+    last_price = at(ranked.c.last, ranked.c.price_before_tax)
+    stock_change = func.coalesce(last_stock, 0) - func.coalesce(first_stock, 0)
+    return conn.execute(
+        select(
+            ranked.c.upc,
+            ranked.c.title,
+            first_stock.label("first_stock"),
+            last_stock.label("last_stock"),
+            first_price.label("first_price"),
+            last_price.label("last_price"),
+        )
+        .where((ranked.c.first == 1) | (ranked.c.last == 1))
+        .group_by(ranked.c.upc, ranked.c.title)
+        .having(
+            first_stock.is_distinct_from(last_stock) | first_price.is_distinct_from(last_price)
+        )
+        .order_by(func.abs(stock_change).desc(), ranked.c.upc)
+        .limit(limit)
+    ).all()
+
+
+def snapshot_partitions(conn):
+    """Monthly partitions of fact_book_snapshot with their bounds and estimated rows"""
+    return conn.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint "
+        "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass('public.fact_book_snapshot') "
+        "ORDER BY child.relname"
+    )).all()
+
+
+def _parse_moment(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Price and stock history of the catalogue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    window_parser = argparse.ArgumentParser(add_help=False)
+    window_parser.add_argument("--start", type=_parse_moment,
+                               help="Window start (ISO date or datetime, default 30 days before --end)")
+    window_parser.add_argument("--end", type=_parse_moment,
+                               help="Window end, exclusive (default tomorrow)")
+
+    revenue_parser = commands.add_parser("revenue", parents=[window_parser],
+                                         help="Potential revenue per time bucket")
+    revenue_parser.add_argument("--bucket", choices=BUCKETS, default="day")
+    revenue_parser.add_argument("--by-category", action="store_true")
+    revenue_parser.add_argument("--category", action="append", dest="categories", metavar="NAME",
+                                help="Only this category (repeatable)")
+
+    history_parser = commands.add_parser("history", parents=[window_parser],
+                                         help="Snapshots of one book")
+    history_parser.add_argument("upc")
+
+    movements_parser = commands.add_parser("movements", parents=[window_parser],
+                                           help="Books whose price or stock changed in the window")
+    movements_parser.add_argument("--limit", type=int, default=20)
+
+    commands.add_parser("partitions", help="List the monthly partitions")
+    args = parser.parse_args()
+
+    from etl import analytical_engine
+
+    if args.command != "partitions":
+        end = args.end or datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        start = args.start or end - timedelta(days=30)
+
+    with analytical_engine.connect() as conn:
+        if args.command == "revenue":
+            for row in revenue_over_time(conn, start, end, args.bucket, args.by_category, args.categories):
+                label = f"{row.bucket:%Y-%m-%d %H:%M}" + (f"  {row.category_name}" if args.by_category else "")
+                print(f"{label:<45} {row.books:>6} books  {row.total_stock:>8} units  "
+                      f"revenue {row.potential_revenue:>12.2f}")
+        elif args.command == "history":
+            for row in price_history(conn, args.upc, start, end):
+                print(f"{row.snapshot_at:%Y-%m-%d %H:%M:%S}  price {row.price_before_tax:>8.2f}  "
+                      f"stock {row.stock_quantity}  ({row.stock_status})")
+        elif args.command == "movements":
+            for row in stock_movements(conn, start, end, args.limit):
+                print(f"{row.upc}  stock {row.first_stock} -> {row.last_stock}  "
+                      f"price {row.first_price:.2f} -> {row.last_price:.2f}  {row.title[:50]}")
+        elif args.command == "partitions":
+            for name, bounds, rows in snapshot_partitions(conn):
+                print(f"{name:<32} {bounds}  " + (f"~{rows} rows" if rows >= 0 else "not analyzed yet"))
@@ -0,0 +1,147 @@
+"""
+Verificación de planes de ejecución de las consultas de análisis.
+
+Ejecuta EXPLAIN (ANALYZE, BUFFERS) de cada consulta de consultas.CONSULTAS
+sobre un conjunto de datos escalado con datos_sinteticos.py y falla (código
+de salida 1) cuando:
+  - el plan recorre secuencialmente una tabla grande en una consulta que
+    debería resolverse con índices, o
+  - la ejecución supera el presupuesto de latencia de la consulta.
+
+Los análisis que por definición leen todos los hechos (ventanas sobre todo
+el catálogo) sí pueden recorrer fact_books; para ellos solo se controla la
+latencia.
+
+Uso:
+  python verificar_planes.py                      # 100000 libros sintéticos
+  python verificar_planes.py --libros 1000000 --escala-presupuesto 10
+  python verificar_planes.py --sin-generar        # sobre los datos actuales
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from consultas import CONSULTAS
+from datos_sinteticos import generar_hechos, limpiar_hechos
+from etl import analytical_engine
+
+
+# Un recorrido secuencial que devuelve más filas que esto se considera de tabla grande
+UMBRAL_FILAS = 1000
+
+
+class Expectativa(NamedTuple):
+    presupuesto_ms: float
+    lectura_completa: bool = False
+
+
+# Presupuestos calibrados para 100k hechos
+EXPECTATIVAS: Dict[str, Expectativa] = {
+    "contar_categorias": Expectativa(20),
+    "libros_por_categoria": Expectativa(20),
+    "libro_mas_caro": Expectativa(20),
+    "libros_en_multiples_categorias": Expectativa(1000, lectura_completa=True),
+    "libro_mas_barato_por_categoria": Expectativa(1000, lectura_completa=True),
+    "diferencia_vs_promedio_categoria": Expectativa(2000, lectura_completa=True),
+    "ranking_diferencias": Expectativa(500, lectura_completa=True),
+    "libro_mayor_ingreso_por_categoria": Expectativa(1000, lectura_completa=True),
+    "resumen_por_categoria": Expectativa(20),
+    "resumen_por_rango_y_stock": Expectativa(20),
+}
+
+EXPECTATIVA_POR_DEFECTO = Expectativa(100)
+
+
+def _nodos(plan: Dict) -> Iterator[Dict]:
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def explicar(conn, sentencia) -> Dict:
+    """Plan de EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) de una sentencia"""
+    sql = sentencia.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    resultado = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar_one()
+    if isinstance(resultado, str):
+        resultado = json.loads(resultado)
+    return resultado[0]
+
+
+def verificar_consulta(conn, nombre: str, escala_presupuesto: float = 1.0) -> Dict:
+    expectativa = EXPECTATIVAS.get(nombre, EXPECTATIVA_POR_DEFECTO)
+    explicacion = explicar(conn, CONSULTAS[nombre].sentencia())
+    plan = explicacion["Plan"]
+
+    recorridos = [
+        {"tabla": nodo["Relation Name"], "filas": nodo["Actual Rows"] * nodo["Actual Loops"]}
+        for nodo in _nodos(plan) if nodo["Node Type"] == "Seq Scan"
+    ]
+    presupuesto = expectativa.presupuesto_ms * escala_presupuesto
+    tiempo = explicacion["Execution Time"]
+
+    fallos = []
+    if not expectativa.lectura_completa:
+        for recorrido in recorridos:
+            if recorrido["filas"] > UMBRAL_FILAS:
+                fallos.append(f"recorrido secuencial de {recorrido['tabla']} ({recorrido['filas']} filas)")
+    if tiempo > presupuesto:
+        fallos.append(f"{tiempo:.1f} ms supera el presupuesto de {presupuesto:.0f} ms")
+
+    return {
+        "consulta": nombre,
+        "tiempo_ms": tiempo,
+        "presupuesto_ms": presupuesto,
+        "recorridos_secuenciales": recorridos,
+        "bloques_leidos": plan.get("Shared Read Blocks", 0),
+        "bloques_en_cache": plan.get("Shared Hit Blocks", 0),
+        "bloques_temporales": plan.get("Temp Written Blocks", 0),
+        "fallos": fallos,
+    }
+
+
+def verificar_planes(escala_presupuesto: float = 1.0) -> List[Dict]:
+    with analytical_engine.connect() as conn:
+        return [verificar_consulta(conn, nombre, escala_presupuesto) for nombre in CONSULTAS]
+
+
+def _imprimir(resultados: List[Dict]):
+    for resultado in resultados:
+        estado = "FALLA" if resultado["fallos"] else "OK"
+        print(
+            f"{estado:5} {resultado['consulta']:36} {resultado['tiempo_ms']:9.1f} ms "
+            f"(presupuesto {resultado['presupuesto_ms']:.0f} ms, "
+            f"bloques temporales {resultado['bloques_temporales']})"
+        )
+        for fallo in resultado["fallos"]:
+            print(f"      - {fallo}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica los planes de las consultas de análisis")
+    parser.add_argument("--libros", type=int, default=100_000,
+                        help="Libros sintéticos a generar antes de verificar")
+    parser.add_argument("--sin-generar", action="store_true",
+                        help="Verifica sobre los datos actuales sin generar libros sintéticos")
+    parser.add_argument("--escala-presupuesto", type=float, default=1.0,
+                        help="Multiplica los presupuestos de latencia (p. ej. 10 para 1M de hechos)")
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args()
+
+    try:
+        if not args.sin_generar:
+            limpiar_hechos()
+            generar_hechos(args.libros)
+        resultados = verificar_planes(args.escala_presupuesto)
+    finally:
+        if not args.sin_generar:
+            limpiar_hechos()
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    else:
+        _imprimir(resultados)
+    sys.exit(1 if any(r["fallos"] for r in resultados) else 0)